@@ -0,0 +1,39 @@
+"""
+Measure the cost of routing keys to servers.
+
+Run it with `python benchmarks/routing.py`. uhashring is measured too when installed.
+"""
+import timeit
+
+from bmemcached.client.routing import HASHERS
+
+SERVERS = ['10.0.0.{}:11211'.format(i) for i in range(1, 9)]
+KEYS = ['user:{}:profile'.format(i) for i in range(10000)]
+REPEAT = 5
+
+
+def report(name, fn):
+    seconds = min(timeit.repeat(fn, number=1, repeat=REPEAT))
+    print('{:<36} {:8.3f} us/key'.format(name, seconds / len(KEYS) * 1e6))
+
+
+def main():
+    for name, hasher in sorted(HASHERS.items()):
+        table = hasher(SERVERS)
+        report('{}.get_node'.format(hasher.__name__), lambda: [table.get_node(key) for key in KEYS])
+        report('{}.get_nodes'.format(hasher.__name__), lambda: table.get_nodes(KEYS))
+
+        memoized = hasher(SERVERS, cache_size=len(KEYS))
+        memoized.get_nodes(KEYS)
+        report('{}.get_node (memoized)'.format(hasher.__name__), lambda: [memoized.get_node(key) for key in KEYS])
+
+    try:
+        from uhashring import HashRing
+    except ImportError:
+        return
+    ring = HashRing(SERVERS)
+    report('uhashring.HashRing.get_node', lambda: [ring.get_node(key) for key in KEYS])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+import binascii
+from hashlib import md5
+import os
+import struct
+import zlib
+
+from bmemcached.utils import str_to_bytes
+
+__all__ = ('ChunkManifest', )
+
+
+class ChunkManifest(object):
+    """
+    Describes a serialized value that was split over several chunk keys.
+
+    The manifest is stored under the original key, flagged as `chunked`, while the chunks
+    are stored as binary values under keys derived from the original key and a random
+    token, so a value being overwritten never mixes chunks of two different versions.
+    Keys too long to be suffixed within memcached's limit are replaced by their md5.
+
+    :param flags: Flags of the serialized value.
+    :type flags: int
+    :param length: Length in bytes of the serialized value.
+    :type length: int
+    :param count: Number of chunks.
+    :type count: int
+    :param checksum: CRC32 of the serialized value.
+    :type checksum: int
+    :param token: Random token used to build the chunk keys.
+    :type token: bytes
+    """
+    STRUCT = struct.Struct('!LQLL8s')
+    MAX_KEY_LENGTH = 250
+
+    def __init__(self, flags, length, count, checksum, token):
+        self.flags = flags
+        self.length = length
+        self.count = count
+        self.checksum = checksum
+        self.token = token
+
+    def __repr__(self):
+        return '<ChunkManifest length={} count={}>'.format(self.length, self.count)
+
+    @classmethod
+    def split(cls, flags, value, chunk_size):
+        """
+        Split a serialized value into chunks.
+
+        :param flags: Flags of the serialized value.
+        :type flags: int
+        :param value: Serialized value.
+        :type value: bytes
+        :param chunk_size: Maximum size of each chunk.
+        :type chunk_size: int
+        :return: A (manifest, chunks) tuple where chunks is a list of bytes.
+        :rtype: tuple
+        """
+        view = memoryview(value)
+        chunks = [view[i:i + chunk_size].tobytes() for i in range(0, len(value), chunk_size)]
+        manifest = cls(flags, len(value), len(chunks), zlib.crc32(value) & 0xffffffff, os.urandom(8))
+        return manifest, chunks
+
+    def chunk_keys(self, key):
+        """
+        Return the keys where the chunks of this manifest are stored.
+
+        :param key: Key the manifest is stored under.
+        :type key: six.string_types
+        :return: A list of keys, in chunk order.
+        :rtype: list
+        """
+        key = str_to_bytes(key)
+        suffix = b':chunk:' + binascii.hexlify(self.token) + b':'
+        if len(key) + len(suffix) + len(str(self.count - 1)) > self.MAX_KEY_LENGTH:
+            key = md5(key).hexdigest().encode()
+        prefix = key + suffix
+        return [prefix + str(i).encode() for i in range(self.count)]
+
+    def join(self, chunks):
+        """
+        Reassemble and validate the serialized value.
+
+        :param chunks: The chunks, in order.
+        :type chunks: list
+        :return: The serialized value or None if it is incomplete or corrupted.
+        :rtype: bytes
+        """
+        value = b''.join(chunks)
+        if len(value) != self.length or zlib.crc32(value) & 0xffffffff != self.checksum:
+            return None
+        return value
+
+    def pack(self):
+        return self.STRUCT.pack(self.flags, self.length, self.count, self.checksum, self.token)
+
+    @classmethod
+    def unpack(cls, value):
+        return cls(*cls.STRUCT.unpack(value))
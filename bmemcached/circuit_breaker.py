@@ -0,0 +1,200 @@
+import random
+import threading
+import time
+
+__all__ = ('BreakerState', 'CircuitBreaker', 'shared_breaker')
+
+
+class BreakerState(object):
+    """
+    What the breakers of a server share: whether connections to it are refused, since
+    when and after how many consecutive failures.  Each breaker applies its own delays to it.
+    """
+    def __init__(self):
+        self.state = CircuitBreaker.CLOSED
+        self.failures = 0
+        # When the state last changed, by the clock of the breaker changing it.
+        self.since = None
+        # Whether the state is open after a failed attempt, rather than a lost connection.
+        self.backoff = False
+        # Random fraction of the jitter taken off the delay after the last failure.
+        self.draw = 0.0
+        self.lock = threading.Lock()
+
+
+class CircuitBreaker(object):
+    """
+    Decides when connections to a server that refuses them may be attempted again.
+
+    The breaker starts `closed`, letting every connection attempt through.  A failed
+    attempt opens it for `base_delay` seconds, doubled by `multiplier` on every following
+    failure up to `max_delay`, and shortened by up to `jitter` of itself so clients of a
+    server that went down together don't come back in lockstep.  Once the delay elapsed
+    the breaker is `half-open`: a single attempt goes through while the others are
+    refused, closing the breaker and resetting the delay if it succeeds.
+
+    Losing an established connection, reported with `record_error`, moves the breaker
+    straight to half-open, so only one reconnection is attempted until it is known whether
+    the server is still there.  A probe that never reports back is given up on after
+    `max_delay`.
+
+    A `base_delay` of 0 never refuses attempts.
+
+    Breakers given the same `shared` state see each other's failures and successes, but
+    each one waits for its own delays.
+
+    :param base_delay: Seconds refused after the first failure.
+    :type base_delay: float
+    :param max_delay: Longest delay, in seconds.
+    :type max_delay: float
+    :param multiplier: Growth of the delay on each consecutive failure.
+    :type multiplier: float
+    :param jitter: Fraction of a delay randomly taken off, between 0 and 1.
+    :type jitter: float
+    :param clock: Callable returning the time in seconds; must never go backwards.
+    :type clock: callable
+    :param shared: State shared with other breakers, a new one if None.
+    :type shared: BreakerState
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, base_delay=5, max_delay=60, multiplier=2, jitter=0.2, clock=time.monotonic, shared=None):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+        self.jitter = jitter
+        self.clock = clock
+        self.shared = BreakerState() if shared is None else shared
+
+    @property
+    def state(self):
+        return self.shared.state
+
+    @property
+    def failures(self):
+        return self.shared.failures
+
+    @property
+    def retry_at(self):
+        """
+        Time from which an attempt is let through with this breaker's delays, None if closed.
+        """
+        shared = self.shared
+        if shared.state == self.CLOSED:
+            return None
+        if shared.state == self.HALF_OPEN:
+            return shared.since + self.max_delay
+        if not shared.backoff:
+            return shared.since
+        delay = self.delay(shared.failures)
+        return shared.since + delay - delay * self.jitter * shared.draw
+
+    def delay(self, failures):
+        """
+        Return the delay after a number of consecutive failures, before jitter.
+
+        :param failures: Consecutive failures, at least 1.
+        :type failures: int
+        :rtype: float
+        """
+        if failures > 64:
+            return self.max_delay
+        return min(self.base_delay * self.multiplier ** (failures - 1), self.max_delay)
+
+    def allow(self):
+        """
+        Return whether a connection attempt may be made now.
+
+        When the delay elapsed, the first caller is let through as the half-open probe and
+        must report its outcome with `record_success` or `record_failure`.
+
+        :rtype: bool
+        """
+        shared = self.shared
+        if shared.state == self.CLOSED or not self.base_delay:
+            return True
+        with shared.lock:
+            if shared.state == self.CLOSED:
+                return True
+            now = self.clock()
+            if now < self.retry_at:
+                return False
+            shared.state = self.HALF_OPEN
+            shared.since = now
+            return True
+
+    def record_success(self):
+        """
+        Record a successful connection attempt, closing the breaker.
+        """
+        shared = self.shared
+        if shared.state == self.CLOSED and not shared.failures:
+            return
+        with shared.lock:
+            shared.state = self.CLOSED
+            shared.failures = 0
+            shared.since = None
+
+    def record_error(self):
+        """
+        Record the loss of an established connection, letting a single reconnection through.
+        """
+        shared = self.shared
+        if shared.state != self.CLOSED:
+            return
+        with shared.lock:
+            if shared.state == self.CLOSED:
+                self._open(backoff=False)
+
+    def release(self):
+        """
+        Give up a half-open attempt which ended without telling whether the server is up.
+        """
+        with self.shared.lock:
+            if self.shared.state == self.HALF_OPEN:
+                self._open(backoff=False)
+
+    def record_failure(self):
+        """
+        Record a failed connection attempt, opening the breaker for a longer delay.
+        """
+        with self.shared.lock:
+            self.shared.failures += 1
+            self.shared.draw = random.random()
+            self._open(backoff=True)
+
+    def _open(self, backoff):
+        self.shared.state = self.OPEN
+        self.shared.since = self.clock()
+        self.shared.backoff = backoff
+
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+def shared_breaker(server, base_delay=None):
+    """
+    Return a breaker with base_delay sharing the process-wide state of a server.
+
+    Protocol instances are thread-local, so sharing their breaker's state is what lets one
+    failed connection attempt shield every thread and client instance using the same
+    server, instead of each of them waiting for its own connection timeout.  The delays
+    stay the breaker's own, so clients can set them independently.
+
+    :param server: Address of the server.
+    :type server: str
+    :param base_delay: Seconds refused after the first failure; by default 5, or 0 for
+        Unix sockets.
+    :type base_delay: float
+    :rtype: CircuitBreaker
+    """
+    if base_delay is None:
+        base_delay = 0 if server.startswith('/') else 5
+    state = _shared.get(server)
+    if state is None:
+        with _shared_lock:
+            state = _shared.setdefault(server, BreakerState())
+    return CircuitBreaker(base_delay, shared=state)
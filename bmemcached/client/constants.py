@@ -1,2 +1,7 @@
 PICKLE_PROTOCOL = 0
 SOCKET_TIMEOUT = 3
+# memcached's default item_size_max (1MB) minus room for the key and item header.
+MAX_VALUE_SIZE = 1024 * 1024 - 1024
+# Seconds idle before the first keepalive probe, seconds between probes, and number of
+# unanswered probes before the connection is dropped.
+TCP_KEEPALIVE = (60, 10, 3)
@@ -1,26 +1,279 @@
 from collections import defaultdict
-from uhashring import HashRing
+import random
+import threading
+import time
 
 from bmemcached.client import SOCKET_TIMEOUT
+from bmemcached.client.constants import MAX_VALUE_SIZE, TCP_KEEPALIVE
 from bmemcached.client.mixin import ClientMixin
+from bmemcached.client.routing import HASHERS
 from bmemcached.compat import pickle
 
 
 class DistributedClient(ClientMixin):
     """This is intended to be a client class which implement standard cache interface that common libs do...
 
-    It tries to distribute keys over the specified servers using `HashRing` consistent hash.
+    It tries to distribute keys over the specified servers using a consistent hash, by default
+    a ring placing keys like `uhashring.HashRing`.
+
+    A hot key can be replicated to the `hot_key_replicas` consecutive servers on the
+    ring, so its reads are spread over them instead of saturating a single server.
+    Keys are replicated when designated with `add_hot_key` or, when `hot_key_threshold`
+    is set, once the `hot_keys` detector estimates them at or above that count.
+    Writes go to the key's own server first and, when they succeed, to its replicas;
+    deletes, incr and decr remove the replicas. A read hitting a replica which does not
+    have the key yet falls back to the key's own server, and reads returning a CAS
+    always use it.
+
+    Replicas are only kept coherent by clients which agree the key is hot, so every
+    client writing a designated key must designate it too. Auto-detection is done per
+    client, which makes it suitable for keys that are written rarely.
+
+    :param hot_key_replicas: Number of servers holding a hot key; 1 disables replication.
+    :type hot_key_replicas: int
+    :param hot_key_threshold: Estimated count from `hot_keys` above which a key is
+        replicated automatically, or None to only replicate designated keys.
+    :type hot_key_threshold: int
+    :param hot_key_read: How replicated reads pick a server: `random`, or
+        `least_loaded` for the one with the fewest reads in flight from this client.
+    :type hot_key_read: str
+    :param route_cache_size: Number of recent key routes memoized by the routing table.
+    :type route_cache_size: int
+    :param hasher: Distribution algorithm: `hashring`, `ketama` for libmemcached
+        compatible placement, `jump` or `rendezvous`; or a
+        `bmemcached.client.routing.RoutingTable` subclass.
+    :type hasher: str or type
+    :param ejector: Ejects servers failing repeatedly from the ring, remapping their keys
+        to the other servers until they recover.
+    :type ejector: bmemcached.client.ejection.NodeEjector
+    :param health_check_interval: If set, servers are checked with a NOOP this often, in
+        seconds, and the ones found down are left out of the ring until they answer again.
+        Replicated reads avoid them too, and `least_loaded` breaks ties on round-trip time.
+    :type health_check_interval: float
     """
+    HOT_KEY_READS = ('random', 'least_loaded')
+    # Seconds between two lookups of the auto-detected hot keys.
+    HOT_KEY_REFRESH_INTERVAL = 10
+
     def __init__(self, servers=('127.0.0.1:11211',), username=None, password=None, compression=None,
                  socket_timeout=SOCKET_TIMEOUT, pickle_protocol=0, pickler=pickle.Pickler, unpickler=pickle.Unpickler,
-                 tls_context=None):
+                 tls_context=None, large_values=False, max_value_size=MAX_VALUE_SIZE, near_cache=None,
+                 negative_cache=None, coalesce_reads=False, refresh_workers=2, hot_keys=None,
+                 hot_key_replicas=1, hot_key_threshold=None, hot_key_read='random', route_cache_size=0,
+                 hasher='hashring', ejector=None, health_check_interval=None, preconnect=False, tcp_nodelay=True,
+                 tcp_keepalive=TCP_KEEPALIVE, send_buffer_size=None, recv_buffer_size=None, connect_timeout=None,
+                 out_of_band_pickling=False):
+        if hot_key_read not in self.HOT_KEY_READS:
+            raise ValueError('Unknown hot key read strategy {!r}'.format(hot_key_read))
+        if not isinstance(hasher, type):
+            if hasher not in HASHERS:
+                raise ValueError('Unknown hasher {!r}'.format(hasher))
+            hasher = HASHERS[hasher]
+        # Needed by set_servers, called by ClientMixin.__init__.
+        self.ejector = ejector
+        self.hasher = hasher
+        self.route_cache_size = route_cache_size
+        self._ring = None
+        if ejector is not None:
+            ejector.add_listener(self._on_ejection_event)
         super(DistributedClient, self).__init__(servers, username, password, compression, socket_timeout,
-                                                pickle_protocol, pickler, unpickler, tls_context)
-        self._ring = HashRing(self._servers)
+                                                pickle_protocol, pickler, unpickler, tls_context,
+                                                large_values=large_values, max_value_size=max_value_size,
+                                                near_cache=near_cache, negative_cache=negative_cache,
+                                                coalesce_reads=coalesce_reads, refresh_workers=refresh_workers,
+                                                hot_keys=hot_keys, health_check_interval=health_check_interval,
+                                                preconnect=preconnect, tcp_nodelay=tcp_nodelay,
+                                                tcp_keepalive=tcp_keepalive, send_buffer_size=send_buffer_size,
+                                                recv_buffer_size=recv_buffer_size, connect_timeout=connect_timeout,
+                                                out_of_band_pickling=out_of_band_pickling)
+        self.hot_key_replicas = hot_key_replicas
+        self.hot_key_threshold = hot_key_threshold
+        self.hot_key_read = hot_key_read
+        self._replicated_keys = set()
+        self._detected_hot_keys = set()
+        self._detected_at = None
+        self._hot_key_lock = threading.Lock()
+        self._in_flight = defaultdict(int)
+
+    def _health_monitor(self):
+        return self.ejector
+
+    def _servers_changed(self, removed):
+        if self.ejector is not None:
+            self.ejector.unregister(protocol.server for protocol in removed)
+            self.ejector.register(protocol.server for protocol in self._servers)
+        self._rebalance()
+
+    def _health_changed(self):
+        self._rebalance()
+
+    def _rebalance(self):
+        """
+        Rebuild the routing table with the servers which are neither ejected nor down.
+        """
+        servers = self._servers
+        if self.ejector is not None:
+            servers = [server for server in servers if not self.ejector.is_ejected(server.server)] or servers
+        if self.health_checker is not None:
+            servers = [server for server in servers if not self.health_checker.is_down(server.server)] or servers
+        if self._ring is None:
+            self._ring = self.hasher(servers, cache_size=self.route_cache_size)
+        else:
+            self._ring = self._ring.rebuild(servers)
+
+    def _on_ejection_event(self, event, server):
+        if any(protocol.server == server for protocol in self._servers):
+            self._rebalance()
 
     def _get_server(self, key):
         return self._ring.get_node(key)
 
+    def add_hot_key(self, key):
+        """
+        Replicate a key to `hot_key_replicas` servers. Replicas are filled on its next write.
+
+        :param key: Key's name
+        :type key: six.string_types
+        """
+        self._replicated_keys.add(key)
+
+    def remove_hot_key(self, key):
+        """
+        Stop replicating a key and delete its replicas.
+
+        :param key: Key's name
+        :type key: six.string_types
+        """
+        self._replicated_keys.discard(key)
+        self._detected_hot_keys.discard(key)
+        for server in self._get_replicas(key)[1:]:
+            server.delete(key)
+
+    def _get_replicas(self, key):
+        """
+        Return the key's own server followed by the next distinct servers on the ring.
+        """
+        return self._ring.range(key, self.hot_key_replicas)
+
+    def _is_hot(self, key):
+        if self.hot_key_replicas < 2:
+            return False
+        if key in self._replicated_keys:
+            return True
+        if self.hot_key_threshold is None or self.hot_keys is None:
+            return False
+
+        now = time.monotonic()
+        if self._detected_at is None or now - self._detected_at >= self.HOT_KEY_REFRESH_INTERVAL:
+            self._detected_at = now
+            self._refresh_hot_keys()
+        return key in self._detected_hot_keys
+
+    def _refresh_hot_keys(self):
+        """
+        Replace the detected hot keys by the ones the detector reports now.
+
+        Replicas miss the writes made while their key is not hot, so the replicas of keys
+        cooling down or heating up are deleted: until the key's next write fills them,
+        reads fall back to its own server.
+        """
+        previous = self._detected_hot_keys
+        self._detected_hot_keys = detected = set(self.hot_keys.hot_keys(self.hot_key_threshold))
+        self._delete_replicas((previous ^ detected) - self._replicated_keys)
+
+    def _pick_replica(self, replicas):
+        checker = self.health_checker
+        if checker is not None:
+            replicas = [server for server in replicas if not checker.is_down(server.server)] or replicas
+        if self.hot_key_read == 'least_loaded':
+            with self._hot_key_lock:
+                if checker is None:
+                    return min(replicas, key=lambda server: self._in_flight[server])
+                return min(replicas, key=lambda server: (self._in_flight[server], checker.rtt(server.server) or 0))
+        return random.choice(replicas)
+
+    def _get_replicated(self, key):
+        replicas = self._get_replicas(key)
+        server = self._pick_replica(replicas)
+        with self._hot_key_lock:
+            self._in_flight[server] += 1
+        try:
+            value, cas = server.get(key)
+        finally:
+            with self._hot_key_lock:
+                self._in_flight[server] -= 1
+        if value is None and server is not replicas[0]:
+            value, cas = replicas[0].get(key)
+        return value, cas
+
+    def _write_replicas(self, key, value, time, compress_level, result):
+        """
+        Copy a value to the key's replicas after it was written to its own server.
+        """
+        success = result[0] if isinstance(result, tuple) else result
+        if success and self._is_hot(key):
+            for server in self._get_replicas(key)[1:]:
+                server.set(key, value, time, compress_level)
+
+    def _write_replicas_multi(self, mappings, time, compress_level, failed):
+        failed = set(key[0] if isinstance(key, tuple) else key for key in failed)
+        server_mappings = defaultdict(dict)
+        for key, value in mappings.items():
+            str_key = key[0] if isinstance(key, tuple) else key
+            if str_key not in failed and self._is_hot(str_key):
+                for server in self._get_replicas(str_key)[1:]:
+                    server_mappings[server][str_key] = value
+        for server, m in server_mappings.items():
+            server.set_multi(m, time, compress_level)
+
+    def _drop_replicas(self, keys):
+        self._delete_replicas([key for key in keys if self._is_hot(key)])
+
+    def _delete_replicas(self, keys):
+        server_keys = defaultdict(list)
+        for key in keys:
+            for server in self._get_replicas(key)[1:]:
+                server_keys[server].append(key)
+        for server, keys_ in server_keys.items():
+            server.delete_multi(keys_)
+
+    def _record_hot_keys(self, keys):
+        if self.hot_keys is not None:
+            self.hot_keys.record(keys, lambda key: self._get_server(key).server)
+
+    def _get(self, key, get_cas=False):
+        if not get_cas and self._is_hot(key):
+            return self._get_replicated(key)
+        server = self._get_server(key)
+        return server.get(key)
+
+    def _get_multi(self, keys, get_cas=False):
+        replicated = {}
+        d = {}
+        if not get_cas and self.hot_key_replicas > 1:
+            hot_keys = [key for key in keys if self._is_hot(key)]
+            keys = [key for key in keys if key not in hot_keys] if hot_keys else keys
+        else:
+            hot_keys = []
+        servers = self._ring.get_nodes(keys)
+        for key in hot_keys:
+            replicas = self._get_replicas(key)
+            server_key = self._pick_replica(replicas)
+            if server_key is not replicas[0]:
+                replicated[key] = replicas[0]
+            servers[server_key].append(key)
+        for server, keys in servers.items():
+            d.update(server.get_multi(keys))
+
+        # Replicas which do not have the key yet fall back to the key's own server.
+        servers = defaultdict(list)
+        for key, server in replicated.items():
+            if key not in d:
+                servers[server].append(key)
+        for server, keys in servers.items():
+            d.update(server.get_multi(keys))
+        return d
+
     def delete(self, key, cas=0):
         """
         Delete a key/value from server. If key does not exist, it returns True.
@@ -29,15 +282,32 @@ class DistributedClient(ClientMixin):
         :param cas: CAS of the key
         :return: True in case o success and False in case of failure.
         """
+        previous = self._chunk_manifests([key])
         server = self._get_server(key)
-        return server.delete(key, cas)
+        result = server.delete(key, cas)
+        self._drop_replicas([key])
+        self._invalidate([key])
+        self._release_chunk(previous, key, None, result)
+        return result
 
     def delete_multi(self, keys):
-        servers = defaultdict(list)
-        for key in keys:
-            server_key = self._get_server(key)
-            servers[server_key].append(key)
-        return all([server.delete_multi(keys_) for server, keys_ in servers.items()])
+        previous = self._chunk_manifests(keys)
+        servers = self._ring.get_nodes(keys)
+        result = all([server.delete_multi(keys_) for server, keys_ in servers.items()])
+        self._drop_replicas(keys)
+        self._invalidate(keys)
+        self._release_chunks(previous, {}, ())
+        return result
+
+    def _set_chunks(self, chunks, time):
+        failed = set()
+        for server, keys in self._ring.get_nodes(chunks).items():
+            failed.update(server.set_multi(dict((key, chunks[key]) for key in keys), time, compress_level=0))
+        return failed
+
+    def _delete_chunks(self, keys):
+        for server, keys_ in self._ring.get_nodes(keys).items():
+            server.delete_multi(keys_)
 
     def set(self, key, value, time=0, compress_level=-1, get_cas=False):
         """
@@ -60,8 +330,18 @@ class DistributedClient(ClientMixin):
             (success, cas) tuple if get_cas=True.
         :rtype: bool or tuple
         """
+        self._record_hot_keys([key])
+        previous = self._chunk_manifests([key])
+        if self.large_values:
+            value = self._store_large_value(key, value, time, compress_level)
+            if value is None:
+                return (False, None) if get_cas else False
         server = self._get_server(key)
-        return server.set(key, value, time, compress_level, get_cas=get_cas)
+        result = server.set(key, value, time, compress_level, get_cas=get_cas)
+        self._write_replicas(key, value, time, compress_level, result)
+        self._invalidate([key])
+        self._release_chunk(previous, key, value, result)
+        return result
 
     def set_multi(self, mappings, time=0, compress_level=-1):
         """
@@ -81,13 +361,17 @@ class DistributedClient(ClientMixin):
         if not mappings:
             return []
         returns = set()
-        server_mappings = defaultdict(dict)
-        for key, value in mappings.items():
-            server_key = self._get_server(key)
-            server_mappings[server_key].update([(key, value)])
-        for server, m in server_mappings.items():
-            returns |= set(server.set_multi(m, time, compress_level))
+        previous = self._chunk_manifests(mappings)
+        if self.large_values:
+            mappings, failed = self._store_large_values(mappings, time, compress_level)
+            returns.update(failed)
+        servers = self._ring.get_nodes(mappings, key=lambda key: key[0] if isinstance(key, tuple) else key)
+        for server, keys in servers.items():
+            returns |= set(server.set_multi(dict((key, mappings[key]) for key in keys), time, compress_level))
 
+        self._write_replicas_multi(mappings, time, compress_level, returns)
+        self._invalidate(mappings)
+        self._release_chunks(previous, mappings, returns)
         return list(returns)
 
     def set_multi_cas(self, mappings, time=0, compress_level=-1):
@@ -111,13 +395,17 @@ class DistributedClient(ClientMixin):
         if not mappings:
             return {}
         result = {}
-        server_mappings = defaultdict(dict)
-        for key, value in mappings.items():
-            str_key = key[0] if isinstance(key, tuple) else key
-            server_key = self._get_server(str_key)
-            server_mappings[server_key][key] = value
-        for server, m in server_mappings.items():
-            result.update(server.set_multi_cas(m, time, compress_level))
+        previous = self._chunk_manifests(mappings)
+        if self.large_values:
+            mappings, failed = self._store_large_values(mappings, time, compress_level)
+            result.update((key[0] if isinstance(key, tuple) else key, None) for key in failed)
+        servers = self._ring.get_nodes(mappings, key=lambda key: key[0] if isinstance(key, tuple) else key)
+        for server, keys in servers.items():
+            result.update(server.set_multi_cas(dict((key, mappings[key]) for key in keys), time, compress_level))
+        failed = [key for key, cas in result.items() if cas is None]
+        self._write_replicas_multi(mappings, time, compress_level, failed)
+        self._invalidate(mappings)
+        self._release_chunks(previous, mappings, failed)
         return result
 
     def add(self, key, value, time=0, compress_level=-1, get_cas=False):
@@ -141,8 +429,16 @@ class DistributedClient(ClientMixin):
             (success, cas) tuple if get_cas=True.
         :rtype: bool or tuple
         """
+        if self.large_values:
+            value = self._store_large_value(key, value, time, compress_level)
+            if value is None:
+                return (False, None) if get_cas else False
         server = self._get_server(key)
-        return server.add(key, value, time, compress_level, get_cas=get_cas)
+        result = server.add(key, value, time, compress_level, get_cas=get_cas)
+        self._write_replicas(key, value, time, compress_level, result)
+        self._invalidate([key])
+        self._release_chunk({}, key, value, result)
+        return result
 
     def replace(self, key, value, time=0, compress_level=-1, get_cas=False):
         """
@@ -165,8 +461,17 @@ class DistributedClient(ClientMixin):
             (success, cas) tuple if get_cas=True.
         :rtype: bool or tuple
         """
+        previous = self._chunk_manifests([key])
+        if self.large_values:
+            value = self._store_large_value(key, value, time, compress_level)
+            if value is None:
+                return (False, None) if get_cas else False
         server = self._get_server(key)
-        return server.replace(key, value, time, compress_level, get_cas=get_cas)
+        result = server.replace(key, value, time, compress_level, get_cas=get_cas)
+        self._write_replicas(key, value, time, compress_level, result)
+        self._invalidate([key])
+        self._release_chunk(previous, key, value, result)
+        return result
 
     def get(self, key, default=None, get_cas=False):
         """
@@ -180,8 +485,7 @@ class DistributedClient(ClientMixin):
         :return: Returns a key data from server.
         :rtype: object
         """
-        server = self._get_server(key)
-        value, cas = server.get(key)
+        value, cas = self._fetch(key, get_cas)
         if value is not None:
             if get_cas:
                 return value, cas
@@ -206,23 +510,15 @@ class DistributedClient(ClientMixin):
         :return: A dict with all requested keys.
         :rtype: dict
         """
-        servers = defaultdict(list)
-        d = {}
-        for key in keys:
-            server_key = self._get_server(key)
-            servers[server_key].append(key)
-        for server, keys in servers.items():
-            results = server.get_multi(keys)
-            if not get_cas:
-                # Remove CAS data
-                for key, (value, cas) in results.items():
-                    results[key] = value
-            d.update(results)
+        d = self._fetch_multi(keys, get_cas)
+        if not get_cas:
+            # Remove CAS data
+            for key, (value, cas) in d.items():
+                d[key] = value
         return d
 
     def gets(self, key):
-        server = self._get_server(key)
-        return server.get(key)
+        return self._fetch(key, get_cas=True)
 
     def cas(self, key, value, cas, time=0, compress_level=-1, get_cas=False):
         """
@@ -247,8 +543,17 @@ class DistributedClient(ClientMixin):
             (success, new_cas) tuple if get_cas=True.
         :rtype: bool or tuple
         """
+        previous = self._chunk_manifests([key])
+        if self.large_values:
+            value = self._store_large_value(key, value, time, compress_level)
+            if value is None:
+                return (False, None) if get_cas else False
         server = self._get_server(key)
-        return server.cas(key, value, cas, time, compress_level, get_cas=get_cas)
+        result = server.cas(key, value, cas, time, compress_level, get_cas=get_cas)
+        self._write_replicas(key, value, time, compress_level, result)
+        self._invalidate([key])
+        self._release_chunk(previous, key, value, result)
+        return result
 
     def incr(self, key, value, default=0, time=1000000):
         """
@@ -266,7 +571,10 @@ class DistributedClient(ClientMixin):
         :rtype: int
         """
         server = self._get_server(key)
-        return server.incr(key, value, default=default, time=time)
+        result = server.incr(key, value, default=default, time=time)
+        self._drop_replicas([key])
+        self._invalidate([key])
+        return result
 
     def decr(self, key, value, default=0, time=1000000):
         """
@@ -285,4 +593,7 @@ class DistributedClient(ClientMixin):
         :rtype: int
         """
         server = self._get_server(key)
-        return server.decr(key, value, default=default, time=time)
+        result = server.decr(key, value, default=default, time=time)
+        self._drop_replicas([key])
+        self._invalidate([key])
+        return result
@@ -0,0 +1,168 @@
+from collections import deque
+import logging
+import threading
+import time
+
+__all__ = ('NodeEjector', )
+
+logger = logging.getLogger(__name__)
+
+
+class NodeEjector(object):
+    """
+    Ejects failing servers from a `DistributedClient` ring and re-admits them once they
+    answer health probes again.
+
+    A server is ejected after `failure_threshold` consecutive connection errors, and its
+    keys are remapped to the other servers.  While ejected, a background probe sends it a
+    NOOP every `probe_interval` seconds, connecting even while its breaker defers
+    reconnection attempts; after `probe_successes` consecutive successful probes it is
+    re-admitted and gets its keys back.  The last server is never ejected.
+
+    Every ejection and re-admission is kept in `events` as a (time, event, server) tuple,
+    event being `ejected` or `readmitted`, and passed to the listeners.
+
+    :param failure_threshold: Consecutive connection errors ejecting a server.
+    :type failure_threshold: int
+    :param probe_interval: Seconds between two probes of an ejected server.
+    :type probe_interval: float
+    :param probe_successes: Consecutive successful probes re-admitting a server.
+    :type probe_successes: int
+    :param max_events: Number of events kept in `events`.
+    :type max_events: int
+    """
+    def __init__(self, failure_threshold=3, probe_interval=10, probe_successes=2, max_events=100):
+        self.failure_threshold = failure_threshold
+        self.probe_interval = probe_interval
+        self.probe_successes = probe_successes
+        self.events = deque(maxlen=max_events)
+        self._lock = threading.Lock()
+        self._failures = {}
+        self._ejected = {}
+        self._servers = set()
+        self._listeners = []
+
+    def add_listener(self, listener):
+        """
+        Call listener(event, server) on every ejection and re-admission.
+
+        :param listener: Callable receiving the event name and the server's address.
+        :type listener: callable
+        """
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        self._listeners.remove(listener)
+
+    def register(self, servers):
+        """
+        Declare the servers of a ring, so the last live one is never ejected.
+
+        :param servers: Addresses of the servers.
+        :type servers: Collection
+        """
+        with self._lock:
+            self._servers.update(servers)
+
+    def unregister(self, servers):
+        """
+        Forget servers removed from a ring.
+
+        :param servers: Addresses of the servers.
+        :type servers: Collection
+        """
+        with self._lock:
+            for server in servers:
+                self._servers.discard(server)
+                self._failures.pop(server, None)
+                self._ejected.pop(server, None)
+
+    def is_ejected(self, server):
+        """
+        :param server: Address of the server.
+        :type server: str
+        :rtype: bool
+        """
+        return server in self._ejected
+
+    @property
+    def ejected(self):
+        """
+        Addresses of the servers currently ejected.
+
+        :rtype: set
+        """
+        return set(self._ejected)
+
+    def record_success(self, protocol):
+        """
+        Record a successful response from a server.
+
+        :param protocol: The server.
+        :type protocol: bmemcached.protocol.Protocol
+        """
+        if self._failures.get(protocol.server):
+            with self._lock:
+                self._failures.pop(protocol.server, None)
+
+    def record_failure(self, protocol, exception):
+        """
+        Record a connection error with a server, ejecting it past the threshold.
+
+        :param protocol: The server.
+        :type protocol: bmemcached.protocol.Protocol
+        :param exception: The error.
+        :type exception: Exception
+        """
+        server = protocol.server
+        with self._lock:
+            if server in self._ejected:
+                return
+            failures = self._failures[server] = self._failures.get(server, 0) + 1
+            if failures < self.failure_threshold or not self._servers - set(self._ejected) - {server}:
+                return
+            self._failures.pop(server, None)
+            self._ejected[server] = 0
+        logger.warning('Ejecting memcached server %s after %d failures: %s', server, failures, exception)
+        self._emit('ejected', server)
+        self._schedule_probe(protocol)
+
+    def _schedule_probe(self, protocol):
+        timer = threading.Timer(self.probe_interval, self._probe, (protocol, ))
+        timer.daemon = True
+        timer.start()
+
+    def _probe(self, protocol):
+        server = protocol.server
+        if server not in self._ejected:
+            return
+        try:
+            healthy = protocol.probe() == protocol.STATUS['success']
+        except Exception:
+            healthy = False
+        finally:
+            protocol.disconnect()
+
+        with self._lock:
+            if server not in self._ejected:
+                # Unregistered while probing.
+                return
+            successes = self._ejected[server] + 1 if healthy else 0
+            readmitted = successes >= self.probe_successes
+            if readmitted:
+                del self._ejected[server]
+            else:
+                self._ejected[server] = successes
+        if readmitted:
+            logger.info('Re-admitting memcached server %s', server)
+            self._emit('readmitted', server)
+        else:
+            self._schedule_probe(protocol)
+
+    def _emit(self, event, server):
+        self.events.append((time.time(), event, server))
+        for listener in list(self._listeners):
+            try:
+                listener(event, server)
+            except Exception:
+                logger.exception('Ejection listener failed')
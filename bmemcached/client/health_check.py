@@ -0,0 +1,158 @@
+import logging
+import threading
+import time
+
+__all__ = ('HealthChecker', )
+
+logger = logging.getLogger(__name__)
+
+
+class HealthChecker(object):
+    """
+    Checks a client's servers from a background thread, so request threads don't discover
+    dead servers by waiting on them.
+
+    Every `interval` seconds each server is sent a NOOP and its round-trip time is folded
+    into a moving average.  A server is down after `failure_threshold` consecutive failed
+    checks and up again after a successful one.  Clients use this to route around down
+    servers and to prefer the fastest replicas; see `is_down` and `rtt`.
+
+    The checks go through the servers' `Protocol` instances, so they also feed the shared
+    circuit breakers and a `DistributedClient`'s ejector.  They connect even while a
+    server's breaker defers reconnection attempts, see `Protocol.probe`: a server coming
+    back is noticed by the checker first, and closing its breaker lets request threads
+    reconnect to it without waiting out their reconnection delay.  Connections are per
+    thread, so the checker's own ones are the only ones it can keep open.
+
+    :param client: The client whose servers are checked.
+    :type client: bmemcached.client.mixin.ClientMixin
+    :param interval: Seconds between two rounds of checks.
+    :type interval: float
+    :param failure_threshold: Consecutive failed checks marking a server down.
+    :type failure_threshold: int
+    :param smoothing: Weight of the latest round-trip time in the moving average.
+    :type smoothing: float
+    """
+    def __init__(self, client, interval=5.0, failure_threshold=2, smoothing=0.3):
+        if not 0 < smoothing <= 1:
+            raise ValueError('smoothing must be between 0 and 1')
+        self.client = client
+        self.interval = interval
+        self.failure_threshold = failure_threshold
+        self.smoothing = smoothing
+        self._rtts = {}
+        self._failures = {}
+        self._down = set()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._stopped = False
+
+    def start(self):
+        """Start the background thread checking the servers."""
+        with self._condition:
+            if self._thread is not None:
+                return
+            self._stopped = False
+            self._thread = threading.Thread(target=self._run, name='bmemcached-health-check')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        """Stop the background thread and wait for the current round to finish."""
+        with self._condition:
+            thread = self._thread
+            self._thread = None
+            self._stopped = True
+            self._condition.notify()
+        if thread is not None:
+            thread.join()
+
+    def _run(self):
+        while True:
+            try:
+                self.check()
+            except Exception:
+                logger.exception('Health check failed')
+            with self._condition:
+                if not self._stopped:
+                    self._condition.wait(self.interval)
+                if self._stopped:
+                    break
+        for server in self.client.servers:
+            server.disconnect()
+
+    def is_down(self, server):
+        """
+        :param server: Address of the server.
+        :type server: str
+        :rtype: bool
+        """
+        return server in self._down
+
+    @property
+    def down(self):
+        """
+        Addresses of the servers currently down.
+
+        :rtype: set
+        """
+        return set(self._down)
+
+    def rtt(self, server):
+        """
+        Return the average round-trip time of a server in seconds, or None if unknown.
+
+        :param server: Address of the server.
+        :type server: str
+        :rtype: float
+        """
+        return self._rtts.get(server)
+
+    def check(self):
+        """
+        Check every server once.
+
+        :return: A dict of server address: round-trip time in seconds, or None if the
+            check failed.
+        :rtype: dict
+        """
+        protocols = list(self.client.servers)
+        results = {}
+        for protocol in protocols:
+            start = time.monotonic()
+            try:
+                healthy = protocol.probe() == protocol.STATUS['success']
+            except Exception:
+                logger.exception('Checking memcached server %s failed', protocol.server)
+                healthy = False
+            results[protocol.server] = time.monotonic() - start if healthy else None
+
+        changed = False
+        for server, rtt in results.items():
+            if rtt is None:
+                failures = self._failures[server] = self._failures.get(server, 0) + 1
+                if failures >= self.failure_threshold and server not in self._down:
+                    logger.warning('Memcached server %s is down', server)
+                    self._down.add(server)
+                    changed = True
+                continue
+
+            self._failures.pop(server, None)
+            previous = self._rtts.get(server)
+            self._rtts[server] = rtt if previous is None else previous + self.smoothing * (rtt - previous)
+            if server in self._down:
+                logger.info('Memcached server %s is up', server)
+                self._down.discard(server)
+                changed = True
+
+        # Forget the servers removed from the client.
+        for state in (self._rtts, self._failures):
+            for server in set(state) - set(results):
+                del state[server]
+        if self._down - set(results):
+            self._down &= set(results)
+            changed = True
+
+        if changed:
+            self.client._health_changed()
+        return results
@@ -0,0 +1,77 @@
+from collections import deque
+import threading
+
+__all__ = ('LatencyTracker', )
+
+
+class LatencyTracker(object):
+    """
+    Keeps the latest read latencies of each server to derive hedging delays from them.
+
+    :param window: Number of latencies kept per server.
+    :type window: int
+    :param min_samples: Latencies needed before a percentile is trusted.
+    :type min_samples: int
+    """
+    # Percentiles are computed again after this fraction of the window was recorded.
+    REFRESH_RATIO = 0.05
+
+    def __init__(self, window=1000, min_samples=20):
+        self.window = window
+        self.min_samples = min_samples
+        self.hedged = 0
+        self.hedge_wins = 0
+        self._latencies = {}
+        self._recorded = {}
+        self._percentiles = {}
+        self._lock = threading.Lock()
+
+    def record(self, server, seconds):
+        """
+        :param server: Address of the server.
+        :type server: str
+        :param seconds: Time the server took to answer a read.
+        :type seconds: float
+        """
+        with self._lock:
+            latencies = self._latencies.get(server)
+            if latencies is None:
+                latencies = self._latencies[server] = deque(maxlen=self.window)
+            latencies.append(seconds)
+            self._recorded[server] = self._recorded.get(server, 0) + 1
+
+    def percentile(self, server, percent):
+        """
+        Return the latency under which percent of a server's reads answered, or None if
+        too few were recorded.
+
+        :param server: Address of the server.
+        :type server: str
+        :param percent: Percentile, between 0 and 100.
+        :type percent: float
+        :rtype: float
+        """
+        recorded = self._recorded.get(server, 0)
+        cached = self._percentiles.get((server, percent))
+        if cached is not None and recorded - cached[0] < max(1, self.window * self.REFRESH_RATIO):
+            return cached[1]
+
+        with self._lock:
+            latencies = sorted(self._latencies.get(server, ()))
+        if len(latencies) < self.min_samples:
+            return None
+        value = latencies[min(int(len(latencies) * percent / 100.0), len(latencies) - 1)]
+        self._percentiles[(server, percent)] = recorded, value
+        return value
+
+    def record_hedge(self, won):
+        """
+        Count a hedged read, and whether the hedge answered first.
+
+        :param won: True if the hedge's answer was used.
+        :type won: bool
+        """
+        with self._lock:
+            self.hedged += 1
+            if won:
+                self.hedge_wins += 1
@@ -0,0 +1,116 @@
+import random
+import threading
+
+from bmemcached.sketch import CountMinSketch
+
+__all__ = ('HotKeyDetector', )
+
+
+class _ServerStats(object):
+    def __init__(self, width, depth, sample_size):
+        self.sketch = CountMinSketch(width, depth, sample_size, max_count=0xffffffff)
+        self.top = {}
+
+
+class HotKeyDetector(object):
+    """
+    Finds the keys dominating the traffic of each server.
+
+    A fraction of the operations is sampled into a count-min sketch per server, and the
+    sampled keys with the highest estimates are kept as that server's heavy hitters.
+    Memory is bounded by the sketch size and `top_k`, and an unsampled operation only
+    costs a random number, so it is cheap enough to leave on in production.
+
+    The sketch is aged every `sample_size` samples, so counts reflect recent traffic.
+
+    :param sample_rate: Fraction of the operations recorded, between 0 and 1.
+    :type sample_rate: float
+    :param top_k: Number of heavy hitters kept per server.
+    :type top_k: int
+    :param width: Counters per row of each sketch.
+    :type width: int
+    :param depth: Rows of each sketch.
+    :type depth: int
+    :param sample_size: Samples between two agings of a server's sketch, or None to never age.
+    :type sample_size: int
+    """
+    def __init__(self, sample_rate=0.01, top_k=10, width=2048, depth=4, sample_size=100000):
+        if not 0 < sample_rate <= 1:
+            raise ValueError('sample_rate must be between 0 and 1')
+        self.sample_rate = sample_rate
+        self.top_k = top_k
+        self.width = width
+        self.depth = depth
+        self.sample_size = sample_size
+        self._lock = threading.Lock()
+        self._servers = {}
+
+    def record(self, keys, locate=None):
+        """
+        Sample keys of an operation.
+
+        :param keys: Keys of the operation.
+        :type keys: Collection
+        :param locate: Callable returning the address of the server a key is sent to,
+            only called for sampled keys. If None, every key is counted under None,
+            which suits clients where every server holds every key.
+        :type locate: callable
+        """
+        sample_rate = self.sample_rate
+        for key in keys:
+            if sample_rate < 1 and random.random() >= sample_rate:
+                continue
+            server = locate(key) if locate is not None else None
+            with self._lock:
+                stats = self._servers.get(server)
+                if stats is None:
+                    stats = self._servers[server] = _ServerStats(self.width, self.depth, self.sample_size)
+                self._add(stats, key)
+
+    def _add(self, stats, key):
+        estimate = stats.sketch.add(key)
+        top = stats.top
+        if key in top or len(top) < self.top_k:
+            top[key] = estimate
+            return
+
+        # Stored estimates go stale as the sketch ages, so compare against fresh ones.
+        for candidate in top:
+            top[candidate] = stats.sketch.estimate(candidate)
+        coldest = min(top, key=top.get)
+        if estimate > top[coldest]:
+            del top[coldest]
+            top[key] = estimate
+
+    def report(self, limit=None):
+        """
+        Return the heavy hitters of every server, hottest first.
+
+        Counts are estimates of the requests since the last aging, scaled by the sample rate.
+
+        :param limit: Maximum number of keys per server, defaulting to `top_k`.
+        :type limit: int
+        :return: A dict of server: [(key, count), ...].
+        :rtype: dict
+        """
+        report = {}
+        with self._lock:
+            for server, stats in self._servers.items():
+                counts = [(key, int(stats.sketch.estimate(key) / self.sample_rate)) for key in stats.top]
+                counts.sort(key=lambda item: item[1], reverse=True)
+                report[server] = counts[:limit or self.top_k]
+        return report
+
+    def hot_keys(self, threshold):
+        """
+        Return the keys whose estimated count reached threshold on any server.
+
+        :param threshold: Minimum estimated count.
+        :type threshold: int
+        :rtype: set
+        """
+        return set(key for counts in self.report().values() for key, count in counts if count >= threshold)
+
+    def clear(self):
+        with self._lock:
+            self._servers.clear()
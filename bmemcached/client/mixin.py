@@ -1,15 +1,49 @@
+from concurrent.futures import ThreadPoolExecutor, wait as wait_futures
+import itertools
+import logging
+import math
+import os
+import random
+import threading
+import time
+
 import six
 
-from bmemcached.client.constants import PICKLE_PROTOCOL, SOCKET_TIMEOUT
+from bmemcached import deadline
+from bmemcached.chunking import ChunkManifest
+from bmemcached.circuit_breaker import shared_breaker
+from bmemcached.client.constants import MAX_VALUE_SIZE, PICKLE_PROTOCOL, SOCKET_TIMEOUT, TCP_KEEPALIVE
+from bmemcached.client.health_check import HealthChecker
+from bmemcached.client.single_flight import SingleFlight
 from bmemcached.compat import pickle
-from bmemcached.protocol import Protocol
+from bmemcached.envelope import Envelope
+from bmemcached.protocol import Protocol, Serialized
+from bmemcached.tls import TLSSessionCache
+from bmemcached.utils import str_to_bytes
+
+
+logger = logging.getLogger(__name__)
+
+
+def _suffixed(key, suffix):
+    # Keys may be bytes, which can't be concatenated with a str suffix.
+    if isinstance(key, six.binary_type):
+        return key + suffix.encode()
+    return key + suffix
+
+
+def _unwrapped(value):
+    # get_or_set stores None in an Envelope, to tell it from a miss.
+    return value.value if isinstance(value, Envelope) else value
 
 
 class ClientMixin(object):
     """ Client mixin with basic commands.
 
-    :param servers: A list of servers with ip[:port] or unix socket.
-    :type servers: list
+    :param servers: A list of servers with ip[:port] or unix socket, each one possibly a
+        (server, weight) tuple, or a dict of server: weight. Weights are used by
+        `DistributedClient` only.
+    :type servers: list or dict
     :param username: If your server requires SASL authentication, provide the username.
     :type username: six.string_types
     :param password: If your server requires SASL authentication, provide the password.
@@ -18,7 +52,8 @@ class ClientMixin(object):
         but you can change it to any Python module that provides
         `compress` and `decompress` functions, such as `bz2`.
     :type compression: Python module
-    :param socket_timeout: The timeout applied to memcached connections.
+    :param socket_timeout: The timeout applied to each send and receive on memcached
+        connections, and to connecting unless `connect_timeout` is set.
     :type socket_timeout: float
     :param pickle_protocol: The pickling protocol to use, 0-5. See
         https://docs.python.org/3/library/pickle.html#data-stream-format
@@ -29,9 +64,69 @@ class ClientMixin(object):
     :param unpickler: Use this to replace the object deserialization mechanism.
     :type unpickler: function
     :param tls_context: A TLS context in order to connect to TLS enabled
-        memcached servers.
+        memcached servers. New connections resume the servers' last TLS session when
+        possible; see `tls_sessions` for the number of resumed and full handshakes.
     :type tls_context: ssl.SSLContext
+    :param large_values: If true, values which serialize to more than `max_value_size`
+        bytes are split over several chunk keys, written with a single `set_multi`,
+        and stored under their key as a small manifest. Reads fetch every chunk with
+        a single `get_multi` and validate their checksum; if any chunk was evicted
+        the value is treated as missing. Writes and deletes first read the key, to
+        delete the chunks of the value they replace.
+    :type large_values: bool
+    :param max_value_size: Biggest serialized value stored as a single item when
+        `large_values` is enabled, which should fit the server's `item_size_max`.
+    :type max_value_size: int
+    :param near_cache: An in-process cache consulted by `get` and `get_multi`
+        before going to the servers, and invalidated by writes made through
+        this client. Reads with `get_cas` always go to the servers.
+    :type near_cache: bmemcached.client.near_cache.NearCache
+    :param negative_cache: A short lived set of keys known to be missing, which
+        `get` and `get_multi` answer without a round trip. Writes made through
+        this client remove the key from it.
+    :type negative_cache: bmemcached.client.negative_cache.NegativeCache
+    :param coalesce_reads: If true, concurrent reads of the same key from different
+        threads share a single request to the servers, including keys overlapping
+        between `get_multi` calls. Every waiter receives the same object, so
+        returned values must not be mutated.
+    :type coalesce_reads: bool
+    :param refresh_workers: Number of threads refreshing stale values in the
+        background for `get_swr`. They are only started when first needed.
+    :type refresh_workers: int
+    :param hot_keys: Sampler counting the keys of `get`, `get_multi` and `set` per
+        server, to find the keys dominating the traffic.
+    :type hot_keys: bmemcached.client.hot_keys.HotKeyDetector
+    :param health_check_interval: If set, a `HealthChecker` thread sends a NOOP to every
+        server this often, in seconds. Reads avoid the servers it finds down and prefer
+        the fastest replicas. It is available as `health_checker`.
+    :type health_check_interval: float
+    :param preconnect: If true, connections to every server are opened concurrently
+        for the constructing thread, see `warmup`. Unreachable servers are logged.
+    :type preconnect: bool
+    :param tcp_nodelay: Disable Nagle's algorithm on TCP connections, so small requests
+        are sent right away instead of waiting for the previous ones to be acknowledged.
+    :type tcp_nodelay: bool
+    :param tcp_keepalive: Enable TCP keepalive with (idle, interval, count): seconds idle
+        before the first probe, seconds between probes and unanswered probes before the
+        connection is dropped. None leaves keepalive off.
+    :type tcp_keepalive: tuple
+    :param send_buffer_size: SO_SNDBUF of TCP connections, None for the system's default.
+    :type send_buffer_size: int
+    :param recv_buffer_size: SO_RCVBUF of TCP connections, None for the system's default.
+        Raising it helps large `get_multi` responses.
+    :type recv_buffer_size: int
+    :param connect_timeout: The timeout for opening connections, TLS handshake included.
+        Defaults to `socket_timeout`. To bound whole calls, see `deadline`.
+    :type connect_timeout: float
+    :param out_of_band_pickling: Store large bytes and bytearray objects held by pickled
+        values, directly or as attributes or first items, as out-of-band buffers after the
+        pickle stream instead of copying them into it.  Needs pickle protocol 5 or -1 on
+        Python 3.8+, and clients reading the values must be recent enough to decode them.
+    :type out_of_band_pickling: bool
     """
+    # Keys are hashed to this many write counters, see `_write_generation`.
+    WRITE_GENERATION_SLOTS = 4096
+
     def __init__(self, servers=('127.0.0.1:11211',),
                  username=None,
                  password=None,
@@ -40,16 +135,61 @@ class ClientMixin(object):
                  pickle_protocol=PICKLE_PROTOCOL,
                  pickler=pickle.Pickler,
                  unpickler=pickle.Unpickler,
-                 tls_context=None):
+                 tls_context=None,
+                 large_values=False,
+                 max_value_size=MAX_VALUE_SIZE,
+                 near_cache=None,
+                 negative_cache=None,
+                 coalesce_reads=False,
+                 refresh_workers=2,
+                 hot_keys=None,
+                 health_check_interval=None,
+                 preconnect=False,
+                 tcp_nodelay=True,
+                 tcp_keepalive=TCP_KEEPALIVE,
+                 send_buffer_size=None,
+                 recv_buffer_size=None,
+                 connect_timeout=None,
+                 out_of_band_pickling=False):
+        if out_of_band_pickling and not Protocol.supports_out_of_band(pickle_protocol):
+            raise ValueError('Out-of-band pickling needs pickle protocol 5')
         self.username = username
         self.password = password
         self.compression = compression
         self.socket_timeout = socket_timeout
+        self.connect_timeout = connect_timeout
         self.pickle_protocol = pickle_protocol
+        self.out_of_band_pickling = out_of_band_pickling
         self.pickler = pickler
         self.unpickler = unpickler
         self.tls_context = tls_context
+        self.tls_sessions = TLSSessionCache() if tls_context is not None else None
+        self.tcp_nodelay = tcp_nodelay
+        self.tcp_keepalive = tcp_keepalive
+        self.send_buffer_size = send_buffer_size
+        self.recv_buffer_size = recv_buffer_size
+        self.large_values = large_values
+        self.max_value_size = max_value_size
+        self.near_cache = near_cache
+        self.negative_cache = negative_cache
+        self._write_sequence = itertools.count(1)
+        self._write_generations = [0] * self.WRITE_GENERATION_SLOTS
+        self._flush_generation = 0
+        self._single_flight = SingleFlight() if coalesce_reads else None
+        self.refresh_workers = refresh_workers
+        self._refresh_executor = None
+        self._refresh_lock = threading.Lock()
+        self._refreshing = set()
+        self.hot_keys = hot_keys
+        self.health_checker = None
         self.set_servers(servers)
+        if health_check_interval is not None:
+            self.health_checker = HealthChecker(self, health_check_interval)
+            self.health_checker.start()
+        if preconnect:
+            unreachable = self.warmup()
+            if unreachable:
+                logger.warning('Could not connect to memcached servers: %s', ', '.join(unreachable))
 
     @property
     def servers(self):
@@ -60,26 +200,440 @@ class ClientMixin(object):
         """
         Iter to a list of servers and instantiate Protocol class.
 
+        Servers can be given a weight, used by `DistributedClient` to send them a
+        proportional share of the keys, as (server, weight) tuples or a dict of
+        server: weight.
+
+        Servers which were already set with the same weight keep their Protocol
+        instance and its open connections; the ones removed are disconnected.
+
         :param servers: A list of servers
-        :type servers: list
+        :type servers: list or dict
         :return: Returns nothing
         :rtype: None
         """
         if isinstance(servers, six.string_types):
             servers = [servers]
+        elif isinstance(servers, dict):
+            servers = list(servers.items())
+        servers = [server if isinstance(server, tuple) else (server, 1) for server in servers]
 
         assert servers, "No memcached servers supplied"
-        self._servers = [Protocol(
-            server=server,
-            username=self.username,
-            password=self.password,
-            compression=self.compression,
-            socket_timeout=self.socket_timeout,
-            pickle_protocol=self.pickle_protocol,
-            pickler=self.pickler,
-            unpickler=self.unpickler,
-            tls_context=self.tls_context,
-        ) for server in servers]
+        for server, weight in servers:
+            if not isinstance(weight, six.integer_types) or weight < 1:
+                raise ValueError('Invalid weight {!r} for server {}'.format(weight, server))
+
+        existing = dict((protocol.server, protocol) for protocol in getattr(self, '_servers', ()))
+        protocols = []
+        for server, weight in servers:
+            protocol = existing.get(server)
+            if protocol is not None and protocol.weight == weight:
+                del existing[server]
+            else:
+                protocol = Protocol(
+                    server=server,
+                    username=self.username,
+                    password=self.password,
+                    compression=self.compression,
+                    socket_timeout=self.socket_timeout,
+                    connect_timeout=self.connect_timeout,
+                    pickle_protocol=self.pickle_protocol,
+                    out_of_band_pickling=self.out_of_band_pickling,
+                    pickler=self.pickler,
+                    unpickler=self.unpickler,
+                    tls_context=self.tls_context,
+                    tls_sessions=self.tls_sessions,
+                    tcp_nodelay=self.tcp_nodelay,
+                    tcp_keepalive=self.tcp_keepalive,
+                    send_buffer_size=self.send_buffer_size,
+                    recv_buffer_size=self.recv_buffer_size,
+                    weight=weight,
+                    health_monitor=self._health_monitor(),
+                    # Created here so its delays are shared by this client's threads only.
+                    breaker=protocol.breaker if protocol is not None else shared_breaker(server),
+                )
+            protocols.append(protocol)
+
+        self._servers = protocols
+        removed = list(existing.values())
+        for protocol in removed:
+            protocol.disconnect()
+        self._servers_changed(removed)
+
+    def add_server(self, server, weight=1):
+        """
+        Add a server, or change its weight, keeping the connections to the others.
+
+        New servers are appended; a server already set keeps its position, which
+        `jump` routing depends on.
+
+        :param server: Server with ip[:port] or unix socket.
+        :type server: six.string_types
+        :param weight: Weight of the server.
+        :type weight: int
+        :return: Returns nothing
+        :rtype: None
+        """
+        servers = [(protocol.server, weight if protocol.server == server else protocol.weight)
+                   for protocol in self._servers]
+        if not any(protocol.server == server for protocol in self._servers):
+            servers.append((server, weight))
+        self.set_servers(servers)
+
+    def remove_server(self, server):
+        """
+        Remove a server, keeping the connections to the others.
+
+        :param server: Server with ip[:port] or unix socket.
+        :type server: six.string_types
+        :return: Returns nothing
+        :rtype: None
+        :raises ValueError: If the server is not set.
+        """
+        servers = [(protocol.server, protocol.weight) for protocol in self._servers if protocol.server != server]
+        if len(servers) == len(self._servers):
+            raise ValueError('Unknown server {}'.format(server))
+        self.set_servers(servers)
+
+    def _servers_changed(self, removed):
+        """
+        Called once the servers were set, with the Protocol instances no longer used.
+        """
+
+    def _health_changed(self):
+        """
+        Called by the health checker when a server goes down or comes back up.
+        """
+
+    def _read_servers(self):
+        """
+        Return the servers in the order reads should try them: the ones up first, the
+        fastest first, when a health checker is running.
+        """
+        checker = self.health_checker
+        if checker is None:
+            return self._servers
+        return sorted(self._servers, key=lambda server: (checker.is_down(server.server),
+                                                         checker.rtt(server.server) or 0))
+
+    def _health_monitor(self):
+        """
+        Return the object told about the servers' connection errors and responses, if any.
+        """
+        return None
+
+    def _store_large_values(self, mappings, time, compress_level):
+        """
+        Serialize values and write the chunks of the ones bigger than max_value_size.
+
+        :param mappings: A dict with keys/values. Keys may be (key, cas) tuples.
+        :type mappings: dict
+        :param time: Time in seconds that the chunks will expire.
+        :type time: int
+        :param compress_level: How much to compress.
+        :type compress_level: int
+        :return: A (mappings, failed) tuple. mappings holds what must be stored under
+            each key, either the serialized value or its chunk manifest, and failed
+            lists the keys whose chunks could not be written.
+        :rtype: tuple
+        """
+        protocol = self._servers[0]
+        stored = {}
+        chunks = {}
+        manifests = {}
+        for key, value in mappings.items():
+            flags, data = protocol.serialize(value, compress_level=compress_level)
+            if len(data) <= self.max_value_size:
+                stored[key] = Serialized(flags, data)
+                continue
+
+            manifest, values = ChunkManifest.split(flags, data, self.max_value_size)
+            chunk_keys = manifest.chunk_keys(key[0] if isinstance(key, tuple) else key)
+            chunks.update(zip(chunk_keys, values))
+            manifests[key] = manifest, chunk_keys
+
+        failed_chunks = self._set_chunks(chunks, time) if chunks else set()
+        failed = []
+        orphans = []
+        for key, (manifest, chunk_keys) in manifests.items():
+            if failed_chunks.intersection(chunk_keys):
+                failed.append(key)
+                orphans.extend(k for k in chunk_keys if k not in failed_chunks)
+            else:
+                stored[key] = manifest
+
+        if orphans:
+            self._delete_chunks(orphans)
+        return stored, failed
+
+    def _store_large_value(self, key, value, time, compress_level):
+        """
+        Single key version of _store_large_values.
+
+        :return: What must be stored under key, or None if its chunks could not be written.
+        :rtype: object
+        """
+        stored, failed = self._store_large_values({key: value}, time, compress_level)
+        if failed:
+            return None
+        return stored[key]
+
+    def _chunk_manifests(self, keys):
+        """
+        Return a dict of key: ChunkManifest for the keys currently stored as chunks.
+
+        Read before keys are overwritten or deleted, so their chunks can be deleted
+        afterwards; empty unless large_values is enabled.
+
+        :param keys: Keys, which may be (key, cas) tuples.
+        :type keys: Collection
+        :rtype: dict
+        """
+        if not self.large_values or not keys:
+            return {}
+        keys = [key[0] if isinstance(key, tuple) else key for key in keys]
+        return dict((key, value) for key, (value, cas) in self._get_multi(keys).items()
+                    if isinstance(value, ChunkManifest))
+
+    def _release_chunks(self, previous, stored, failed):
+        """
+        Delete the chunks no manifest refers to anymore once keys were written or deleted.
+
+        Those are the chunks of the previous manifests of keys written, and of the new
+        manifests which could not be stored.  Chunks of a value replaced by a concurrent
+        write are left to expire or be evicted.
+
+        :param previous: Manifests returned by `_chunk_manifests` before writing.
+        :type previous: dict
+        :param stored: What was written under each key, as returned by `_store_large_values`.
+        :type stored: dict
+        :param failed: Keys which were not written.
+        :type failed: Collection
+        """
+        failed = set(key[0] if isinstance(key, tuple) else key for key in failed)
+        chunk_keys = []
+        for key, manifest in previous.items():
+            if key not in failed:
+                chunk_keys.extend(manifest.chunk_keys(key))
+        for key, value in stored.items():
+            key = key[0] if isinstance(key, tuple) else key
+            if key in failed and isinstance(value, ChunkManifest):
+                chunk_keys.extend(value.chunk_keys(key))
+        if chunk_keys:
+            self._delete_chunks(chunk_keys)
+
+    def _release_chunk(self, previous, key, value, result):
+        """
+        Single key version of _release_chunks, given the result of the write.
+        """
+        if previous or isinstance(value, ChunkManifest):
+            success = result[0] if isinstance(result, tuple) else result
+            self._release_chunks(previous, {key: value}, () if success else [key])
+
+    def _set_chunks(self, chunks, time):
+        """
+        Write a dict of chunk key: bytes to the servers, returning the set of keys which failed.
+        """
+        raise NotImplementedError()
+
+    def _delete_chunks(self, keys):
+        """
+        Delete chunk keys from the servers.
+        """
+        raise NotImplementedError()
+
+    def _load_large_values(self, results):
+        """
+        Replace chunk manifests by the values they describe.
+
+        Chunks of every manifest are fetched with a single get_multi.  Values with
+        missing or corrupted chunks are removed from the results.
+
+        :param results: A dict with key: (value, cas) items.
+        :type results: dict
+        :return: The results dict.
+        :rtype: dict
+        """
+        manifests = dict((key, value) for key, (value, cas) in results.items() if isinstance(value, ChunkManifest))
+        if not manifests:
+            return results
+
+        chunk_keys = dict((key, manifest.chunk_keys(key)) for key, manifest in manifests.items())
+        chunks = self._get_multi([k for keys in chunk_keys.values() for k in keys])
+        protocol = self._servers[0]
+        for key, manifest in manifests.items():
+            values = [chunks[k][0] for k in chunk_keys[key] if k in chunks]
+            data = manifest.join(values) if len(values) == manifest.count else None
+            if data is None:
+                logger.warning('Chunks of key %r are missing or corrupted', key)
+                del results[key]
+                continue
+            results[key] = protocol.deserialize(data, manifest.flags), results[key][1]
+
+        return results
+
+    def _load_large_value(self, key, value, cas):
+        if not isinstance(value, ChunkManifest):
+            return value, cas
+        return self._load_large_values({key: (value, cas)}).get(key, (None, None))
+
+    def _get(self, key, get_cas=False):
+        """
+        Get (value, cas) for a key straight from the servers.
+
+        get_cas is true when the caller needs a CAS valid for writing back.
+        """
+        raise NotImplementedError()
+
+    def _get_multi(self, keys, get_cas=False):
+        """
+        Get a dict of key: (value, cas) straight from the servers.
+        """
+        raise NotImplementedError()
+
+    def _record_hot_keys(self, keys):
+        """
+        Sample keys into the hot key detector, if any.
+        """
+        if self.hot_keys is not None:
+            self.hot_keys.record(keys)
+
+    def _fetch(self, key, get_cas=False, envelopes=False):
+        """
+        Get (value, cas) for a key, going through the near cache and resolving chunks.
+
+        :param key: Key's name
+        :type key: six.string_types
+        :param get_cas: If true, skip the in-process caches since they do not know CAS values,
+            and do not share the read with concurrent ones.
+        :type get_cas: bool
+        :param envelopes: If true, return envelopes as is instead of the value they wrap.
+        :type envelopes: bool
+        :return: A (value, cas) tuple; (None, None) if the key is not found.
+        :rtype: tuple
+        """
+        self._record_hot_keys([key])
+        near_cache = None if get_cas else self.near_cache
+        negative_cache = None if get_cas else self.negative_cache
+        # A CAS shared from a read which did not need one may come from a hot key replica.
+        single_flight = None if get_cas else self._single_flight
+        value = cas = None
+        if near_cache is not None:
+            value = near_cache.get(key)
+
+        if value is None:
+            if negative_cache is not None and key in negative_cache:
+                return None, None
+
+            # Only needed to fill the caches.
+            tracked = near_cache is not None or negative_cache is not None
+            generation = self._write_generation(key) if tracked else None
+            if single_flight is not None:
+                result = single_flight.do(key, lambda: self._load_large_value(key, *self._get(key, get_cas)))
+                value, cas = result if result is not None else (None, None)
+            else:
+                value, cas = self._load_large_value(key, *self._get(key, get_cas))
+            if value is None:
+                if negative_cache is not None:
+                    self._fill_cache(negative_cache, key, generation)
+            elif near_cache is not None:
+                self._fill_cache(near_cache, key, generation, value)
+
+        if not envelopes and isinstance(value, Envelope):
+            value = value.value
+        return value, cas
+
+    def _fetch_multi(self, keys, get_cas=False, envelopes=False):
+        """
+        Multi key version of _fetch.
+
+        :return: A dict of key: (value, cas) for every key found.
+        :rtype: dict
+        """
+        self._record_hot_keys(keys)
+        d = {}
+        near_cache = None if get_cas else self.near_cache
+        negative_cache = None if get_cas else self.negative_cache
+        # A CAS shared from a read which did not need one may come from a hot key replica.
+        single_flight = None if get_cas else self._single_flight
+        if near_cache is not None:
+            for key in keys:
+                value = near_cache.get(key)
+                if value is not None:
+                    d[key] = value, None
+            keys = [key for key in keys if key not in d]
+        if negative_cache is not None:
+            keys = [key for key in keys if key not in negative_cache]
+        if not keys:
+            return d
+
+        if near_cache is not None or negative_cache is not None:
+            generations = dict((key, self._write_generation(key)) for key in keys)
+        if single_flight is not None:
+            results = single_flight.do_multi(
+                keys, lambda keys: self._load_large_values(self._get_multi(keys, get_cas)))
+        else:
+            results = self._load_large_values(self._get_multi(keys, get_cas))
+        if near_cache is not None:
+            for key, (value, cas) in results.items():
+                self._fill_cache(near_cache, key, generations[key], value)
+        if negative_cache is not None:
+            for key in keys:
+                if key not in results:
+                    self._fill_cache(negative_cache, key, generations[key])
+        d.update(results)
+        if not envelopes:
+            for key, (value, cas) in d.items():
+                if isinstance(value, Envelope):
+                    d[key] = value.value, cas
+        return d
+
+    def _write_generation(self, key):
+        """
+        Return a token which changes whenever key is written through this client.
+
+        Keys share counters, so a token can also change without key being written.
+        """
+        return self._flush_generation, self._write_generations[self._write_slot(key)]
+
+    def _write_slot(self, key):
+        return hash(str_to_bytes(key)) % self.WRITE_GENERATION_SLOTS
+
+    def _fill_cache(self, cache, key, generation, value=None):
+        """
+        Add a value read from the servers to the near cache, or a miss to the negative
+        cache when value is None, unless key was written through this client since
+        generation was taken: the read may have returned what the write replaced, and the
+        write's invalidation may have run already.
+        """
+        if self._write_generation(key) != generation:
+            return
+        if value is None:
+            cache.add(key)
+        else:
+            cache.set(key, value)
+        if self._write_generation(key) != generation:
+            # Written meanwhile, maybe after the invalidation.
+            cache.delete(key)
+
+    def _invalidate(self, keys):
+        """
+        Drop keys written through this client from the in-process caches.
+
+        :param keys: Keys, or (key, cas) tuples, that were written.
+        :type keys: Collection
+        """
+        if self.near_cache is None and self.negative_cache is None:
+            return
+        keys = [key[0] if isinstance(key, tuple) else key for key in keys]
+        # Bumped before invalidating, so concurrent reads either see the new generation
+        # before filling the caches or have their entries invalidated.
+        for key in keys:
+            self._write_generations[self._write_slot(key)] = next(self._write_sequence)
+        for cache in (self.near_cache, self.negative_cache):
+            if cache is not None:
+                for key in keys:
+                    cache.delete(key)
 
     def flush_all(self, time=0):
         """
@@ -94,6 +648,9 @@ class ClientMixin(object):
         for server in self.servers:
             returns.append(server.flush_all(time))
 
+        if self.near_cache is not None:
+            self._flush_generation = next(self._write_sequence)
+            self.near_cache.clear()
         return any(returns)
 
     def stats(self, key=None):
@@ -123,6 +680,247 @@ class ClientMixin(object):
         for server in self.servers:
             server.disconnect()
 
+    def deadline(self, seconds):
+        """
+        Return a context manager bounding the time the calls made in it spend on the
+        servers, in total, instead of per send and receive as `socket_timeout` does::
+
+            with client.deadline(0.05):
+                values = client.get_multi(keys)
+
+        Once it passes, requests not sent yet are skipped and connections waiting for a
+        response are closed, so reads return what they got so far and writes report
+        failures. Deadlines apply to the current thread, whatever the client.
+
+        :param seconds: Time allowed for the calls.
+        :type seconds: float
+        :rtype: contextlib.AbstractContextManager
+        """
+        return deadline.deadline(seconds)
+
+    def warmup(self, timeout=None):
+        """
+        Open and authenticate connections to every server concurrently.
+
+        Connections are otherwise opened one by one on the first request to each server.
+        They are per thread, so this warms up the connections of the calling thread; call
+        it from each thread about to serve requests.
+
+        :param timeout: Seconds to wait for the connections, None to wait for all of them
+            to open or fail, each one being bounded by `socket_timeout`.
+        :type timeout: float
+        :return: Addresses of the servers which could not be connected to in time.
+        :rtype: list
+        """
+        protocols = [protocol for protocol in self._servers if protocol.connection is None]
+        if not protocols:
+            return []
+
+        def connect(protocol):
+            # Runs in a worker thread, which hands its connection over to the caller.
+            try:
+                protocol._open_connection(pipeline_auth=False)
+            except Exception:
+                logger.debug('Warming up the connection to %s failed', protocol.server, exc_info=True)
+                protocol.disconnect()
+            return protocol.detach_connection()
+
+        def close_late(future):
+            connection = future.result()[0]
+            if connection is not None:
+                connection.close()
+
+        executor = ThreadPoolExecutor(len(protocols))
+        try:
+            futures = dict((executor.submit(connect, protocol), protocol) for protocol in protocols)
+            done, not_done = wait_futures(futures, timeout)
+        finally:
+            executor.shutdown(wait=False)
+
+        unreachable = []
+        for future, protocol in futures.items():
+            if future in not_done:
+                # Close the connection if it opens after all.
+                future.add_done_callback(close_late)
+                unreachable.append(protocol.server)
+                continue
+            connection, authenticated = future.result()
+            if connection is None:
+                unreachable.append(protocol.server)
+            else:
+                protocol.attach_connection(connection, authenticated)
+        return unreachable
+
+    def get_or_set(self, key, compute_fn, ttl=0, lease_time=30, wait=1.0, stale_time=0):
+        """
+        Get a key, computing and storing it on a miss while only one caller recomputes it.
+
+        On a miss, callers race to `add` a lease key next to the key. The winner calls
+        `compute_fn`, stores the value and releases the lease if it still holds it. The
+        others return the stale copy of the value if one is kept (see `stale_time`), or
+        poll the key for up to `wait` seconds; if it still is not there they compute the
+        value themselves without storing it.  Callers which could not take the lease and
+        see no lease held, because the server is unreachable, compute it right away.
+
+        A `compute_fn` returning None is cached too.
+
+        :param key: Key's name
+        :type key: six.string_types
+        :param compute_fn: Callable returning the value when the key is missing.
+        :type compute_fn: callable
+        :param ttl: Time in seconds that the value will expire.
+        :type ttl: int
+        :param lease_time: Time in seconds after which a lease whose holder died expires.
+        :type lease_time: int
+        :param wait: Seconds to wait for the lease holder to store the value.
+        :type wait: float
+        :param stale_time: If set, also keep a copy of the value for ttl + stale_time
+            seconds, returned to callers who lose the lease once the value expired.
+        :type stale_time: int
+        :return: The cached or computed value.
+        :rtype: object
+        """
+        value, cas = self._fetch(key, envelopes=True)
+        if value is not None:
+            return _unwrapped(value)
+
+        lease_key = _suffixed(key, ':lease')
+        stale_key = _suffixed(key, ':stale')
+        # Tells this caller's lease from one taken once it expired.
+        token = os.urandom(8)
+        if self.add(lease_key, token, lease_time):
+            try:
+                value = compute_fn()
+                stored = Envelope(None) if value is None else value
+                self.set(key, stored, ttl)
+                if stale_time:
+                    self.set(stale_key, stored, ttl + stale_time if ttl else 0)
+            finally:
+                lease, cas = self._fetch(lease_key, get_cas=True)
+                if lease == token:
+                    self.delete(lease_key, cas)
+            return value
+
+        lease, cas = self._fetch(lease_key, get_cas=True)
+        if lease is None:
+            # Released since, or never taken because the server could not be reached.
+            value, cas = self._fetch(key, get_cas=True, envelopes=True)
+            return compute_fn() if value is None else _unwrapped(value)
+
+        if stale_time:
+            value, cas = self._fetch(stale_key, envelopes=True)
+            if value is not None:
+                return _unwrapped(value)
+
+        give_up_at = time.monotonic() + wait
+        while time.monotonic() < give_up_at:
+            time.sleep(0.05)
+            value, cas = self._fetch(key, get_cas=True, envelopes=True)
+            if value is not None:
+                return _unwrapped(value)
+
+        return compute_fn()
+
+    def fetch(self, key, compute_fn, ttl=0, beta=1.0):
+        """
+        Get a key, recomputing it with probabilistic early expiration (XFetch).
+
+        Values are stored in an envelope holding how long they took to compute and when
+        they logically expire. Each read recomputes the value early with a probability
+        that grows as expiry approaches, scaled by the compute time, so refreshes of a
+        popular key are spread over time instead of all happening when it expires.
+        Plain `get` returns the wrapped value.
+
+        :param key: Key's name
+        :type key: six.string_types
+        :param compute_fn: Callable returning the value.
+        :type compute_fn: callable
+        :param ttl: Time in seconds that the value will expire.
+        :type ttl: int
+        :param beta: Above 1.0 favours earlier recomputation, below 1.0 later.
+        :type beta: float
+        :return: The cached or computed value.
+        :rtype: object
+        """
+        envelope, cas = self._fetch(key, envelopes=True)
+        if envelope is not None:
+            if not isinstance(envelope, Envelope):
+                return envelope
+            # 1 - random() is in (0, 1], so log() is always defined and <= 0.
+            early = -envelope.delta * beta * math.log(1.0 - random.random())
+            if not envelope.expires_at or time.time() + early < envelope.expires_at:
+                return envelope.value
+
+        start = time.monotonic()
+        value = compute_fn()
+        delta = time.monotonic() - start
+        self.set(key, Envelope(value, time.time() + ttl if ttl else 0, delta), ttl)
+        return value
+
+    def get_swr(self, key, compute_fn, soft_ttl, hard_ttl, lease_time=30):
+        """
+        Get a key in stale-while-revalidate mode.
+
+        Values are stored in an envelope carrying a soft expiry, while memcached keeps
+        them until the longer hard expiry. Past the soft expiry the stale value is
+        returned immediately and a single background refresh is scheduled: at most one
+        per key in this process, and across processes only the caller winning an `add`
+        based lease recomputes. The value is only computed inline when it is missing.
+
+        :param key: Key's name
+        :type key: six.string_types
+        :param compute_fn: Callable returning the value.
+        :type compute_fn: callable
+        :param soft_ttl: Seconds after which the value is refreshed in the background.
+        :type soft_ttl: int
+        :param hard_ttl: Seconds after which memcached drops the value.
+        :type hard_ttl: int
+        :param lease_time: Time in seconds after which a lease whose holder died expires.
+        :type lease_time: int
+        :return: The cached, possibly stale, or computed value.
+        :rtype: object
+        """
+        envelope, cas = self._fetch(key, envelopes=True)
+        if envelope is None:
+            return self._compute_envelope(key, compute_fn, soft_ttl, hard_ttl)
+        if not isinstance(envelope, Envelope):
+            return envelope
+
+        if envelope.expires_at and time.time() >= envelope.expires_at:
+            self._schedule_refresh(key, compute_fn, soft_ttl, hard_ttl, lease_time)
+        return envelope.value
+
+    def _compute_envelope(self, key, compute_fn, soft_ttl, hard_ttl):
+        start = time.monotonic()
+        value = compute_fn()
+        delta = time.monotonic() - start
+        self.set(key, Envelope(value, time.time() + soft_ttl, delta), hard_ttl)
+        return value
+
+    def _schedule_refresh(self, key, compute_fn, soft_ttl, hard_ttl, lease_time):
+        refresh_key = str_to_bytes(key)
+        with self._refresh_lock:
+            if refresh_key in self._refreshing:
+                return
+            self._refreshing.add(refresh_key)
+            if self._refresh_executor is None:
+                self._refresh_executor = ThreadPoolExecutor(self.refresh_workers)
+        self._refresh_executor.submit(self._refresh, key, compute_fn, soft_ttl, hard_ttl, lease_time)
+
+    def _refresh(self, key, compute_fn, soft_ttl, hard_ttl, lease_time):
+        lease_key = _suffixed(key, ':lease')
+        try:
+            if self.add(lease_key, 1, lease_time):
+                try:
+                    self._compute_envelope(key, compute_fn, soft_ttl, hard_ttl)
+                finally:
+                    self.delete(lease_key)
+        except Exception:
+            logger.exception('Background refresh of key %r failed', key)
+        finally:
+            with self._refresh_lock:
+                self._refreshing.discard(str_to_bytes(key))
+
     def get(self, key, default=None, get_cas=False):
         raise NotImplementedError()
 
@@ -0,0 +1,156 @@
+from collections import OrderedDict
+import sys
+import threading
+import time
+
+import six
+
+from bmemcached.sketch import CountMinSketch
+from bmemcached.utils import str_to_bytes
+
+__all__ = ('NearCache', )
+
+
+class NearCache(object):
+    """
+    Bounded in-process cache placed in front of memcached.
+
+    Hits are served without any network I/O.  Entries expire after `ttl` seconds, which
+    bounds how stale a value can get when another process changes it, and local writes
+    through the client invalidate the key immediately.
+
+    Values are kept as the objects returned to the caller, so they must not be mutated.
+
+    :param max_items: Maximum number of entries.
+    :type max_items: int
+    :param max_bytes: Maximum total size of the entries. Sizes are exact for bytes and
+        strings and a shallow estimate for other objects.
+    :type max_bytes: int
+    :param ttl: Seconds an entry is served before it must be fetched again.
+    :type ttl: float
+    :param policy: `lru` evicts the least recently used entry.  `tinylfu` also evicts
+        in LRU order but only admits a new entry when it was requested more often than
+        the entry it would evict, so a scan of cold keys cannot flush hot ones.
+    :type policy: str
+    """
+    POLICIES = ('lru', 'tinylfu')
+
+    def __init__(self, max_items=1024, max_bytes=16 * 1024 * 1024, ttl=5, policy='lru'):
+        if policy not in self.POLICIES:
+            raise ValueError('Unknown eviction policy {!r}'.format(policy))
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.policy = policy
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self._sketch = None
+        if policy == 'tinylfu':
+            self._sketch = CountMinSketch(width=max(max_items * 4, 64), sample_size=max_items * 10, max_count=15)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _sizeof(value):
+        if isinstance(value, (six.binary_type, six.text_type, bytearray)):
+            return len(value)
+        return sys.getsizeof(value)
+
+    def get(self, key):
+        """
+        Return the cached value for key or None if it is not cached.
+
+        :param key: Key's name
+        :type key: six.string_types
+        :rtype: object
+        """
+        key = str_to_bytes(key)
+        with self._lock:
+            if self._sketch is not None:
+                self._sketch.add(key)
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, size, expires_at = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                self._remove(key)
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        """
+        Cache a value fetched from the server.
+
+        :param key: Key's name
+        :type key: six.string_types
+        :param value: Value to be cached.
+        :type value: object
+        :return: True if the value was admitted.
+        :rtype: bool
+        """
+        key = str_to_bytes(key)
+        size = self._sizeof(value)
+        if size > self.max_bytes:
+            return False
+
+        with self._lock:
+            self._remove(key)
+            while self._entries and (len(self._entries) >= self.max_items or self._bytes + size > self.max_bytes):
+                victim = next(iter(self._entries))
+                if self._sketch is not None and self._sketch.estimate(key) <= self._sketch.estimate(victim):
+                    return False
+                self._remove(victim)
+                self.evictions += 1
+
+            self._entries[key] = value, size, time.monotonic() + self.ttl
+            self._bytes += size
+            return True
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[1]
+
+    def delete(self, key):
+        """
+        Invalidate a key.
+
+        :param key: Key's name
+        :type key: six.string_types
+        """
+        key = str_to_bytes(key)
+        with self._lock:
+            self._remove(key)
+
+    def clear(self):
+        """
+        Invalidate every key.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """
+        Return cache statistics.
+
+        :return: A dict with hits, misses, hit_ratio, evictions, items and bytes.
+        :rtype: dict
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': float(self.hits) / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'items': len(self._entries),
+                'bytes': self._bytes,
+            }
@@ -0,0 +1,90 @@
+from collections import OrderedDict
+import threading
+import time
+
+from bmemcached.utils import str_to_bytes
+
+__all__ = ('NegativeCache', )
+
+
+class NegativeCache(object):
+    """
+    Bounded set of keys recently found missing on the servers.
+
+    While a key is in the set, reads through the client answer it as missing without
+    a round trip.  Entries expire after a short `ttl`, which bounds how long a value
+    written by another process stays invisible, and local writes through the client
+    remove the key immediately.
+
+    :param max_items: Maximum number of keys remembered; the oldest are dropped first.
+    :type max_items: int
+    :param ttl: Seconds a miss is remembered.
+    :type ttl: float
+    """
+    def __init__(self, max_items=10000, ttl=1):
+        self.max_items = max_items
+        self.ttl = ttl
+        self._keys = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, key):
+        key = str_to_bytes(key)
+        with self._lock:
+            expires_at = self._keys.get(key)
+            if expires_at is not None:
+                if expires_at > time.monotonic():
+                    self.hits += 1
+                    return True
+                del self._keys[key]
+            self.misses += 1
+            return False
+
+    def add(self, key):
+        """
+        Remember that a key is missing.
+
+        :param key: Key's name
+        :type key: six.string_types
+        """
+        key = str_to_bytes(key)
+        with self._lock:
+            self._keys.pop(key, None)
+            self._keys[key] = time.monotonic() + self.ttl
+            while len(self._keys) > self.max_items:
+                self._keys.popitem(last=False)
+
+    def delete(self, key):
+        """
+        Forget a key, because it was written.
+
+        :param key: Key's name
+        :type key: six.string_types
+        """
+        key = str_to_bytes(key)
+        with self._lock:
+            self._keys.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._keys.clear()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def stats(self):
+        """
+        Return cache statistics.
+
+        :return: A dict with hits (misses answered locally), misses, hit_ratio and items.
+        :rtype: dict
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': float(self.hits) / lookups if lookups else 0.0,
+                'items': len(self._keys),
+            }
@@ -0,0 +1,191 @@
+from collections import defaultdict
+import logging
+import threading
+import time
+
+from bmemcached.client.distributed import DistributedClient
+
+__all__ = ('RefreshAhead', )
+
+logger = logging.getLogger(__name__)
+
+
+class _Entry(object):
+    def __init__(self, key, loader, ttl, due):
+        self.key = key
+        self.loader = loader
+        self.ttl = ttl
+        self.due = due
+        self.next_attempt = due
+
+
+class RefreshAhead(object):
+    """
+    Keeps a small set of registered keys populated by refreshing them before they expire.
+
+    Every registered key has a loader and a TTL.  A background thread reloads the key once
+    `refresh_ratio` of its TTL has elapsed and writes it back with `set_multi`, batching
+    the keys due at the same time per TTL and, for a `DistributedClient`, per server, so
+    readers never see the key missing.
+
+    The lag of a refresh is how late it ran compared to when it was due; it grows when the
+    loaders are slower than `interval` or the thread is starved.
+
+    :param client: The client used to store the values.
+    :type client: bmemcached.client.mixin.ClientMixin
+    :param interval: Seconds between two checks for keys to refresh.
+    :type interval: float
+    :param refresh_ratio: Fraction of the TTL after which a key is refreshed.
+    :type refresh_ratio: float
+    """
+    def __init__(self, client, interval=1.0, refresh_ratio=0.75):
+        if not 0 < refresh_ratio < 1:
+            raise ValueError('refresh_ratio must be between 0 and 1')
+        self.client = client
+        self.interval = interval
+        self.refresh_ratio = refresh_ratio
+        self._entries = {}
+        self._condition = threading.Condition()
+        self._thread = None
+        self._stopped = False
+        self._refreshes = 0
+        self._failures = 0
+        self._last_lag = 0.0
+        self._max_lag = 0.0
+        self._total_lag = 0.0
+
+    def register(self, key, loader, ttl):
+        """
+        Register a key to be kept populated. It is loaded on the next check.
+
+        :param key: Key's name
+        :type key: six.string_types
+        :param loader: Callable returning the key's value.
+        :type loader: callable
+        :param ttl: Time in seconds the value is stored for.
+        :type ttl: int
+        """
+        if ttl <= 0:
+            raise ValueError('Refreshed keys need a positive TTL')
+        with self._condition:
+            self._entries[key] = _Entry(key, loader, ttl, time.monotonic())
+            self._condition.notify()
+
+    def unregister(self, key):
+        """
+        Stop refreshing a key. The stored value is left to expire.
+
+        :param key: Key's name
+        :type key: six.string_types
+        """
+        with self._condition:
+            self._entries.pop(key, None)
+
+    def start(self):
+        """Start the background thread refreshing the registered keys."""
+        with self._condition:
+            if self._thread is not None:
+                return
+            self._stopped = False
+            self._thread = threading.Thread(target=self._run, name='bmemcached-refresh-ahead')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        """Stop the background thread and wait for the current check to finish."""
+        with self._condition:
+            thread = self._thread
+            self._thread = None
+            self._stopped = True
+            self._condition.notify()
+        if thread is not None:
+            thread.join()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if self._stopped:
+                    return
+                now = time.monotonic()
+                due = min([entry.next_attempt for entry in self._entries.values()] or [now + self.interval])
+                if due > now:
+                    self._condition.wait(min(due - now, self.interval))
+                    continue
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception('Refresh-ahead check failed')
+
+    def refresh(self):
+        """
+        Refresh every registered key which is due now.
+
+        :return: Number of keys refreshed.
+        :rtype: int
+        """
+        now = time.monotonic()
+        with self._condition:
+            entries = [entry for entry in self._entries.values() if entry.next_attempt <= now]
+
+        batches = defaultdict(dict)
+        for entry in entries:
+            try:
+                value = entry.loader()
+            except Exception:
+                logger.exception('Loading refreshed key %r failed', entry.key)
+                self._failed(entry, now)
+                continue
+            batches[(self._shard(entry.key), entry.ttl)][entry.key] = (entry, value)
+
+        refreshed = 0
+        for (shard, ttl), batch in batches.items():
+            try:
+                failed = set(self.client.set_multi(
+                    dict((key, value) for key, (entry, value) in batch.items()), ttl))
+            except Exception:
+                logger.exception('Storing refreshed keys failed')
+                failed = set(batch)
+            for key, (entry, value) in batch.items():
+                if key in failed:
+                    self._failed(entry, now)
+                else:
+                    self._refreshed(entry, now)
+                    refreshed += 1
+        return refreshed
+
+    def _shard(self, key):
+        if isinstance(self.client, DistributedClient):
+            return self.client._get_server(key)
+        return None
+
+    def _refreshed(self, entry, now):
+        lag = now - entry.due
+        with self._condition:
+            entry.due = entry.next_attempt = now + entry.ttl * self.refresh_ratio
+            self._refreshes += 1
+            self._last_lag = lag
+            self._max_lag = max(self._max_lag, lag)
+            self._total_lag += lag
+
+    def _failed(self, entry, now):
+        # Retry after an interval, leaving the due time alone so the lag keeps growing.
+        with self._condition:
+            entry.next_attempt = now + self.interval
+            self._failures += 1
+
+    def stats(self):
+        """
+        Return refresh counters and lag, in seconds.
+
+        :return: A dict with keys, refreshes, failures, last_lag, max_lag and avg_lag.
+        :rtype: dict
+        """
+        with self._condition:
+            return {
+                'keys': len(self._entries),
+                'refreshes': self._refreshes,
+                'failures': self._failures,
+                'last_lag': self._last_lag,
+                'max_lag': self._max_lag,
+                'avg_lag': self._total_lag / self._refreshes if self._refreshes else 0.0,
+            }
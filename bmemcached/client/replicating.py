@@ -1,6 +1,18 @@
+from concurrent.futures import ThreadPoolExecutor
+import re
+import socket
+import threading
+import time
 import warnings
+import weakref
 
+import six
+
+from bmemcached import deadline
+from bmemcached.client.constants import MAX_VALUE_SIZE, PICKLE_PROTOCOL, SOCKET_TIMEOUT, TCP_KEEPALIVE
+from bmemcached.client.hedging import LatencyTracker
 from bmemcached.client.mixin import ClientMixin
+from bmemcached.compat import pickle
 
 
 class ReplicatingClient(ClientMixin):
@@ -27,7 +39,56 @@ class ReplicatingClient(ClientMixin):
 
         If you need CAS semantics, configure this client with exactly one
         server (or use :class:`DistributedClient`).
+
+    With `hedge_after` set, `get` reads from the first server and, if it has not answered
+    within that delay, from the other servers too, using whichever value comes first.  The
+    first server is read from the calling thread; the hedge is made from a pool of
+    `hedge_workers` threads, with their own connections, and is put off while they are all
+    busy.  The calling thread's connection to a server beaten by a hedge is closed, since
+    its response was not read.
+
+    :param hedge_after: Seconds after which a read is sent to the next server too, or a
+        percentile of the first server's recent read latencies such as `'p95'`; until
+        enough reads were timed, `DEFAULT_HEDGE_DELAY` is used. None disables hedging.
+    :type hedge_after: float or str
+    :param hedge_workers: Number of threads making hedged reads, and of hedges in flight.
+    :type hedge_workers: int
     """
+    # Hedging delay used while too few reads were timed for a percentile.
+    DEFAULT_HEDGE_DELAY = 0.05
+
+    def __init__(self, servers=('127.0.0.1:11211',), username=None, password=None, compression=None,
+                 socket_timeout=SOCKET_TIMEOUT, pickle_protocol=PICKLE_PROTOCOL, pickler=pickle.Pickler,
+                 unpickler=pickle.Unpickler, tls_context=None, large_values=False, max_value_size=MAX_VALUE_SIZE,
+                 near_cache=None, negative_cache=None, coalesce_reads=False, refresh_workers=2, hot_keys=None,
+                 health_check_interval=None, preconnect=False, tcp_nodelay=True, tcp_keepalive=TCP_KEEPALIVE,
+                 send_buffer_size=None, recv_buffer_size=None, connect_timeout=None, hedge_after=None,
+                 hedge_workers=8, out_of_band_pickling=False):
+        self._hedge_percentile = None
+        if isinstance(hedge_after, six.string_types):
+            match = re.match(r'^p(\d+(\.\d+)?)$', hedge_after)
+            if not match or not 0 < float(match.group(1)) < 100:
+                raise ValueError('Invalid hedge_after {!r}'.format(hedge_after))
+            self._hedge_percentile = float(match.group(1))
+        elif hedge_after is not None and hedge_after < 0:
+            raise ValueError('Invalid hedge_after {!r}'.format(hedge_after))
+        self.hedge_after = hedge_after
+        self.hedge_workers = hedge_workers
+        self.latencies = LatencyTracker()
+        self._hedge_executor = None
+        self._hedges = 0
+        self._hedge_lock = threading.Lock()
+        self._hedge_local = threading.local()
+        super(ReplicatingClient, self).__init__(servers, username, password, compression, socket_timeout,
+                                                pickle_protocol, pickler, unpickler, tls_context,
+                                                large_values=large_values, max_value_size=max_value_size,
+                                                near_cache=near_cache, negative_cache=negative_cache,
+                                                coalesce_reads=coalesce_reads, refresh_workers=refresh_workers,
+                                                hot_keys=hot_keys, health_check_interval=health_check_interval,
+                                                preconnect=preconnect, tcp_nodelay=tcp_nodelay,
+                                                tcp_keepalive=tcp_keepalive, send_buffer_size=send_buffer_size,
+                                                recv_buffer_size=recv_buffer_size, connect_timeout=connect_timeout,
+                                                out_of_band_pickling=out_of_band_pickling)
 
     def _warn_multi_replica_cas(self, op, hazard):
         if len(self._servers) > 1:
@@ -48,15 +109,144 @@ class ReplicatingClient(ClientMixin):
 
         The first reconnection attempt will always happen immediately, so intermittent network
         errors don't cause caching to turn off.  The retry delay takes effect after the first
-        reconnection fails.
+        reconnection fails: 5 seconds, doubling with each further failure up to a minute, with
+        some jitter so clients don't all come back at once.  See
+        `bmemcached.circuit_breaker.CircuitBreaker`.
 
         The reconnection delay is enabled by default for TCP connections, and disabled by
         default for Unix socket connections.
         """
-        # The public API only allows enabling or disabling the delay, so it'll be easier to
-        # add exponential falloff in the future.  _set_retry_delay is exposed for tests.
+        # _set_retry_delay, which sets the first delay, is exposed for tests.
         self._set_retry_delay(5 if enable else 0)
 
+    def _get(self, key, get_cas=False):
+        servers = self._read_servers()
+        if self.hedge_after is not None and len(servers) > 1:
+            return self._get_hedged(key, servers)
+        for server in servers:
+            value, cas = server.get(key)
+            if value is not None:
+                return value, cas
+        return None, None
+
+    def _hedge_delay(self, server):
+        if self._hedge_percentile is None:
+            return self.hedge_after
+        delay = self.latencies.percentile(server.server, self._hedge_percentile)
+        return self.DEFAULT_HEDGE_DELAY if delay is None else delay
+
+    def _read_get(self, server, start):
+        result = server.read_get()
+        self.latencies.record(server.server, time.monotonic() - start)
+        return result
+
+    def _timed_get(self, key, servers):
+        for server in servers:
+            start = time.monotonic()
+            server.send_get(key)
+            value, cas = self._read_get(server, start)
+            if value is not None:
+                return value, cas
+        return None, None
+
+    def _hedge(self, key, servers, left):
+        # Runs in a hedging thread, under the caller's deadline if any.
+        try:
+            if left is None:
+                return self._timed_get(key, servers)
+            with deadline.deadline(left):
+                return self._timed_get(key, servers)
+        finally:
+            with self._hedge_lock:
+                self._hedges -= 1
+
+    def _reserve_hedge(self):
+        with self._hedge_lock:
+            if self._hedges >= self.hedge_workers:
+                return False
+            if self._hedge_executor is None:
+                self._hedge_executor = ThreadPoolExecutor(self.hedge_workers)
+            self._hedges += 1
+            return True
+
+    def _wakeup_sockets(self):
+        """
+        Return this thread's pair of sockets used by hedging threads to wake it up, with
+        anything written to them before read.
+        """
+        wakeup = getattr(self._hedge_local, 'wakeup', None)
+        if wakeup is None:
+            wakeup = self._hedge_local.wakeup = _Wakeup()
+        _drain(wakeup.reader)
+        return wakeup.reader, wakeup.writer
+
+    def disconnect_all(self):
+        super(ReplicatingClient, self).disconnect_all()
+        wakeup = getattr(self._hedge_local, 'wakeup', None)
+        if wakeup is not None:
+            del self._hedge_local.wakeup
+            wakeup.close()
+
+    def _get_hedged(self, key, servers):
+        """
+        Read a key from the first server and, if it is slower than its hedging delay, from
+        the other servers from a hedging thread meanwhile.
+        """
+        first, others = servers[0], servers[1:]
+        start = time.monotonic()
+        first.send_get(key)
+        delay = self._hedge_delay(first)
+        while True:
+            left = deadline.remaining()
+            if (left is not None and left <= delay) or first.wait_for_response(delay):
+                value, cas = self._read_get(first, start)
+                if value is not None:
+                    return value, cas
+                return self._timed_get(key, others)
+            # While every hedging thread is busy, keep waiting for the first server.
+            if self._reserve_hedge():
+                break
+
+        # Slower than its delay: ask the other servers too, and wait for whichever answers.
+        reader, writer = self._wakeup_sockets()
+        hedge = self._hedge_executor.submit(self._hedge, key, others, deadline.remaining())
+        hedge.add_done_callback(lambda future: _wake(writer))
+        first_missed = False
+        while not hedge.done():
+            if first.wait_for_response(None, reader):
+                value, cas = self._read_get(first, start)
+                if value is not None:
+                    self.latencies.record_hedge(False)
+                    return value, cas
+                first_missed = True
+                break
+            _drain(reader)
+
+        value, cas = hedge.result()
+        if not first_missed:
+            if value is None:
+                # Only the first server may still have it.
+                value, cas = self._read_get(first, start)
+                self.latencies.record_hedge(False)
+                return value, cas
+            if first.wait_for_response(0):
+                self._read_get(first, start)
+            else:
+                # Its response won't be read, so the connection can't be used anymore.
+                self.latencies.record(first.server, time.monotonic() - start)
+                first.disconnect()
+        self.latencies.record_hedge(value is not None)
+        return value, cas
+
+    def _get_multi(self, keys, get_cas=False):
+        d = {}
+        for server in self._read_servers():
+            d.update(server.get_multi(keys))
+            keys = [_ for _ in keys if _ not in d]
+            if not keys:
+                break
+        return d
+
     def get(self, key, default=None, get_cas=False):
         """
         Get a key from server.
@@ -80,13 +270,12 @@ class ReplicatingClient(ClientMixin):
                 "get(get_cas=True)",
                 "returns a CAS that cannot be safely passed back to cas() on this client",
             )
-        for server in self.servers:
-            value, cas = server.get(key)
-            if value is not None:
-                if get_cas:
-                    return value, cas
-                else:
-                    return value
+        value, cas = self._fetch(key, get_cas)
+        if value is not None:
+            if get_cas:
+                return value, cas
+            else:
+                return value
         if default is not None:
             if get_cas:
                 return default, None
@@ -115,11 +304,7 @@ class ReplicatingClient(ClientMixin):
             "gets()",
             "returns a CAS that cannot be safely passed back to cas() on this client",
         )
-        for server in self.servers:
-            value, cas = server.get(key)
-            if value is not None:
-                return value, cas
-        return None, None
+        return self._fetch(key, get_cas=True)
 
     def get_multi(self, keys, get_cas=False):
         """
@@ -146,16 +331,11 @@ class ReplicatingClient(ClientMixin):
             )
         d = {}
         if keys:
-            for server in self.servers:
-                results = server.get_multi(keys)
-                if not get_cas:
-                    # Remove CAS data
-                    for key, (value, cas) in results.items():
-                        results[key] = value
-                d.update(results)
-                keys = [_ for _ in keys if _ not in d]
-                if not keys:
-                    break
+            d = self._fetch_multi(keys, get_cas)
+            if not get_cas:
+                # Remove CAS data
+                for key, (value, cas) in d.items():
+                    d[key] = value
         return d
 
     def set(self, key, value, time=0, compress_level=-1, get_cas=False):
@@ -183,17 +363,28 @@ class ReplicatingClient(ClientMixin):
         :raises NotImplementedError: if get_cas=True and more than one
             server is configured.
         """
+        if get_cas and len(self._servers) > 1:
+            raise NotImplementedError(
+                "get_cas=True is not supported on ReplicatingClient with "
+                "more than one server."
+            )
+        self._record_hot_keys([key])
+        previous = self._chunk_manifests([key])
+        if self.large_values:
+            value = self._store_large_value(key, value, time, compress_level)
+            if value is None:
+                return (False, None) if get_cas else False
         if get_cas:
-            if len(self._servers) > 1:
-                raise NotImplementedError(
-                    "get_cas=True is not supported on ReplicatingClient with "
-                    "more than one server."
-                )
-            return self._servers[0].set(key, value, time, compress_level=compress_level, get_cas=True)
+            result = self._servers[0].set(key, value, time, compress_level=compress_level, get_cas=True)
+            self._invalidate([key])
+            self._release_chunk(previous, key, value, result)
+            return result
 
         returns = []
         for server in self.servers:
             returns.append(server.set(key, value, time, compress_level=compress_level))
+        self._invalidate([key])
+        self._release_chunk(previous, key, value, any(returns))
         return any(returns)
 
     def cas(self, key, value, cas, time=0, compress_level=-1, get_cas=False):
@@ -229,13 +420,21 @@ class ReplicatingClient(ClientMixin):
         :raises NotImplementedError: if get_cas=True and more than one
             server is configured.
         """
+        if get_cas and len(self._servers) > 1:
+            raise NotImplementedError(
+                "get_cas=True is not supported on ReplicatingClient with "
+                "more than one server."
+            )
+        previous = self._chunk_manifests([key])
+        if self.large_values:
+            value = self._store_large_value(key, value, time, compress_level)
+            if value is None:
+                return (False, None) if get_cas else False
         if get_cas:
-            if len(self._servers) > 1:
-                raise NotImplementedError(
-                    "get_cas=True is not supported on ReplicatingClient with "
-                    "more than one server."
-                )
-            return self._servers[0].cas(key, value, cas, time, compress_level=compress_level, get_cas=True)
+            result = self._servers[0].cas(key, value, cas, time, compress_level=compress_level, get_cas=True)
+            self._invalidate([key])
+            self._release_chunk(previous, key, value, result)
+            return result
 
         self._warn_multi_replica_cas(
             "cas()",
@@ -244,6 +443,8 @@ class ReplicatingClient(ClientMixin):
         returns = []
         for server in self.servers:
             returns.append(server.cas(key, value, cas, time, compress_level=compress_level))
+        self._invalidate([key])
+        self._release_chunk(previous, key, value, any(returns))
         return any(returns)
 
     def set_multi(self, mappings, time=0, compress_level=-1):
@@ -273,9 +474,15 @@ class ReplicatingClient(ClientMixin):
                 "will silently diverge replicas for those entries: at most one server can match a given CAS",
             )
         returns = set()
+        previous = self._chunk_manifests(mappings)
+        if mappings and self.large_values:
+            mappings, failed = self._store_large_values(mappings, time, compress_level)
+            returns.update(failed)
         if mappings:
             for server in self.servers:
                 returns |= set(server.set_multi(mappings, time, compress_level=compress_level))
+            self._invalidate(mappings)
+            self._release_chunks(previous, mappings, returns)
 
         return list(returns)
 
@@ -309,7 +516,15 @@ class ReplicatingClient(ClientMixin):
             )
         if not mappings:
             return {}
-        return self._servers[0].set_multi_cas(mappings, time, compress_level=compress_level)
+        result = {}
+        previous = self._chunk_manifests(mappings)
+        if self.large_values:
+            mappings, failed = self._store_large_values(mappings, time, compress_level)
+            result.update((key[0] if isinstance(key, tuple) else key, None) for key in failed)
+        result.update(self._servers[0].set_multi_cas(mappings, time, compress_level=compress_level))
+        self._invalidate(mappings)
+        self._release_chunks(previous, mappings, [key for key, cas in result.items() if cas is None])
+        return result
 
     def add(self, key, value, time=0, compress_level=-1, get_cas=False):
         """
@@ -336,17 +551,26 @@ class ReplicatingClient(ClientMixin):
         :raises NotImplementedError: if get_cas=True and more than one
             server is configured.
         """
+        if get_cas and len(self._servers) > 1:
+            raise NotImplementedError(
+                "get_cas=True is not supported on ReplicatingClient with "
+                "more than one server."
+            )
+        if self.large_values:
+            value = self._store_large_value(key, value, time, compress_level)
+            if value is None:
+                return (False, None) if get_cas else False
         if get_cas:
-            if len(self._servers) > 1:
-                raise NotImplementedError(
-                    "get_cas=True is not supported on ReplicatingClient with "
-                    "more than one server."
-                )
-            return self._servers[0].add(key, value, time, compress_level=compress_level, get_cas=True)
+            result = self._servers[0].add(key, value, time, compress_level=compress_level, get_cas=True)
+            self._invalidate([key])
+            self._release_chunk({}, key, value, result)
+            return result
 
         returns = []
         for server in self.servers:
             returns.append(server.add(key, value, time, compress_level=compress_level))
+        self._invalidate([key])
+        self._release_chunk({}, key, value, any(returns))
         return any(returns)
 
     def replace(self, key, value, time=0, compress_level=-1, get_cas=False):
@@ -374,17 +598,27 @@ class ReplicatingClient(ClientMixin):
         :raises NotImplementedError: if get_cas=True and more than one
             server is configured.
         """
+        if get_cas and len(self._servers) > 1:
+            raise NotImplementedError(
+                "get_cas=True is not supported on ReplicatingClient with "
+                "more than one server."
+            )
+        previous = self._chunk_manifests([key])
+        if self.large_values:
+            value = self._store_large_value(key, value, time, compress_level)
+            if value is None:
+                return (False, None) if get_cas else False
         if get_cas:
-            if len(self._servers) > 1:
-                raise NotImplementedError(
-                    "get_cas=True is not supported on ReplicatingClient with "
-                    "more than one server."
-                )
-            return self._servers[0].replace(key, value, time, compress_level=compress_level, get_cas=True)
+            result = self._servers[0].replace(key, value, time, compress_level=compress_level, get_cas=True)
+            self._invalidate([key])
+            self._release_chunk(previous, key, value, result)
+            return result
 
         returns = []
         for server in self.servers:
             returns.append(server.replace(key, value, time, compress_level=compress_level))
+        self._invalidate([key])
+        self._release_chunk(previous, key, value, any(returns))
         return any(returns)
 
     def delete(self, key, cas=0):
@@ -395,19 +629,35 @@ class ReplicatingClient(ClientMixin):
         :param cas: CAS of the key
         :return: True in case o success and False in case of failure.
         """
+        previous = self._chunk_manifests([key])
         returns = []
         for server in self.servers:
             returns.append(server.delete(key, cas))
 
+        self._invalidate([key])
+        self._release_chunk(previous, key, None, any(returns))
         return any(returns)
 
     def delete_multi(self, keys):
+        previous = self._chunk_manifests(keys)
         returns = []
         for server in self.servers:
             returns.append(server.delete_multi(keys))
 
+        self._invalidate(keys)
+        self._release_chunks(previous, {}, ())
         return all(returns)
 
+    def _set_chunks(self, chunks, time):
+        failed = set()
+        for server in self.servers:
+            failed.update(server.set_multi(chunks, time, compress_level=0))
+        return failed
+
+    def _delete_chunks(self, keys):
+        for server in self.servers:
+            server.delete_multi(keys)
+
     def incr(self, key, value, default=0, time=1000000):
         """
         Increment a key, if it exists, returns it's actual value, if it don't, return 0.
@@ -427,6 +677,7 @@ class ReplicatingClient(ClientMixin):
         for server in self.servers:
             returns.append(server.incr(key, value, default=default, time=time))
 
+        self._invalidate([key])
         return returns[0]
 
     def decr(self, key, value, default=0, time=1000000):
@@ -449,4 +700,38 @@ class ReplicatingClient(ClientMixin):
         for server in self.servers:
             returns.append(server.decr(key, value, default=default, time=time))
 
+        self._invalidate([key])
         return returns[0]
+
+
+class _Wakeup(object):
+    """
+    A thread's pair of sockets woken up by hedging threads.  They are closed once the
+    thread or the client is gone, when the thread-local holding them drops it.
+    """
+    def __init__(self):
+        self.reader, self.writer = socket.socketpair()
+        for sock in (self.reader, self.writer):
+            sock.setblocking(False)
+        self.close = weakref.finalize(self, _close, self.reader, self.writer)
+
+
+def _close(*sockets):
+    for sock in sockets:
+        sock.close()
+
+
+def _drain(sock):
+    try:
+        while sock.recv(64):
+            pass
+    except socket.error:
+        pass
+
+
+def _wake(sock):
+    try:
+        sock.send(b'\0')
+    except socket.error:
+        # Already awake, or its thread is gone.
+        pass
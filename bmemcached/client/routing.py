@@ -0,0 +1,362 @@
+from bisect import bisect, bisect_left
+from collections import OrderedDict, defaultdict
+import copy
+from hashlib import md5
+import math
+import struct
+import threading
+
+import six
+
+from bmemcached.utils import str_to_bytes
+
+__all__ = ('RoutingTable', 'HashRing', 'KetamaRing', 'JumpHash', 'RendezvousHash', 'HASHERS')
+
+
+def _hash(data):
+    return int.from_bytes(md5(data).digest(), 'big')
+
+
+def _hash64(data):
+    return struct.unpack('<Q', md5(data).digest()[:8])[0]
+
+
+def _mix64(value):
+    # splitmix64 finalizer.
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & 0xFFFFFFFFFFFFFFFF
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & 0xFFFFFFFFFFFFFFFF
+    return value ^ (value >> 31)
+
+
+class RoutingTable(object):
+    """
+    Base class of the algorithms mapping keys to servers.
+
+    Subclasses precompute whatever they need in `_build` and implement `_lookup`, which
+    maps a key already encoded to bytes by `_encode` to a server, and `_range`.  Keys are
+    hashed as bytes, so `'key'` and `b'key'`, which are the same memcached key, go to the
+    same server; `HashRing` is the exception, see there.
+
+    A node's share of the keys is proportional to its `weight` attribute, 1 if missing.
+
+    :param nodes: The servers.
+    :type nodes: list
+    :param cache_size: Number of recent key routes memoized, 0 to disable.
+    :type cache_size: int
+    """
+    def __init__(self, nodes, cache_size=0):
+        self.nodes = list(nodes)
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._build()
+
+    @staticmethod
+    def _weight(node):
+        return getattr(node, 'weight', 1)
+
+    _encode = staticmethod(str_to_bytes)
+
+    def _build(self):
+        raise NotImplementedError()
+
+    def _lookup(self, key):
+        raise NotImplementedError()
+
+    def _range(self, key, size):
+        raise NotImplementedError()
+
+    def rebuild(self, nodes):
+        """
+        Return a table of the same kind and settings for other nodes.
+
+        The table itself is left untouched, so lookups in other threads can go on while
+        the new one is built; subclasses reuse what they precomputed for nodes kept.
+
+        :param nodes: The servers.
+        :type nodes: list
+        :rtype: RoutingTable
+        """
+        table = copy.copy(self)
+        table.nodes = list(nodes)
+        table._cache = OrderedDict()
+        table._lock = threading.Lock()
+        table._build()
+        return table
+
+    def get_node(self, key):
+        """
+        Return the server a key is stored on, or None if there are no servers.
+
+        :param key: Key's name
+        :type key: six.string_types
+        """
+        if not self.nodes:
+            return None
+        if not self.cache_size:
+            return self._lookup(self._encode(key))
+
+        with self._lock:
+            node = self._cache.get(key)
+            if node is not None:
+                self._cache.move_to_end(key)
+                return node
+        node = self._lookup(self._encode(key))
+        with self._lock:
+            self._cache[key] = node
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return node
+
+    def get_nodes(self, items, key=None):
+        """
+        Group items by the server of their keys in one pass.
+
+        :param items: Keys, or items whose key is given by the key callable.
+        :type items: Collection
+        :param key: Callable returning the key of an item; defaults to the item itself.
+        :type key: callable
+        :return: A dict of server: [item, ...].
+        :rtype: dict
+        """
+        grouped = defaultdict(list)
+        if not self.nodes:
+            return grouped
+        get_node = self.get_node if self.cache_size else lambda key_: self._lookup(self._encode(key_))
+        for item in items:
+            grouped[get_node(item if key is None else key(item))].append(item)
+        return grouped
+
+    def range(self, key, size):
+        """
+        Return up to size distinct servers, starting with the key's own.
+
+        The following ones are where the key would go if the previous ones were removed,
+        or as close to that as the algorithm allows.
+
+        :param key: Key's name
+        :type key: six.string_types
+        :param size: Maximum number of servers.
+        :type size: int
+        :rtype: list
+        """
+        if not self.nodes:
+            return []
+        return self._range(self._encode(key), min(size, len(self.nodes)))
+
+
+class _Continuum(RoutingTable):
+    """
+    A ring of sorted points, each one owned by a server.
+    """
+    def _points(self):
+        """
+        Return a dict of point: node.
+        """
+        raise NotImplementedError()
+
+    def _position(self, key):
+        raise NotImplementedError()
+
+    def _build(self):
+        ring = self._points()
+        self._keys = sorted(ring)
+        self._ring_nodes = [ring[point] for point in self._keys]
+
+    def _lookup(self, key):
+        return self._ring_nodes[self._position(key)]
+
+    def _range(self, key, size):
+        nodes = []
+        position = self._position(key)
+        count = len(self._keys)
+        for i in range(count):
+            node = self._ring_nodes[(position + i) % count]
+            if node not in nodes:
+                nodes.append(node)
+                if len(nodes) == size:
+                    break
+        return nodes
+
+
+class HashRing(_Continuum):
+    """
+    Consistent hash ring placing keys exactly as `uhashring.HashRing` does by default.
+
+    This was the only distribution before hashers were pluggable, so it stays the default
+    and keeps existing keys on their servers.  Each server gets `vnodes` times its weight
+    points named after `str(node)`, and keys go to the first point after the md5 of
+    `str(key)`.  On Python 3 that is `"b'key'"` for bytes keys, so unlike with the other
+    hashers `'key'` and `b'key'` may go to different servers.
+
+    :param vnodes: Number of points per node of weight 1.
+    :type vnodes: int
+    """
+    VNODES = 160
+
+    def __init__(self, nodes, cache_size=0, vnodes=VNODES):
+        self.vnodes = vnodes
+        self._node_points = {}
+        super(HashRing, self).__init__(nodes, cache_size)
+
+    @staticmethod
+    def _encode(key):
+        # As uhashring does.
+        return str(key).encode('utf-8') if six.PY3 else str_to_bytes(key)
+
+    def _points(self):
+        # A node's points only depend on itself, so the ones of nodes kept by `rebuild`
+        # are not hashed again.
+        previous = self._node_points
+        self._node_points = {}
+        ring = {}
+        for node in self.nodes:
+            points = previous.get(node)
+            if points is None:
+                name = str(node)
+                points = [_hash('{}-{}'.format(name, i).encode('utf-8'))
+                          for i in range(self.vnodes * self._weight(node))]
+            self._node_points[node] = points
+            for point in points:
+                # Points of later nodes win collisions, as in uhashring.
+                ring[point] = node
+        return ring
+
+    def _position(self, key):
+        position = bisect(self._keys, _hash(key))
+        return position if position < len(self._keys) else 0
+
+    def get_nodes(self, items, key=None):
+        if self.cache_size or not self.nodes:
+            return super(HashRing, self).get_nodes(items, key)
+
+        # Inlined lookup, since this is the default hasher and the hot path of multi operations.
+        grouped = defaultdict(list)
+        points = self._keys
+        ring_nodes = self._ring_nodes
+        size = len(points)
+        encode = self._encode
+        for item in items:
+            position = bisect(points, _hash(encode(item if key is None else key(item))))
+            grouped[ring_nodes[position if position < size else 0]].append(item)
+        return grouped
+
+
+class KetamaRing(_Continuum):
+    """
+    Ketama continuum compatible with libmemcached's weighted ketama distribution, which is
+    what PHP's memcached extension and most Go and C clients use in ketama mode.
+
+    Servers get 160 points on average, in proportion to their weight, named `host-index`,
+    or `host:port-index` when the port is not 11211, four per md5 digest.  Keys go to the
+    first point at or after the first four bytes of their md5, read little-endian.
+    """
+    POINTS_PER_SERVER = 160
+    POINTS_PER_HASH = 4
+    DEFAULT_PORT = 11211
+
+    def _name(self, node):
+        server = getattr(node, 'server', None)
+        if not isinstance(server, six.string_types):
+            server = str(node)
+        if server.startswith('/'):
+            return server
+        host, _, port = server.rpartition(':')
+        if not host or not port.isdigit():
+            return server
+        if int(port) == self.DEFAULT_PORT:
+            return host
+        return '{}:{}'.format(host, port)
+
+    def _points(self):
+        ring = {}
+        total_weight = sum(self._weight(node) for node in self.nodes)
+        for node in self.nodes:
+            name = self._name(node)
+            share = float(self._weight(node)) / total_weight
+            # The epsilon is libmemcached's, keeping its rounding.
+            hashes = int(math.floor(
+                share * self.POINTS_PER_SERVER / self.POINTS_PER_HASH * len(self.nodes) + 0.0000000001))
+            for i in range(hashes):
+                digest = md5('{}-{}'.format(name, i).encode('utf-8')).digest()
+                for point in struct.unpack('<4L', digest):
+                    ring.setdefault(point, node)
+        return ring
+
+    def _position(self, key):
+        position = bisect_left(self._keys, struct.unpack('<L', md5(key).digest()[:4])[0])
+        return position if position < len(self._keys) else 0
+
+
+class JumpHash(RoutingTable):
+    """
+    Jump consistent hash (Lamping and Veach), which needs no memory and spreads keys evenly.
+
+    Servers are identified by their position in the list, so only adding or removing
+    servers at the end of the list keeps the other keys in place.  A server of weight N
+    takes N consecutive buckets, so changing a weight moves the keys of the servers after it.
+    """
+    def _build(self):
+        self._buckets = [node for node in self.nodes for _ in range(self._weight(node))]
+
+    def _bucket(self, key):
+        key = _hash64(key)
+        b, j = -1, 0
+        count = len(self._buckets)
+        while j < count:
+            b = j
+            key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+            j = int((b + 1) * (float(1 << 31) / float((key >> 33) + 1)))
+        return b
+
+    def _lookup(self, key):
+        return self._buckets[self._bucket(key)]
+
+    def _range(self, key, size):
+        nodes = []
+        bucket = self._bucket(key)
+        count = len(self._buckets)
+        for i in range(count):
+            node = self._buckets[(bucket + i) % count]
+            if node not in nodes:
+                nodes.append(node)
+                if len(nodes) == size:
+                    break
+        return nodes
+
+
+class RendezvousHash(RoutingTable):
+    """
+    Rendezvous (highest random weight) hashing: a key goes to the server scoring the
+    highest for it.
+
+    Removing a server only moves its own keys, wherever it is in the list, at the cost of
+    scoring every server on each lookup.  Weights use logarithmic scores, so a server's
+    share is exactly proportional to its weight.
+    """
+    def _build(self):
+        self._seeds = [_hash64(str(node).encode('utf-8')) for node in self.nodes]
+        weights = [self._weight(node) for node in self.nodes]
+        self._weights = None if all(weight == 1 for weight in weights) else weights
+
+    def _scores(self, key):
+        key = _hash64(key)
+        if self._weights is None:
+            return [(_mix64(key ^ seed), i) for i, seed in enumerate(self._seeds)]
+        # Map the hash into (0, 1) and score with -weight / ln(u).
+        return [(-weight / math.log((_mix64(key ^ seed) + 0.5) / 18446744073709551616.0), i)
+                for i, (seed, weight) in enumerate(zip(self._seeds, self._weights))]
+
+    def _lookup(self, key):
+        return self.nodes[max(self._scores(key))[1]]
+
+    def _range(self, key, size):
+        return [self.nodes[i] for score, i in sorted(self._scores(key), reverse=True)[:size]]
+
+
+HASHERS = {
+    'hashring': HashRing,
+    'ketama': KetamaRing,
+    'jump': JumpHash,
+    'rendezvous': RendezvousHash,
+}
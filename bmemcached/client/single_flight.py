@@ -0,0 +1,112 @@
+import threading
+
+from bmemcached.utils import str_to_bytes
+
+__all__ = ('SingleFlight', )
+
+
+class _Call(object):
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+    def wait(self):
+        self.event.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class SingleFlight(object):
+    """
+    Coalesces concurrent requests for the same key into a single in-flight request.
+
+    The first thread asking for a key runs the request; threads asking for the same key
+    while it is in flight wait for it and receive the same result (or exception).
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.shared = 0
+
+    def do(self, key, fn):
+        """
+        Run fn() unless a request for key is already in flight, then wait for it instead.
+
+        :param key: Key's name
+        :type key: six.string_types
+        :param fn: Callable fetching the key and returning a (value, cas) tuple.
+        :type fn: callable
+        :return: What fn returned, or None if the in-flight request was a `do_multi`
+            which did not find the key.
+        :rtype: tuple
+        """
+        flight_key = str_to_bytes(key)
+        with self._lock:
+            call = self._calls.get(flight_key)
+            leader = call is None
+            if leader:
+                call = self._calls[flight_key] = _Call()
+            else:
+                self.shared += 1
+        if not leader:
+            return call.wait()
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[flight_key]
+            call.event.set()
+        return call.result
+
+    def do_multi(self, keys, fn):
+        """
+        Run fn() for the keys that are not in flight yet, and wait for the others.
+
+        :param keys: Keys to be fetched.
+        :type keys: Collection
+        :param fn: Callable receiving a list of keys and returning a dict of
+            key: (value, cas) with the ones found.
+        :type fn: callable
+        :return: A dict of key: (value, cas) with every key found.
+        :rtype: dict
+        """
+        owned = []
+        waiting = []
+        with self._lock:
+            for key in keys:
+                flight_key = str_to_bytes(key)
+                call = self._calls.get(flight_key)
+                if call is not None:
+                    self.shared += 1
+                    waiting.append((key, call))
+                else:
+                    call = self._calls[flight_key] = _Call()
+                    owned.append((key, flight_key, call))
+
+        results = {}
+        try:
+            if owned:
+                results = fn([key for key, flight_key, call in owned])
+        except Exception as e:
+            for key, flight_key, call in owned:
+                call.error = e
+            raise
+        finally:
+            with self._lock:
+                for key, flight_key, call in owned:
+                    del self._calls[flight_key]
+            for key, flight_key, call in owned:
+                call.result = results.get(key)
+                call.event.set()
+
+        for key, call in waiting:
+            result = call.wait()
+            if result is not None and result[0] is not None:
+                results[key] = result
+        return results
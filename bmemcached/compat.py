@@ -4,7 +4,7 @@ try:
 except ImportError:
     import pickle as pickle  # type: ignore
 
-__all__ = ('long', 'pickle', 'unicode')
+__all__ = ('long', 'pickle', 'PickleBuffer', 'unicode')
 
 if six.PY3:
     long = int
@@ -12,3 +12,6 @@ if six.PY3:
 else:
     long = long
     unicode = unicode
+
+# Out-of-band pickle buffers only exist on protocol 5 capable interpreters (3.8+).
+PickleBuffer = getattr(pickle, 'PickleBuffer', None)
@@ -0,0 +1,49 @@
+from contextlib import contextmanager
+import socket
+import threading
+import time
+
+__all__ = ('deadline', 'remaining', 'DeadlineExceeded')
+
+_local = threading.local()
+
+
+class DeadlineExceeded(socket.timeout):
+    """
+    Raised by `Protocol` when the current deadline passed.  Like other socket errors, it
+    makes operations return as if the server was unreachable.
+    """
+
+
+@contextmanager
+def deadline(seconds):
+    """
+    Bound the time spent talking to the servers by the calls made in the block, from the
+    current thread, connecting and every send and receive included.
+
+    Once the deadline passed, requests not sent yet are skipped and connections waiting
+    for a response are closed, so reads return misses and writes report failures.  Nested
+    deadlines can only shorten the enclosing one.
+
+    :param seconds: Time allowed for the block.
+    :type seconds: float
+    """
+    expires = time.monotonic() + seconds
+    previous = getattr(_local, 'expires', None)
+    _local.expires = expires if previous is None else min(previous, expires)
+    try:
+        yield
+    finally:
+        _local.expires = previous
+
+
+def remaining():
+    """
+    Return the seconds left before the current thread's deadline, or None without one.
+
+    :rtype: float
+    """
+    expires = getattr(_local, 'expires', None)
+    if expires is None:
+        return None
+    return expires - time.monotonic()
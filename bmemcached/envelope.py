@@ -0,0 +1,29 @@
+import struct
+
+__all__ = ('Envelope', )
+
+
+class Envelope(object):
+    """
+    A value stored together with metadata used to refresh it before it expires.
+
+    Protocol.serialize stores the metadata in a fixed header in front of the wrapped
+    value's own serialization, flagged as `envelope`.
+
+    :param value: The wrapped value.
+    :type value: object
+    :param expires_at: Unix time at which the value is logically expired, or 0 if never.
+    :type expires_at: float
+    :param delta: Seconds it took to compute the value.
+    :type delta: float
+    """
+    # Flags of the wrapped value, delta, expires_at.
+    STRUCT = struct.Struct('!Ldd')
+
+    def __init__(self, value, expires_at=0, delta=0.0):
+        self.value = value
+        self.expires_at = expires_at
+        self.delta = delta
+
+    def __repr__(self):
+        return '<Envelope expires_at={} delta={}>'.format(self.expires_at, self.delta)
@@ -1,5 +1,7 @@
-from datetime import datetime, timedelta
+from collections import namedtuple
+import itertools
 import logging
+import select
 import socket
 import struct
 import threading
@@ -14,7 +16,12 @@ from io import BytesIO
 import six
 from six import binary_type, text_type
 
-from bmemcached.compat import long, pickle
+from bmemcached import deadline
+from bmemcached.chunking import ChunkManifest
+from bmemcached.circuit_breaker import shared_breaker
+from bmemcached.compat import long, pickle, PickleBuffer
+from bmemcached.deadline import DeadlineExceeded
+from bmemcached.envelope import Envelope
 from bmemcached.exceptions import AuthenticationNotSupported, InvalidCredentials, MemcachedException
 from bmemcached.utils import str_to_bytes
 
@@ -22,6 +29,36 @@ from bmemcached.utils import str_to_bytes
 logger = logging.getLogger(__name__)
 
 
+# A value that already went through Protocol.serialize, stored as is.
+Serialized = namedtuple('Serialized', ('flags', 'value'))
+
+
+class _OutOfBandPickler(pickle.Pickler):
+    """
+    Pickler which moves large bytes and bytearray objects out of the pickle stream.
+
+    The C pickler never calls ``reducer_override`` for bytes and bytearray, so they are
+    diverted through ``persistent_id`` wrapped in a ``PickleBuffer``, which protocol 5
+    hands to ``buffer_callback`` instead of copying it into the stream.
+    """
+    def __init__(self, file, protocol, buffer_callback, threshold):
+        super(_OutOfBandPickler, self).__init__(file, protocol, buffer_callback=buffer_callback)
+        self.threshold = threshold
+
+    def persistent_id(self, obj):
+        if type(obj) in (bytes, bytearray) and len(obj) >= self.threshold:
+            return type(obj), PickleBuffer(obj)
+        return None
+
+
+class _OutOfBandUnpickler(pickle.Unpickler):
+    def persistent_load(self, pid):
+        factory, buf = pid
+        if factory not in (bytes, bytearray):
+            raise pickle.UnpicklingError('Unsupported persistent id %r' % (factory, ))
+        return factory(buf)
+
+
 class Protocol(threading.local):
     """
     This class is used by Client class to communicate with server.
@@ -95,36 +132,72 @@ class Protocol(threading.local):
         'long': 1 << 2,
         'compressed': 1 << 3,
         'binary': 1 << 4,
+        'out_of_band': 1 << 5,
+        'chunked': 1 << 6,
+        'envelope': 1 << 7,
     }
 
     MAXIMUM_EXPIRE_TIME = 0xfffffffe
 
     COMPRESSION_THRESHOLD = 128
 
+    # bytes/bytearray objects at least this large are pickled out-of-band, if enabled.
+    PICKLE_BUFFER_THRESHOLD = 4096
+    # Items of a container looked at for such objects.
+    PICKLE_BUFFER_SCAN = 64
+
+    # Out-of-band objects are laid out as: buffer count, pickle length, one length per
+    # buffer, the pickle stream and then every buffer back to back.
+    OUT_OF_BAND_HEADER = struct.Struct('!LQ')
+
+    # SASL mechanisms advertised by each server, or None for servers without SASL.  Shared
+    # by every thread, so only the first connection to a server asks for them.
+    _sasl_mechanisms = {}
+
     def __init__(self, server, username=None, password=None, compression=None, socket_timeout=None,
-                 pickle_protocol=None, pickler=None, unpickler=None, tls_context=None):
+                 pickle_protocol=None, pickler=None, unpickler=None, tls_context=None, weight=1,
+                 health_monitor=None, breaker=None, tls_sessions=None, tcp_nodelay=True, tcp_keepalive=None,
+                 send_buffer_size=None, recv_buffer_size=None, connect_timeout=None, out_of_band_pickling=False):
         super(Protocol, self).__init__()
         self.server = server
+        self.weight = weight
+        self.health_monitor = health_monitor
         self._username = username
         self._password = password
 
         self.compression = zlib if compression is None else compression
         self.connection = None
         self.authenticated = False
+        self._auth_request = None
+        self._auth_pending = False
         self.socket_timeout = socket_timeout
+        self.connect_timeout = connect_timeout
+        # Whether the connection's timeout was shortened to meet a deadline.
+        self._deadline_timeout = False
+        # Whether the last request was not sent because its deadline had passed.
+        self._skipped = False
         self.pickle_protocol = pickle_protocol
+        self.out_of_band_pickling = out_of_band_pickling
         self.pickler = pickler
         self.unpickler = unpickler
         self.tls_context = tls_context
-
-        self.reconnects_deferred_until = None
+        self.tls_sessions = tls_sessions
+        self.tcp_nodelay = tcp_nodelay
+        self.tcp_keepalive = tcp_keepalive
+        self.send_buffer_size = send_buffer_size
+        self.recv_buffer_size = recv_buffer_size
 
         if not server.startswith('/'):
             self.host, self.port = self.split_host_port(self.server)
-            self.set_retry_delay(5)
         else:
             self.host = self.port = None
-            self.set_retry_delay(0)
+
+        # __init__ runs again in every thread, so the breaker's state must not be reset
+        # here: it is shared by all threads and clients using this server unless a breaker
+        # is given.  Delays set on a breaker created here only apply to this thread.
+        if breaker is None:
+            breaker = shared_breaker(server)
+        self.breaker = breaker
 
     def __str__(self):
         return "{}_{}_{}".format(self.server, self._username, self._password)
@@ -133,40 +206,149 @@ class Protocol(threading.local):
     def server_uses_unix_socket(self):
         return self.host is None
 
+    @property
+    def retry_delay(self):
+        return self.breaker.base_delay
+
     def set_retry_delay(self, value):
-        self.retry_delay = value
+        """
+        Set the delay after the first failed connection attempt, 0 to retry right away.
 
-    def _open_connection(self):
+        Following failures double it, up to `breaker.max_delay`.  This applies to the
+        threads sharing the breaker given to the Protocol, such as a client's threads, and
+        not to other clients of the server.
+
+        :param value: Seconds.
+        :type value: float
+        """
+        self.breaker.base_delay = value
+
+    def _open_connection(self, pipeline_auth=True, probe=False):
+        """
+        Connect to the server if not connected yet, and authenticate.
+
+        :param pipeline_auth: If true, the authentication request is sent along with the next
+            command and its response read before the command's, instead of waiting for it.
+        :type pipeline_auth: bool
+        :param probe: If true, connect even while the breaker refuses connection attempts,
+            still recording the outcome, to find out whether the server came back.
+        :type probe: bool
+        """
         if self.connection:
             return
 
         self.authenticated = False
 
+        connect_timeout = self.socket_timeout if self.connect_timeout is None else self.connect_timeout
+        left = deadline.remaining()
+        shortened = left is not None and (connect_timeout is None or left < connect_timeout)
+        if shortened:
+            if left <= 0:
+                raise DeadlineExceeded('Deadline exceeded')
+            connect_timeout = left
+
         # If we're deferring a reconnection attempt, wait.
-        if self.reconnects_deferred_until and self.reconnects_deferred_until > datetime.now():
+        if not probe and not self.breaker.allow():
             return
 
         try:
             if self.host:
-                self.connection = socket.create_connection((self.host, self.port), self.socket_timeout)
+                self.connection = socket.create_connection((self.host, self.port), connect_timeout)
+                self._set_socket_options(self.connection)
 
                 if self.tls_context:
                     self.connection = self.tls_context.wrap_socket(
                         self.connection,
                         server_hostname=self.host,
+                        session=self.tls_sessions.get(self.server) if self.tls_sessions else None,
                     )
+                    if self.tls_sessions is not None:
+                        self.tls_sessions.handshake_done(self.server, self.connection)
+                self.connection.settimeout(self.socket_timeout)
             else:
                 self.connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
                 self.connection.connect(self.server)
-
-            self._send_authentication()
-        except socket.error:
+        except socket.error as e:
+            if shortened and isinstance(e, socket.timeout):
+                # Our deadline's fault, not the server's.
+                self.breaker.release()
+                raise DeadlineExceeded('Deadline exceeded while connecting')
             # If the connection attempt fails, start delaying retries.
-            self.reconnects_deferred_until = datetime.now() + timedelta(seconds=self.retry_delay)
+            self.breaker.record_failure()
             raise
+        self._deadline_timeout = False
+
+        self.breaker.record_success()
+        self._send_authentication(pipeline_auth)
+
+    def _set_socket_options(self, sock):
+        """
+        Apply the TCP options to a new connection.
+        """
+        if self.tcp_nodelay:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if self.tcp_keepalive:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            idle, interval, count = self.tcp_keepalive
+            # Not every platform lets these be tuned.
+            for option, value in (('TCP_KEEPIDLE', idle), ('TCP_KEEPINTVL', interval), ('TCP_KEEPCNT', count)):
+                if hasattr(socket, option):
+                    sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, option), value)
+        if self.send_buffer_size:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.send_buffer_size)
+        if self.recv_buffer_size:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.recv_buffer_size)
+
+    def detach_connection(self):
+        """
+        Return this thread's open connection and forget it without closing it.
+
+        Connections are per thread; this and `attach_connection` let a connection opened
+        in one thread be used by another.
+
+        :return: A (connection, authenticated) tuple; connection is None if not open.
+        :rtype: tuple
+        """
+        connection, authenticated = self.connection, self.authenticated
+        self.connection = None
+        self.authenticated = False
+        return connection, authenticated
+
+    def attach_connection(self, connection, authenticated):
+        """
+        Use a connection returned by `detach_connection` in this thread, closing the one
+        it replaces.
+
+        :param connection: The connection.
+        :type connection: socket.socket
+        :param authenticated: Whether the connection was authenticated.
+        :type authenticated: bool
+        """
+        self.disconnect()
+        self.connection = connection
+        self.authenticated = authenticated
+
+    def _apply_deadline(self):
+        """
+        Shorten the connection's timeout to the current deadline, or restore it.
+
+        :raises DeadlineExceeded: If the deadline passed.
+        """
+        timeout = self.socket_timeout if self.host else None
+        left = deadline.remaining()
+        if left is not None and (timeout is None or left < timeout):
+            if left <= 0:
+                raise DeadlineExceeded('Deadline exceeded')
+            self.connection.settimeout(left)
+            self._deadline_timeout = True
+        elif self._deadline_timeout:
+            self.connection.settimeout(timeout)
+            self._deadline_timeout = False
 
     def _connection_error(self, exception):
-        # On error, clear our dead connection.
+        # On error, clear our dead connection.  Missing a deadline says nothing about the server.
+        if self.connection and not isinstance(exception, DeadlineExceeded):
+            self.breaker.record_error()
         self.disconnect()
 
     @classmethod
@@ -220,7 +402,13 @@ class Protocol(threading.local):
         """
         value = bytearray()
         while len(value) < size:
-            data = self.connection.recv(size - len(value))
+            self._apply_deadline()
+            try:
+                data = self.connection.recv(size - len(value))
+            except socket.timeout:
+                if self._deadline_timeout:
+                    raise DeadlineExceeded('Deadline exceeded')
+                raise
             if not data:
                 break
             value += data
@@ -238,6 +426,10 @@ class Protocol(threading.local):
         :return: A tuple with binary values from memcached.
         :rtype: tuple
         """
+        if self._skipped:
+            # The request was not sent, and the connection is left open.
+            return (self.MAGIC['response'], -1, 0, 0, 0, self.STATUS['server_disconnected'], 0, 0, 0,
+                    'Deadline exceeded')
         try:
             self._open_connection()
             if self.connection is None:
@@ -246,6 +438,12 @@ class Protocol(threading.local):
                 # do below.
                 raise socket.error('Delaying reconnection attempt')
 
+            if self._auth_request is not None:
+                self._flush_authentication(b'')
+            if self._auth_pending:
+                self._auth_pending = False
+                self._read_authentication()
+
             header = self._read_socket(self.HEADER_SIZE)
             (magic, opcode, keylen, extlen, datatype, status, bodylen, opaque,
              cas) = struct.unpack(self.HEADER_STRUCT, header)
@@ -256,22 +454,43 @@ class Protocol(threading.local):
             if bodylen:
                 extra_content = self._read_socket(bodylen)
 
+            if self.health_monitor is not None:
+                self.health_monitor.record_success(self)
+
             return (magic, opcode, keylen, extlen, datatype, status, bodylen,
                     opaque, cas, extra_content)
         except socket.error as e:
             self._connection_error(e)
+            # Counted here only, so a failed request counts once even when sending failed too.
+            if self.health_monitor is not None and not isinstance(e, DeadlineExceeded):
+                self.health_monitor.record_failure(self, e)
 
             # (magic, opcode, keylen, extlen, datatype, status, bodylen, opaque, cas, extra_content)
             message = str(e)
             return (self.MAGIC['response'], -1, 0, 0, 0, self.STATUS['server_disconnected'], 0, 0, 0, message)
 
     def _send(self, data):
+        self._skipped = False
         try:
             self._open_connection()
             if self.connection is None:
                 return
 
-            self.connection.sendall(data)
+            left = deadline.remaining()
+            if left is not None and left <= 0:
+                self._skipped = True
+                return
+
+            self._apply_deadline()
+            try:
+                if self._auth_request is not None:
+                    self._flush_authentication(data)
+                else:
+                    self.connection.sendall(data)
+            except socket.timeout:
+                if self._deadline_timeout:
+                    raise DeadlineExceeded('Deadline exceeded')
+                raise
         except socket.error as e:
             self._connection_error(e)
 
@@ -290,16 +509,22 @@ class Protocol(threading.local):
         self._username = username
         self._password = password
 
-        # Reopen the connection with the new credentials.
+        # Reopen the connection with the new credentials, asking for the mechanisms again.
         self.disconnect()
-        self._open_connection()
+        self._sasl_mechanisms.pop(self.server, None)
+        self._open_connection(pipeline_auth=False)
         return self.authenticated
 
-    def _send_authentication(self):
-        if not self._username or not self._password:
-            return False
+    def _negotiate_authentication(self):
+        """
+        Return the SASL mechanisms of the server, asking for them on its first connection.
+
+        :return: The mechanisms, None if the server does not support SASL, or False if the
+            connection was lost.
+        """
+        if self.server in self._sasl_mechanisms:
+            return self._sasl_mechanisms[self.server]
 
-        logger.debug('Authenticating as %s', self._username)
         cmd = self.COMMANDS['auth_negotiation']
         self._send(cmd['packer'].pack(
             self.MAGIC['request'], cmd['command'],
@@ -312,15 +537,37 @@ class Protocol(threading.local):
             return False
 
         if status == self.STATUS['unknown_command']:
+            mechanisms = None
+        else:
+            mechanisms = extra_content
+        self._sasl_mechanisms[self.server] = mechanisms
+        return mechanisms
+
+    def _send_authentication(self, pipeline=False):
+        """
+        Authenticate a new connection.
+
+        When pipelining, the request is kept in `_auth_request` to go out with the next
+        command, and its response is checked by `_get_response` before the command's, so
+        the connection is usable after a single round trip once the mechanisms are known.
+        """
+        if not self._username or not self._password:
+            return False
+
+        logger.debug('Authenticating as %s', self._username)
+        methods = self._negotiate_authentication()
+
+        if methods is False:
+            return False
+
+        if methods is None:
             logger.debug('Server does not requires authentication.')
             self.authenticated = True
             return True
 
-        methods = extra_content
-
         if b'PLAIN' not in methods:
             raise AuthenticationNotSupported('This module only supports '
-                                             'PLAIN auth for now.', status)
+                                             'PLAIN auth for now.', 0)
 
         method = b'PLAIN'
         auth = '\x00%s\x00%s' % (self._username, self._password)
@@ -328,9 +575,15 @@ class Protocol(threading.local):
             auth = auth.encode()
 
         cmd = self.COMMANDS['auth_request']
-        self._send(cmd['packer'].pack(
+        request = cmd['packer'].pack(
             self.MAGIC['request'], cmd['command'],
-            len(method), 0, 0, 0, len(method) + len(auth), 0, 0) + method + auth)
+            len(method), 0, 0, 0, len(method) + len(auth), 0, 0) + method + auth
+
+        if pipeline:
+            self._auth_request = request
+            return True
+
+        self._send(request)
 
         (magic, opcode, keylen, extlen, datatype, status, bodylen, opaque,
          cas, extra_content) = self._get_response()
@@ -338,6 +591,31 @@ class Protocol(threading.local):
         if status == self.STATUS['server_disconnected']:
             return False
 
+        self._check_authentication(status, extra_content)
+        return True
+
+    def _flush_authentication(self, data):
+        # Send the pipelined authentication request, followed by data.
+        request = self._auth_request
+        self._auth_request = None
+        self._auth_pending = True
+        self.connection.sendall(request + data)
+
+    def _read_authentication(self):
+        """
+        Read the response to a pipelined authentication request.
+        """
+        header = self._read_socket(self.HEADER_SIZE)
+        status, bodylen = struct.unpack(self.HEADER_STRUCT, header)[5:7]
+        extra_content = self._read_socket(bodylen) if bodylen else None
+        try:
+            self._check_authentication(status, extra_content)
+        except MemcachedException:
+            # The response to the command sent along is not worth reading.
+            self.disconnect()
+            raise
+
+    def _check_authentication(self, status, extra_content):
         if status == self.STATUS['auth_error']:
             raise InvalidCredentials("Incorrect username or password", status)
 
@@ -347,7 +625,6 @@ class Protocol(threading.local):
         logger.debug('Auth OK. Code: %d Message: %s', status, extra_content)
 
         self.authenticated = True
-        return True
 
     def serialize(self, value, compress_level=-1):
         """
@@ -362,6 +639,14 @@ class Protocol(threading.local):
         :return: Serialized type
         :rtype: bytes
         """
+        if type(value) is Serialized:
+            return value
+        if isinstance(value, ChunkManifest):
+            return self.FLAGS['chunked'], value.pack()
+        if isinstance(value, Envelope):
+            flags, wrapped = self.serialize(value.value, compress_level=compress_level)
+            return self.FLAGS['envelope'], Envelope.STRUCT.pack(flags, value.delta, value.expires_at) + wrapped
+
         flags = 0
         if isinstance(value, binary_type):
             flags |= self.FLAGS['binary']
@@ -376,7 +661,11 @@ class Protocol(threading.local):
         else:
             flags |= self.FLAGS['object']
             if self.pickler is None or self.pickler is pickle.Pickler:
-                value = pickle.dumps(value, self.pickle_protocol)
+                if self.out_of_band_pickling and self._has_large_buffers(value):
+                    oob_flags, value = self._dumps_out_of_band(value)
+                    flags |= oob_flags
+                else:
+                    value = pickle.dumps(value, self.pickle_protocol)
             else:
                 buf = BytesIO()
                 pickler = self.pickler(buf, self.pickle_protocol)
@@ -397,6 +686,84 @@ class Protocol(threading.local):
 
         return flags, value
 
+    @staticmethod
+    def supports_out_of_band(pickle_protocol):
+        """
+        Return whether values pickled with a protocol can have out-of-band buffers.
+
+        :param pickle_protocol: The pickling protocol, negative for the highest one.
+        :type pickle_protocol: int
+        :rtype: bool
+        """
+        if pickle_protocol is not None and pickle_protocol < 0:
+            pickle_protocol = pickle.HIGHEST_PROTOCOL
+        return PickleBuffer is not None and pickle_protocol is not None and pickle_protocol >= 5
+
+    def _has_large_buffers(self, value):
+        """
+        Cheaply tell whether a value holds bytes or bytearray objects worth pickling
+        out-of-band: the value itself, its attributes, or the first items of a list, tuple
+        or dict.  Other values are pickled in-band, sparing the common case a Python
+        callback for every pickled object.
+        """
+        if isinstance(value, dict):
+            items = value.values()
+        elif isinstance(value, (list, tuple)):
+            items = value
+        else:
+            items = (value, ) + tuple(getattr(value, '__dict__', {}).values())
+        threshold = self.PICKLE_BUFFER_THRESHOLD
+        return any(type(item) in (bytes, bytearray) and len(item) >= threshold
+                   for item in itertools.islice(items, self.PICKLE_BUFFER_SCAN))
+
+    def _dumps_out_of_band(self, value):
+        """
+        Pickle a value with protocol 5, appending its out-of-band buffers after the pickle stream.
+
+        The buffers are copied exactly once, straight into the returned payload.
+
+        :param value: Object to be pickled
+        :type value: object
+        :return: A (flags, payload) tuple. flags is 0 when nothing was large enough to be
+            moved out-of-band, in which case payload is a regular pickle.
+        :rtype: tuple
+        """
+        buffers = []
+        buf = BytesIO()
+        _OutOfBandPickler(buf, self.pickle_protocol, buffers.append, self.PICKLE_BUFFER_THRESHOLD).dump(value)
+        if not buffers:
+            return 0, buf.getvalue()
+
+        raw_buffers = [b.raw() for b in buffers]
+        header = self.OUT_OF_BAND_HEADER.pack(len(raw_buffers), buf.tell())
+        lengths = struct.pack('!%dQ' % len(raw_buffers), *(b.nbytes for b in raw_buffers))
+        return self.FLAGS['out_of_band'], b''.join([header, lengths, buf.getbuffer()] + raw_buffers)
+
+    def _loads_out_of_band(self, value):
+        """
+        Unpickle a payload built by _dumps_out_of_band.
+
+        Buffers are handed to the unpickler as views over the received payload, so only
+        the final objects are materialized.
+
+        :param value: Payload with pickle stream and out-of-band buffers
+        :type value: bytes
+        :return: Unpickled object
+        :rtype: object
+        """
+        view = memoryview(value)
+        count, pickle_length = self.OUT_OF_BAND_HEADER.unpack_from(view)
+        offset = self.OUT_OF_BAND_HEADER.size
+        lengths = struct.unpack_from('!%dQ' % count, view, offset)
+        offset += 8 * count
+        stream = BytesIO(view[offset:offset + pickle_length])
+        offset += pickle_length
+        buffers = []
+        for length in lengths:
+            buffers.append(view[offset:offset + length])
+            offset += length
+        return _OutOfBandUnpickler(stream, buffers=buffers).load()
+
     def deserialize(self, value, flags):
         """
         Deserialized values based on flags or just return it if it is not serialized.
@@ -410,17 +777,26 @@ class Protocol(threading.local):
         """
         FLAGS = self.FLAGS
 
+        if flags & FLAGS['envelope']:
+            flags, delta, expires_at = Envelope.STRUCT.unpack_from(value)
+            return Envelope(self.deserialize(value[Envelope.STRUCT.size:], flags), expires_at, delta)
+
         if flags & FLAGS['compressed']:  # pragma: no branch
             value = self.compression.decompress(value)
 
         if flags & FLAGS['binary']:
             return value
 
+        if flags & FLAGS['chunked']:
+            return ChunkManifest.unpack(value)
+
         if flags & FLAGS['integer']:
             return int(value)
         elif flags & FLAGS['long']:
             return long(value)
         elif flags & FLAGS['object']:
+            if flags & FLAGS['out_of_band']:
+                return self._loads_out_of_band(value)
             if self.unpickler is None or self.unpickler is pickle.Unpickler:
                 return pickle.loads(value)
             return self.unpickler(BytesIO(value)).load()
@@ -451,6 +827,17 @@ class Protocol(threading.local):
         :return: Returns (value, cas).
         :rtype: object
         """
+        self.send_get(key)
+        return self.read_get()
+
+    def send_get(self, key):
+        """
+        Send a get request without waiting for its response, which must be read with
+        `read_get` before making any other request.
+
+        :param key: Key's name
+        :type key: six.string_types
+        """
         logger.debug('Getting key %s', key)
         keybytes = str_to_bytes(key)
         cmd = self.COMMANDS['get']
@@ -460,6 +847,39 @@ class Protocol(threading.local):
             klen, 0, 0, 0, klen, 0, 0) + keybytes
         self._send(data)
 
+    def wait_for_response(self, timeout, wakeup=None):
+        """
+        Wait until the response to the request sent last can be read without blocking.
+
+        :param timeout: Seconds to wait at most, or None to wait until it can be read.
+        :type timeout: float
+        :param wakeup: A socket ending the wait as soon as it becomes readable.
+        :type wakeup: socket.socket
+        :return: True if the response can be read, False if the wait timed out or was
+            woken up.
+        :rtype: bool
+        """
+        if self._skipped or self.connection is None:
+            # Reading won't touch the network.
+            return True
+        if getattr(self.connection, 'pending', None) and self.connection.pending():
+            # Already decrypted by a previous read.
+            return True
+        sockets = [self.connection] if wakeup is None else [self.connection, wakeup]
+        try:
+            readable = select.select(sockets, [], [], timeout)[0]
+        except (select.error, ValueError):
+            # Let the read report the broken connection.
+            return True
+        return self.connection in readable
+
+    def read_get(self):
+        """
+        Read the response to a request sent with `send_get`.
+
+        :return: Returns (value, cas), or (None, None) if the value isn't cached.
+        :rtype: tuple
+        """
         (magic, opcode, keylen, extlen, datatype, status, bodylen, opaque,
          cas, extra_content) = self._get_response()
 
@@ -505,6 +925,22 @@ class Protocol(threading.local):
 
         return int(status)
 
+    def probe(self):
+        """
+        Send a NOOP like `noop`, connecting even while the breaker defers reconnection
+        attempts.  Meant for health checks: a server coming back is noticed right away, and
+        closes the breaker so every thread can reconnect to it.
+
+        :return: Returns the status.
+        :rtype: int
+        """
+        try:
+            self._open_connection(probe=True)
+        except socket.error as e:
+            # The breaker now refuses the NOOP's attempt, so it fails without connecting.
+            self._connection_error(e)
+        return self.noop()
+
     def get_multi(self, keys):
         """
         Get multiple keys from server.
@@ -1097,6 +1533,11 @@ class Protocol(threading.local):
         :return: Nothing
         :rtype: None
         """
+        self._auth_request = None
+        self._auth_pending = False
         if self.connection:
+            if self.tls_sessions is not None and self.tls_context:
+                # TLS 1.3 session tickets only arrive after the handshake.
+                self.tls_sessions.save(self.server, self.connection)
             self.connection.close()
             self.connection = None
@@ -0,0 +1,79 @@
+from array import array
+
+__all__ = ('CountMinSketch', )
+
+
+class CountMinSketch(object):
+    """
+    Count-min sketch estimating how often keys were seen, in constant memory.
+
+    Counters saturate at `max_count` and, once `sample_size` increments were recorded,
+    every counter is halved so the estimates favour recent traffic.
+
+    :param width: Number of counters per row.
+    :type width: int
+    :param depth: Number of rows, each one indexed by a different hash.
+    :type depth: int
+    :param sample_size: Increments between two agings, or None to never age.
+    :type sample_size: int
+    :param max_count: Highest value a counter can hold.
+    :type max_count: int
+    """
+    SEEDS = (0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9, 0xD6E8FEB86659FD93,
+             0xFF51AFD7ED558CCD, 0xC4CEB9FE1A85EC53, 0x85EBCA77C2B2AE63, 0x27D4EB2F165667C5)
+
+    def __init__(self, width=1024, depth=4, sample_size=None, max_count=0xffff):
+        assert 0 < depth <= len(self.SEEDS), 'depth must be between 1 and %d' % len(self.SEEDS)
+        self.width = width
+        self.depth = depth
+        self.sample_size = sample_size
+        self.max_count = max_count
+        self.additions = 0
+        self._rows = [array('L', [0]) * width for _ in range(depth)]
+
+    def _indexes(self, key):
+        h = hash(key)
+        width = self.width
+        return [((h ^ seed) * 0x9E3779B1 >> 16) % width for seed in self.SEEDS[:self.depth]]
+
+    def add(self, key, count=1):
+        """
+        Record `count` occurrences of key.
+
+        :return: The new estimate for key.
+        :rtype: int
+        """
+        estimate = self.max_count
+        for row, index in zip(self._rows, self._indexes(key)):
+            value = min(row[index] + count, self.max_count)
+            row[index] = value
+            estimate = min(estimate, value)
+
+        self.additions += count
+        if self.sample_size and self.additions >= self.sample_size:
+            self.age()
+        return estimate
+
+    def estimate(self, key):
+        """
+        Return how many times key was seen, possibly overestimated.
+
+        :rtype: int
+        """
+        return min(row[index] for row, index in zip(self._rows, self._indexes(key)))
+
+    def age(self):
+        """
+        Halve every counter.
+        """
+        for row in self._rows:
+            for i, value in enumerate(row):
+                if value:
+                    row[i] = value >> 1
+        self.additions //= 2
+
+    def clear(self):
+        for row in self._rows:
+            for i in range(self.width):
+                row[i] = 0
+        self.additions = 0
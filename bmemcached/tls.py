@@ -0,0 +1,82 @@
+import threading
+
+__all__ = ('TLSSessionCache', )
+
+
+class TLSSessionCache(object):
+    """
+    Keeps the last TLS session of each server, so new connections resume it instead of
+    doing a full handshake.
+
+    Connections are per thread and reopened after errors, so without it every one of them
+    pays for a full handshake.  A cache must only be used with the `ssl.SSLContext` its
+    sessions were negotiated with; clients create one along with their `tls_context`.
+    With TLS 1.3 the server sends its session tickets after the handshake, so sessions are
+    saved again when connections are closed.
+    """
+    def __init__(self):
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self.resumed = 0
+        self.full_handshakes = 0
+
+    def get(self, server):
+        """
+        Return the session to resume for a server, or None.
+
+        :param server: Address of the server.
+        :type server: str
+        :rtype: ssl.SSLSession
+        """
+        return self._sessions.get(server)
+
+    def save(self, server, connection):
+        """
+        Remember the session of a connection to a server.
+
+        :param server: Address of the server.
+        :type server: str
+        :param connection: The connection.
+        :type connection: ssl.SSLSocket
+        """
+        session = connection.session
+        if session is not None:
+            self._sessions[server] = session
+
+    def handshake_done(self, server, connection):
+        """
+        Count a new connection as resumed or fully negotiated, and remember its session.
+
+        :param server: Address of the server.
+        :type server: str
+        :param connection: The connection, once its handshake is done.
+        :type connection: ssl.SSLSocket
+        """
+        with self._lock:
+            if connection.session_reused:
+                self.resumed += 1
+            else:
+                self.full_handshakes += 1
+        self.save(server, connection)
+
+    def forget(self, server):
+        """
+        Drop the session of a server, so its next connection does a full handshake.
+
+        :param server: Address of the server.
+        :type server: str
+        """
+        self._sessions.pop(server, None)
+
+    def stats(self):
+        """
+        :return: The number of resumed and full handshakes, and the rate of resumed ones.
+        :rtype: dict
+        """
+        with self._lock:
+            total = self.resumed + self.full_handshakes
+            return {
+                'resumed': self.resumed,
+                'full_handshakes': self.full_handshakes,
+                'resumption_rate': float(self.resumed) / total if total else 0.0,
+            }
@@ -1,5 +1,4 @@
 import os
-import sys
 
 from setuptools import setup
 
@@ -8,10 +7,6 @@ def read(filename):
     return open(os.path.join(os.path.dirname(__file__), filename)).read()
 
 
-version_dependant_requirements = [
-    "uhashring < 2" if sys.version_info < (3, 6) else "uhashring",  # It uses f-strings
-]
-
 setup(
     name="python-binary-memcached",
     version="0.32.0",
@@ -33,6 +28,5 @@ setup(
     ],
     install_requires=[
         "six",
-    ]
-    + version_dependant_requirements,
+    ],
 )
@@ -1,9 +1,14 @@
 import os
+import socket
+import struct
+import threading
 import unittest
 
 import six
 
 import bmemcached
+from bmemcached.circuit_breaker import CircuitBreaker
+from bmemcached.protocol import Protocol
 from bmemcached.exceptions import AuthenticationNotSupported, InvalidCredentials, MemcachedException
 
 if six.PY3:
@@ -62,3 +67,103 @@ class TestServerAuth(unittest.TestCase):
         server = bmemcached.protocol.Protocol(os.environ['MEMCACHED_HOST'])
         self.assertRaises(InvalidCredentials, server.authenticate,
                           'user', 'password2')
+
+
+class _SASLServer(threading.Thread):
+    """
+    Server accepting PLAIN authentication as user/password, recording the opcodes received
+    by each connection and answering other commands with an empty success response.
+    """
+    def __init__(self):
+        super(_SASLServer, self).__init__()
+        self.daemon = True
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(5)
+        self.server = '127.0.0.1:{}'.format(self.sock.getsockname()[1])
+        self.connections = []
+
+    def read(self, conn, size):
+        data = b''
+        while len(data) < size:
+            chunk = conn.recv(size - len(data))
+            if not chunk:
+                raise socket.error()
+            data += chunk
+        return data
+
+    def respond(self, conn, opcode, status=0, body=b''):
+        conn.sendall(struct.pack(Protocol.HEADER_STRUCT, Protocol.MAGIC['response'], opcode,
+                                 0, 0, 0, status, len(body), 0, 0) + body)
+
+    def run(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except socket.error:
+                return
+            opcodes = []
+            self.connections.append(opcodes)
+            try:
+                while True:
+                    header = self.read(conn, Protocol.HEADER_SIZE)
+                    opcode, bodylen = struct.unpack(Protocol.HEADER_STRUCT, header)[1:7:5]
+                    body = self.read(conn, bodylen)
+                    opcodes.append(opcode)
+                    if opcode == Protocol.COMMANDS['auth_negotiation']['command']:
+                        self.respond(conn, opcode, body=b'PLAIN')
+                    elif opcode == Protocol.COMMANDS['auth_request']['command']:
+                        if body == b'PLAIN\x00user\x00password':
+                            self.respond(conn, opcode, body=b'Authenticated')
+                        else:
+                            self.respond(conn, opcode, Protocol.STATUS['auth_error'], b'Auth failure')
+                    else:
+                        self.respond(conn, opcode)
+            except socket.error:
+                conn.close()
+
+    def close(self):
+        self.sock.close()
+
+
+class PipelinedAuthTests(unittest.TestCase):
+    NEGOTIATION = Protocol.COMMANDS['auth_negotiation']['command']
+    AUTH = Protocol.COMMANDS['auth_request']['command']
+    NOOP = Protocol.COMMANDS['noop']['command']
+
+    def setUp(self):
+        self.sasl = _SASLServer()
+        self.sasl.start()
+
+    def tearDown(self):
+        Protocol._sasl_mechanisms.pop(self.sasl.server, None)
+        self.sasl.close()
+
+    def protocol(self, password='password'):
+        return Protocol(self.sasl.server, 'user', password, breaker=CircuitBreaker())
+
+    def testMechanismsAreRemembered(self):
+        protocol = self.protocol()
+        self.assertEqual(Protocol.STATUS['success'], protocol.noop())
+        self.assertTrue(protocol.authenticated)
+        protocol.disconnect()
+
+        other = self.protocol()
+        self.assertEqual(Protocol.STATUS['success'], other.noop())
+        self.assertTrue(other.authenticated)
+        other.disconnect()
+        self.assertEqual([[self.NEGOTIATION, self.AUTH, self.NOOP], [self.AUTH, self.NOOP]], self.sasl.connections)
+
+    def testAuthenticateNegotiatesAgain(self):
+        protocol = self.protocol()
+        protocol.noop()
+        self.assertTrue(protocol.authenticate('user', 'password'))
+        protocol.disconnect()
+        self.assertEqual([self.NEGOTIATION, self.AUTH], self.sasl.connections[1])
+
+    def testInvalidCredentials(self):
+        self.protocol().authenticate('user', 'password')
+        protocol = self.protocol('wrong')
+        self.assertRaises(InvalidCredentials, protocol.noop)
+        self.assertTrue(protocol.connection is None)
+        self.assertFalse(protocol.authenticated)
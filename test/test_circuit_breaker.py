@@ -0,0 +1,177 @@
+import os
+import socket
+import threading
+import unittest
+
+import bmemcached
+from bmemcached.circuit_breaker import BreakerState, CircuitBreaker, shared_breaker
+from bmemcached.protocol import Protocol
+
+# Nothing listens on port 1, so connections are refused right away.
+DEAD_SERVER = '127.0.0.1:1'
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class CircuitBreakerTests(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        self.breaker = CircuitBreaker(base_delay=1, max_delay=5, jitter=0, clock=self.clock)
+
+    def testClosedAllowsEverything(self):
+        self.assertEqual(CircuitBreaker.CLOSED, self.breaker.state)
+        self.assertTrue(self.breaker.allow())
+        self.assertTrue(self.breaker.allow())
+
+    def testFailureOpens(self):
+        self.breaker.record_failure()
+        self.assertEqual(CircuitBreaker.OPEN, self.breaker.state)
+        self.assertFalse(self.breaker.allow())
+        self.clock.now += 0.9
+        self.assertFalse(self.breaker.allow())
+
+    def testHalfOpenLetsOneAttemptThrough(self):
+        self.breaker.record_failure()
+        self.clock.now += 1
+        self.assertTrue(self.breaker.allow())
+        self.assertEqual(CircuitBreaker.HALF_OPEN, self.breaker.state)
+        self.assertFalse(self.breaker.allow())
+
+        self.breaker.record_success()
+        self.assertEqual(CircuitBreaker.CLOSED, self.breaker.state)
+        self.assertEqual(0, self.breaker.failures)
+        self.assertTrue(self.breaker.allow())
+
+    def testDelayGrowsExponentially(self):
+        delays = []
+        for _ in range(5):
+            self.breaker.record_failure()
+            delays.append(self.breaker.retry_at - self.clock.now)
+            self.clock.now = self.breaker.retry_at
+            self.assertTrue(self.breaker.allow())
+        self.assertEqual([1, 2, 4, 5, 5], delays)
+
+    def testSuccessResetsDelay(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.breaker.record_success()
+        self.breaker.record_failure()
+        self.assertEqual(1, self.breaker.retry_at - self.clock.now)
+
+    def testJitterShortensDelay(self):
+        breaker = CircuitBreaker(base_delay=1, jitter=0.5, clock=self.clock)
+        for _ in range(20):
+            breaker.record_success()
+            breaker.record_failure()
+            self.assertTrue(0.5 <= breaker.retry_at - self.clock.now <= 1)
+
+    def testLostConnectionLetsOneReconnectionThrough(self):
+        self.breaker.record_error()
+        self.assertTrue(self.breaker.allow())
+        self.assertFalse(self.breaker.allow())
+        self.breaker.record_success()
+        self.assertTrue(self.breaker.allow())
+
+    def testStuckProbeIsGivenUp(self):
+        self.breaker.record_error()
+        self.assertTrue(self.breaker.allow())
+        self.clock.now += 5
+        self.assertTrue(self.breaker.allow())
+
+    def testZeroDelayNeverRefuses(self):
+        breaker = CircuitBreaker(base_delay=0, clock=self.clock)
+        breaker.record_failure()
+        self.assertTrue(breaker.allow())
+        self.assertTrue(breaker.allow())
+
+
+class ProtocolBreakerTests(unittest.TestCase):
+    def testRefusedConnectionOpensBreaker(self):
+        protocol = Protocol(DEAD_SERVER, breaker=CircuitBreaker())
+        self.assertRaises(socket.error, protocol._open_connection)
+        self.assertEqual(CircuitBreaker.OPEN, protocol.breaker.state)
+
+        # Further attempts are deferred without touching the network.
+        protocol._open_connection()
+        self.assertTrue(protocol.connection is None)
+        self.assertEqual(1, protocol.breaker.failures)
+
+    def testRetryDelaySetsBaseDelay(self):
+        protocol = Protocol(DEAD_SERVER, breaker=CircuitBreaker())
+        protocol.set_retry_delay(0)
+        self.assertRaises(socket.error, protocol._open_connection)
+        self.assertRaises(socket.error, protocol._open_connection)
+        self.assertEqual(2, protocol.breaker.failures)
+
+
+class SharedBreakerTests(unittest.TestCase):
+    def testSharedByServer(self):
+        self.assertTrue(shared_breaker(DEAD_SERVER).shared is shared_breaker(DEAD_SERVER).shared)
+        self.assertFalse(shared_breaker(DEAD_SERVER).shared is shared_breaker('127.0.0.1:2').shared)
+        self.assertEqual(5, shared_breaker(DEAD_SERVER).base_delay)
+        self.assertEqual(0, shared_breaker('/tmp/memcached.sock').base_delay)
+
+    def testDelaysAreNotShared(self):
+        clock = Clock()
+        state = BreakerState()
+        first = CircuitBreaker(base_delay=1, jitter=0, clock=clock, shared=state)
+        second = CircuitBreaker(base_delay=10, jitter=0, clock=clock, shared=state)
+        second.record_failure()
+        self.assertEqual(CircuitBreaker.OPEN, first.state)
+        clock.now += 1
+        self.assertTrue(first.allow())
+        self.assertFalse(second.allow())
+        first.record_success()
+        self.assertTrue(second.allow())
+
+    def testSharedAcrossThreads(self):
+        protocol = Protocol(DEAD_SERVER, breaker=CircuitBreaker())
+        self.assertRaises(socket.error, protocol._open_connection)
+
+        errors = []
+
+        def connect():
+            try:
+                protocol._open_connection()
+            except socket.error as e:
+                errors.append(e)
+
+        thread = threading.Thread(target=connect)
+        thread.start()
+        thread.join()
+        self.assertEqual([], errors)
+        self.assertEqual(1, protocol.breaker.failures)
+
+    def testSharedAcrossClients(self):
+        server = '{}:11211'.format(os.environ['MEMCACHED_HOST'])
+        first = bmemcached.Client([server])
+        second = bmemcached.DistributedClient([server])
+        self.assertTrue(next(first.servers).breaker.shared is next(second.servers).breaker.shared)
+        self.assertTrue(next(first.servers).breaker.shared is shared_breaker(server).shared)
+
+    def testRetryDelayIsPerClient(self):
+        self.addCleanup(shared_breaker(DEAD_SERVER).record_success)
+        first = bmemcached.ReplicatingClient([DEAD_SERVER])
+        second = bmemcached.ReplicatingClient([DEAD_SERVER])
+        first.enable_retry_delay(False)
+        self.assertEqual(0, next(first.servers).retry_delay)
+        self.assertEqual(5, next(second.servers).retry_delay)
+
+        # Both see the failure, but only the second one defers reconnecting.
+        self.assertRaises(socket.error, next(second.servers)._open_connection)
+        self.assertRaises(socket.error, next(first.servers)._open_connection)
+        next(second.servers)._open_connection()
+        self.assertEqual(2, next(second.servers).breaker.failures)
+
+        # Threads of a client share its delays.
+        delays = []
+        thread = threading.Thread(target=lambda: delays.append(next(first.servers).retry_delay))
+        thread.start()
+        thread.join()
+        self.assertEqual([0], delays)
@@ -0,0 +1,158 @@
+import os
+import socket
+import struct
+import threading
+import time
+import unittest
+
+import six
+
+import bmemcached
+from bmemcached.circuit_breaker import CircuitBreaker
+from bmemcached.client.ejection import NodeEjector
+from bmemcached.protocol import Protocol
+
+if six.PY3:
+    from unittest import mock
+else:
+    import mock
+
+
+class _SlowServer(threading.Thread):
+    """
+    Server answering every request with an empty success response, one byte every `pace`
+    seconds.
+    """
+    def __init__(self, pace):
+        super(_SlowServer, self).__init__()
+        self.daemon = True
+        self.pace = pace
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(5)
+        self.server = '127.0.0.1:{}'.format(self.sock.getsockname()[1])
+
+    def run(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except socket.error:
+                return
+            threading.Thread(target=self.serve, args=(conn, )).start()
+
+    def read(self, conn, size):
+        data = b''
+        while len(data) < size:
+            chunk = conn.recv(size - len(data))
+            if not chunk:
+                raise socket.error()
+            data += chunk
+        return data
+
+    def serve(self, conn):
+        try:
+            while True:
+                header = self.read(conn, Protocol.HEADER_SIZE)
+                opcode, bodylen = struct.unpack(Protocol.HEADER_STRUCT, header)[1:7:5]
+                self.read(conn, bodylen)
+                response = struct.pack(Protocol.HEADER_STRUCT, Protocol.MAGIC['response'], opcode,
+                                       0, 0, 0, 0, 0, 0, 0)
+                for i in range(len(response)):
+                    time.sleep(self.pace)
+                    conn.sendall(response[i:i + 1])
+        except socket.error:
+            pass
+        finally:
+            conn.close()
+
+    def close(self):
+        self.sock.close()
+
+
+class DeadlineTests(unittest.TestCase):
+    def setUp(self):
+        self.slow = _SlowServer(0.02)
+        self.slow.start()
+        self.server = '{}:11211'.format(os.environ['MEMCACHED_HOST'])
+
+    def tearDown(self):
+        self.slow.close()
+
+    def testDeadlineSpansReceives(self):
+        protocol = Protocol(self.slow.server, socket_timeout=1, breaker=CircuitBreaker())
+        start = time.monotonic()
+        with bmemcached.Client([self.server]).deadline(0.1):
+            self.assertEqual(Protocol.STATUS['server_disconnected'], protocol.noop())
+        self.assertTrue(time.monotonic() - start < 0.3)
+        self.assertTrue(protocol.connection is None)
+        self.assertEqual(CircuitBreaker.CLOSED, protocol.breaker.state)
+
+        # Without a deadline every byte comes within socket_timeout.
+        self.assertEqual(Protocol.STATUS['success'], protocol.noop())
+        self.assertEqual(1, protocol.connection.gettimeout())
+        protocol.disconnect()
+
+    def testDeadlineAcrossShards(self):
+        ejector = NodeEjector(failure_threshold=1)
+        client = bmemcached.DistributedClient([self.server, self.slow.server], socket_timeout=1, ejector=ejector)
+        keys = ['key{}'.format(i) for i in range(20)]
+        fast_keys = [key for key in keys if client._get_server(key).server == self.server]
+        fast = bmemcached.Client([self.server])
+        fast.set_multi(dict((key, 'value') for key in fast_keys))
+
+        start = time.monotonic()
+        with client.deadline(0.15):
+            values = client.get_multi(keys)
+        self.assertTrue(time.monotonic() - start < 0.4)
+        self.assertTrue(set(values) <= set(fast_keys))
+        self.assertEqual(set(), ejector.ejected)
+        fast.delete_multi(fast_keys)
+        fast.disconnect_all()
+        client.disconnect_all()
+
+    def testExpiredDeadlineKeepsConnections(self):
+        client = bmemcached.Client([self.server])
+        client.set('test_key', 'value')
+        connection = next(client.servers).connection
+        with client.deadline(0):
+            self.assertEqual(None, client.get('test_key'))
+            self.assertFalse(client.set('test_key', 'value2'))
+        self.assertTrue(next(client.servers).connection is connection)
+        self.assertEqual('value', client.get('test_key'))
+        client.delete('test_key')
+        client.disconnect_all()
+
+    def testNestedDeadlines(self):
+        client = bmemcached.Client([self.server])
+        with client.deadline(10):
+            with client.deadline(0):
+                self.assertEqual(None, client.get('test_key'))
+            with client.deadline(20):
+                self.assertTrue(bmemcached.deadline.remaining() <= 10)
+        self.assertEqual(None, bmemcached.deadline.remaining())
+        client.disconnect_all()
+
+
+class ConnectTimeoutTests(unittest.TestCase):
+    def testSeparateTimeouts(self):
+        server = '{}:11211'.format(os.environ['MEMCACHED_HOST'])
+        client = bmemcached.Client([server], socket_timeout=2, connect_timeout=0.5)
+        create_connection = socket.create_connection
+        with mock.patch('socket.create_connection', side_effect=create_connection) as mocked:
+            client.get('test_key')
+        self.assertEqual(0.5, mocked.call_args[0][1])
+        self.assertEqual(2, next(client.servers).connection.gettimeout())
+        client.disconnect_all()
+
+    def testDeadlineShortensConnect(self):
+        breaker = CircuitBreaker()
+        protocol = Protocol('{}:11211'.format(os.environ['MEMCACHED_HOST']), socket_timeout=2, breaker=breaker)
+
+        def timeout(*args, **kwargs):
+            raise socket.timeout()
+
+        with mock.patch('socket.create_connection', side_effect=timeout) as mocked:
+            with bmemcached.deadline.deadline(0.5):
+                self.assertEqual(Protocol.STATUS['server_disconnected'], protocol.noop())
+        self.assertTrue(mocked.call_args[0][1] <= 0.5)
+        self.assertEqual(CircuitBreaker.CLOSED, breaker.state)
@@ -0,0 +1,102 @@
+import os
+import time
+import unittest
+
+import six
+
+import bmemcached
+from bmemcached.client.ejection import NodeEjector
+from test_health_check import MemcachedProcess
+
+if six.PY3:
+    from unittest import mock
+else:
+    import mock
+
+# Nothing listens on port 1, so connections are refused right away.
+DEAD_SERVER = '127.0.0.1:1'
+
+
+class NodeEjectionTests(unittest.TestCase):
+    def setUp(self):
+        self.server = '{}:11211'.format(os.environ['MEMCACHED_HOST'])
+        self.ejector = NodeEjector(failure_threshold=2, probe_interval=0.05, probe_successes=2)
+        self.client = bmemcached.DistributedClient([self.server, DEAD_SERVER], ejector=self.ejector)
+        self.dead = [server for server in self.client.servers if server.server == DEAD_SERVER][0]
+        self.dead_key = next(key for key in ('key{}'.format(i) for i in range(100))
+                             if self.client._get_server(key) is self.dead)
+
+    def tearDown(self):
+        self.client.delete(self.dead_key)
+        self.client.disconnect_all()
+
+    def wait_for(self, condition):
+        for _ in range(100):
+            if condition():
+                return
+            time.sleep(0.02)
+        self.fail('Timed out')
+
+    def testFailingServerIsEjected(self):
+        self.assertFalse(self.client.set(self.dead_key, 'value'))
+        self.assertEqual(set(), self.ejector.ejected)
+        self.client.get(self.dead_key)
+
+        self.assertEqual(set([DEAD_SERVER]), self.ejector.ejected)
+        self.assertEqual('ejected', self.ejector.events[-1][1])
+        self.assertEqual(DEAD_SERVER, self.ejector.events[-1][2])
+        self.assertTrue(self.client.set(self.dead_key, 'value'))
+        self.assertEqual('value', self.client.get(self.dead_key))
+
+    def testServerIsReadmittedAfterProbes(self):
+        events = []
+        self.ejector.add_listener(lambda event, server: events.append((event, server)))
+        self.client.get(self.dead_key)
+        self.client.get(self.dead_key)
+        self.assertTrue(self.ejector.is_ejected(DEAD_SERVER))
+
+        with mock.patch.object(bmemcached.protocol.Protocol, 'noop', return_value=0):
+            self.wait_for(lambda: not self.ejector.is_ejected(DEAD_SERVER))
+        self.assertEqual([('ejected', DEAD_SERVER), ('readmitted', DEAD_SERVER)], events)
+        self.assertTrue(self.client._get_server(self.dead_key) is self.dead)
+
+    def testRestartedServerIsReadmittedDuringBackoff(self):
+        memcached = MemcachedProcess()
+        self.addCleanup(memcached.stop)
+        client = bmemcached.DistributedClient([self.server, memcached.server], ejector=self.ejector)
+        self.addCleanup(client.disconnect_all)
+        restarted = [server for server in client.servers if server.server == memcached.server][0]
+        key = next(key for key in ('key{}'.format(i) for i in range(100)) if client._get_server(key) is restarted)
+        client.get(key)
+        client.get(key)
+        self.assertTrue(self.ejector.is_ejected(memcached.server))
+        self.assertFalse(restarted.breaker.allow())
+
+        memcached.start()
+        self.wait_for(lambda: not self.ejector.is_ejected(memcached.server))
+        self.assertTrue(client.set(key, 'value'))
+        direct = bmemcached.Client([memcached.server])
+        self.addCleanup(direct.disconnect_all)
+        self.assertEqual('value', direct.get(key))
+
+    def testFailingProbesKeepServerEjected(self):
+        self.client.get(self.dead_key)
+        self.client.get(self.dead_key)
+        time.sleep(0.2)
+        self.assertTrue(self.ejector.is_ejected(DEAD_SERVER))
+        self.assertFalse(self.client._get_server(self.dead_key) is self.dead)
+
+    def testSuccessResetsFailures(self):
+        ejector = NodeEjector(failure_threshold=2)
+        ejector.register([self.server, DEAD_SERVER])
+        ejector.record_failure(self.dead, None)
+        ejector.record_success(self.dead)
+        ejector.record_failure(self.dead, None)
+        self.assertEqual(set(), ejector.ejected)
+
+    def testLastServerIsNotEjected(self):
+        ejector = NodeEjector(failure_threshold=1)
+        client = bmemcached.DistributedClient([DEAD_SERVER], ejector=ejector)
+        client.get('test_key')
+        self.assertEqual(set(), ejector.ejected)
+        client.disconnect_all()
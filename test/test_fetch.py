@@ -0,0 +1,74 @@
+import os
+import time
+import unittest
+
+import six
+
+import bmemcached
+from bmemcached.envelope import Envelope
+
+if six.PY3:
+    from unittest import mock
+else:
+    import mock
+
+
+class EnvelopeTests(unittest.TestCase):
+    def setUp(self):
+        self.protocol = bmemcached.protocol.Protocol('{}:11211'.format(os.environ['MEMCACHED_HOST']))
+
+    def testRoundTrip(self):
+        for value in ('text', b'bytes', 42, {'a': 'b'}, 'compressible ' * 100):
+            flags, data = self.protocol.serialize(Envelope(value, 1234.5, 0.25))
+            self.assertEqual(self.protocol.FLAGS['envelope'], flags)
+            envelope = self.protocol.deserialize(data, flags)
+            self.assertEqual(value, envelope.value)
+            self.assertEqual(1234.5, envelope.expires_at)
+            self.assertEqual(0.25, envelope.delta)
+
+
+class FetchTests(unittest.TestCase):
+    def setUp(self):
+        self.server = '{}:11211'.format(os.environ['MEMCACHED_HOST'])
+        self.client = bmemcached.Client(self.server)
+        self.client.delete('test_key')
+
+    def tearDown(self):
+        self.client.delete('test_key')
+        self.client.disconnect_all()
+
+    def testComputesOnMiss(self):
+        self.assertEqual('value', self.client.fetch('test_key', lambda: 'value', 60))
+        envelope = self.client._fetch('test_key', envelopes=True)[0]
+        self.assertTrue(isinstance(envelope, Envelope))
+        self.assertAlmostEqual(time.time() + 60, envelope.expires_at, delta=5)
+
+    def testGetUnwrapsEnvelope(self):
+        self.client.fetch('test_key', lambda: 'value', 60)
+        self.assertEqual('value', self.client.get('test_key'))
+        self.assertEqual({'test_key': 'value'}, self.client.get_multi(['test_key']))
+
+    def testFreshValueIsReturned(self):
+        self.client.set('test_key', Envelope('cached', time.time() + 3600, 0.1))
+        self.assertEqual('cached', self.client.fetch('test_key', lambda: self.fail('computed'), 60))
+
+    def testExpiredValueIsRecomputed(self):
+        self.client.set('test_key', Envelope('cached', time.time() - 1, 0.1))
+        self.assertEqual('value', self.client.fetch('test_key', lambda: 'value', 60))
+
+    def testRecomputesEarlyNearExpiry(self):
+        # 10 seconds to expiry, but computing takes 5 seconds: -5 * log(0.01) ~= 23s.
+        self.client.set('test_key', Envelope('cached', time.time() + 10, 5))
+        with mock.patch('random.random', return_value=0.99):
+            self.assertEqual('value', self.client.fetch('test_key', lambda: 'value', 60))
+
+    def testPlainValuesAreReturned(self):
+        self.client.set('test_key', 'plain')
+        self.assertEqual('plain', self.client.fetch('test_key', lambda: self.fail('computed'), 60))
+
+
+class DistributedFetchTests(FetchTests):
+    def setUp(self):
+        self.server = '{}:11211'.format(os.environ['MEMCACHED_HOST'])
+        self.client = bmemcached.DistributedClient([self.server])
+        self.client.delete('test_key')
@@ -0,0 +1,99 @@
+import os
+import threading
+import time
+import unittest
+
+import bmemcached
+
+
+class GetOrSetTests(unittest.TestCase):
+    def setUp(self):
+        self.server = '{}:11211'.format(os.environ['MEMCACHED_HOST'])
+        self.client = bmemcached.Client(self.server)
+        self.reset()
+
+    def tearDown(self):
+        self.reset()
+        self.client.disconnect_all()
+
+    def reset(self):
+        self.client.delete_multi(['test_key', 'test_key:lease', 'test_key:stale'])
+
+    def testComputesOnMiss(self):
+        self.assertEqual('value', self.client.get_or_set('test_key', lambda: 'value', 60))
+        self.assertEqual('value', self.client.get('test_key'))
+        self.assertEqual(None, self.client.get('test_key:lease'))
+
+    def testReturnsCachedValue(self):
+        self.client.set('test_key', 'cached')
+        self.assertEqual('cached', self.client.get_or_set('test_key', lambda: self.fail('computed'), 60))
+
+    def testOnlyOneCallerComputes(self):
+        calls = []
+        results = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.3)
+            return 'value'
+
+        def run():
+            results.append(self.client.get_or_set('test_key', compute, 60))
+
+        threads = [threading.Thread(target=run) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(1, len(calls))
+        self.assertEqual(['value'] * 8, results)
+
+    def testLosersGetStaleValue(self):
+        self.client.get_or_set('test_key', lambda: 'old', 60, stale_time=60)
+        self.client.delete('test_key')
+        self.client.add('test_key:lease', 1, 30)
+        self.assertEqual('old', self.client.get_or_set('test_key', lambda: self.fail('computed'), 60, stale_time=60))
+
+    def testLosersComputeAfterWaiting(self):
+        self.client.add('test_key:lease', 1, 30)
+        self.assertEqual('value', self.client.get_or_set('test_key', lambda: 'value', 60, wait=0.1))
+        self.assertEqual(None, self.client.get('test_key'))
+
+    def testLeaseIsReleasedOnError(self):
+        def compute():
+            raise ValueError()
+
+        self.assertRaises(ValueError, self.client.get_or_set, 'test_key', compute, 60)
+        self.assertEqual(None, self.client.get('test_key:lease'))
+
+    def testLeaseTakenByAnotherCallerIsKept(self):
+        def compute():
+            # The lease expired and another caller took it.
+            self.client.delete('test_key:lease')
+            self.client.add('test_key:lease', b'other', 30)
+            return 'value'
+
+        self.assertEqual('value', self.client.get_or_set('test_key', compute, 60))
+        self.assertEqual(b'other', self.client.get('test_key:lease'))
+
+    def testNoneIsCached(self):
+        self.assertEqual(None, self.client.get_or_set('test_key', lambda: None, 60))
+        self.assertEqual(None, self.client.get_or_set('test_key', lambda: self.fail('computed'), 60))
+        self.assertEqual(None, self.client.get('test_key'))
+
+    def testUnreachableServerComputesRightAway(self):
+        client = bmemcached.Client('127.0.0.1:1')
+        client.enable_retry_delay(False)
+        self.addCleanup(next(client.servers).breaker.record_success)
+        start = time.monotonic()
+        self.assertEqual('value', client.get_or_set('test_key', lambda: 'value', 60, wait=2))
+        self.assertTrue(time.monotonic() - start < 1)
+
+
+class DistributedGetOrSetTests(GetOrSetTests):
+    def setUp(self):
+        self.server = '{}:11211'.format(os.environ['MEMCACHED_HOST'])
+        self.client = bmemcached.DistributedClient(
+            [self.server, '{}:5000'.format(os.environ['MEMCACHED_HOST'])])
+        self.reset()
@@ -0,0 +1,147 @@
+import os
+import socket
+import subprocess
+import time
+import unittest
+
+import six
+
+import bmemcached
+from bmemcached.client.health_check import HealthChecker
+
+if six.PY3:
+    from unittest import mock
+else:
+    import mock
+
+# Nothing listens on port 1, so connections are refused right away.
+DEAD_SERVER = '127.0.0.1:1'
+
+
+class MemcachedProcess(object):
+    """
+    A memcached server on a port of its own, which can be stopped and started again.
+    """
+    def __init__(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind(('127.0.0.1', 0))
+        self.port = sock.getsockname()[1]
+        sock.close()
+        self.server = '{}:{}'.format(os.environ['MEMCACHED_HOST'], self.port)
+        self.process = None
+
+    def start(self):
+        self.process = subprocess.Popen(['memcached', '-p{}'.format(self.port)],
+                                        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        for _ in range(100):
+            try:
+                socket.create_connection((os.environ['MEMCACHED_HOST'], self.port), 1).close()
+                return
+            except socket.error:
+                time.sleep(0.02)
+        raise AssertionError('memcached did not start')
+
+    def stop(self):
+        if self.process is not None:
+            self.process.kill()
+            self.process.wait()
+            self.process = None
+
+
+class HealthCheckTests(unittest.TestCase):
+    def setUp(self):
+        self.server = '{}:11211'.format(os.environ['MEMCACHED_HOST'])
+        self.client = bmemcached.DistributedClient([self.server, DEAD_SERVER])
+        self.checker = self.client.health_checker = HealthChecker(self.client, failure_threshold=2)
+        self.dead = [server for server in self.client.servers if server.server == DEAD_SERVER][0]
+        self.dead_key = next(key for key in ('key{}'.format(i) for i in range(100))
+                             if self.client._get_server(key) is self.dead)
+
+    def tearDown(self):
+        self.client.delete(self.dead_key)
+        self.client.disconnect_all()
+
+    def testMeasuresRoundTrips(self):
+        results = self.checker.check()
+        self.assertTrue(results[self.server] > 0)
+        self.assertEqual(None, results[DEAD_SERVER])
+        self.assertEqual(results[self.server], self.checker.rtt(self.server))
+        self.assertEqual(None, self.checker.rtt(DEAD_SERVER))
+
+        previous = self.checker.rtt(self.server)
+        rtt = self.checker.check()[self.server]
+        self.assertAlmostEqual(previous + 0.3 * (rtt - previous), self.checker.rtt(self.server))
+
+    def testDownServerLeavesRing(self):
+        self.checker.check()
+        self.assertEqual(set(), self.checker.down)
+        self.checker.check()
+        self.assertEqual(set([DEAD_SERVER]), self.checker.down)
+
+        self.assertFalse(self.client._get_server(self.dead_key) is self.dead)
+        self.assertTrue(self.client.set(self.dead_key, 'value'))
+        self.assertEqual('value', self.client.get(self.dead_key))
+
+    def testServerComesBack(self):
+        self.checker.check()
+        self.checker.check()
+        with mock.patch.object(bmemcached.protocol.Protocol, 'noop', return_value=0):
+            self.checker.check()
+        self.assertEqual(set(), self.checker.down)
+        self.assertTrue(self.client._get_server(self.dead_key) is self.dead)
+
+    def testServerRestartIsNoticedDuringBackoff(self):
+        memcached = MemcachedProcess()
+        self.addCleanup(memcached.stop)
+        client = bmemcached.Client([memcached.server])
+        self.addCleanup(client.disconnect_all)
+        checker = HealthChecker(client, failure_threshold=1)
+        checker.check()
+        self.assertEqual(set([memcached.server]), checker.down)
+        breaker = next(client.servers).breaker
+        self.assertFalse(breaker.allow())
+
+        memcached.start()
+        checker.check()
+        self.assertEqual(set(), checker.down)
+        # Request threads reconnect without waiting out the backoff.
+        client.disconnect_all()
+        self.assertTrue(client.set('test_key', 'value'))
+
+    def testRemovedServersAreForgotten(self):
+        self.checker.check()
+        self.checker.check()
+        self.client.remove_server(DEAD_SERVER)
+        self.checker.check()
+        self.assertEqual(set(), self.checker.down)
+        self.assertEqual(None, self.checker.rtt(DEAD_SERVER))
+
+    def testReplicaSelection(self):
+        client = bmemcached.DistributedClient([self.server, DEAD_SERVER], hot_key_replicas=2,
+                                              hot_key_read='least_loaded')
+        client.health_checker = HealthChecker(client, failure_threshold=1)
+        client.health_checker.check()
+        replicas = list(client.servers)
+        for _ in range(10):
+            self.assertEqual(self.server, client._pick_replica(replicas).server)
+        client.disconnect_all()
+
+    def testReplicatingReadOrder(self):
+        client = bmemcached.Client([DEAD_SERVER, self.server])
+        client.health_checker = HealthChecker(client, failure_threshold=1)
+        self.assertEqual([DEAD_SERVER, self.server], [server.server for server in client._read_servers()])
+        client.health_checker.check()
+        self.assertEqual([self.server, DEAD_SERVER], [server.server for server in client._read_servers()])
+        client.disconnect_all()
+
+    def testBackgroundThread(self):
+        client = bmemcached.Client([self.server], health_check_interval=0.01)
+        try:
+            for _ in range(100):
+                if client.health_checker.rtt(self.server) is not None:
+                    break
+                time.sleep(0.01)
+            self.assertTrue(client.health_checker.rtt(self.server) > 0)
+        finally:
+            client.health_checker.stop()
+        self.assertTrue(client.health_checker._thread is None)
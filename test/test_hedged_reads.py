@@ -0,0 +1,149 @@
+import gc
+import os
+import socket
+import threading
+import time
+import unittest
+
+import bmemcached
+from bmemcached.client.hedging import LatencyTracker
+
+
+class _SilentServer(threading.Thread):
+    """
+    Server accepting connections and never answering.
+    """
+    def __init__(self):
+        super(_SilentServer, self).__init__()
+        self.daemon = True
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(5)
+        self.server = '127.0.0.1:{}'.format(self.sock.getsockname()[1])
+        self.connections = []
+
+    def run(self):
+        while True:
+            try:
+                self.connections.append(self.sock.accept()[0])
+            except socket.error:
+                return
+
+    def close(self):
+        self.sock.close()
+        for conn in self.connections:
+            conn.close()
+
+
+class HedgedReadTests(unittest.TestCase):
+    def setUp(self):
+        host = os.environ['MEMCACHED_HOST']
+        self.server = '{}:11211'.format(host)
+        self.other = '{}:5000'.format(host)
+        self.silent = _SilentServer()
+        self.silent.start()
+        self.direct = bmemcached.Client([self.server])
+        self.direct.set('test_key', 'value')
+
+    def tearDown(self):
+        self.direct.delete('test_key')
+        self.direct.disconnect_all()
+        self.silent.close()
+
+    def testSlowServerIsHedged(self):
+        client = bmemcached.Client([self.silent.server, self.server], socket_timeout=2, hedge_after=0.02)
+        start = time.monotonic()
+        self.assertEqual('value', client.get('test_key'))
+        self.assertTrue(time.monotonic() - start < 0.5)
+        self.assertEqual(1, client.latencies.hedged)
+        self.assertEqual(1, client.latencies.hedge_wins)
+
+    def testConcurrentSlowReads(self):
+        client = bmemcached.Client([self.silent.server, self.server], socket_timeout=2, hedge_after=0.02,
+                                   hedge_workers=2)
+        results = []
+
+        def read():
+            start = time.monotonic()
+            results.append((client.get('test_key'), time.monotonic() - start))
+
+        threads = [threading.Thread(target=read) for _ in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(['value'] * 16, [value for value, duration in results])
+        self.assertTrue(max(duration for value, duration in results) < 1)
+        self.assertEqual(16, client.latencies.hedge_wins)
+        self.assertEqual(0, client._hedges)
+
+    def testWakeupSocketsAreClosed(self):
+        client = bmemcached.Client([self.silent.server, self.server], socket_timeout=2, hedge_after=0.02)
+        sockets = []
+
+        def read():
+            client.get('test_key')
+            sockets.extend(client._wakeup_sockets())
+
+        thread = threading.Thread(target=read)
+        thread.start()
+        thread.join()
+        gc.collect()
+        self.assertEqual(2, len(sockets))
+        self.assertEqual([-1, -1], [sock.fileno() for sock in sockets])
+
+        self.assertEqual('value', client.get('test_key'))
+        sockets = client._wakeup_sockets()
+        client.disconnect_all()
+        self.assertEqual([-1, -1], [sock.fileno() for sock in sockets])
+        self.assertEqual('value', client.get('test_key'))
+        client.disconnect_all()
+
+    def testMissGoesToNextServer(self):
+        client = bmemcached.Client([self.other, self.server], hedge_after=10)
+        start = time.monotonic()
+        self.assertEqual('value', client.get('test_key'))
+        self.assertTrue(time.monotonic() - start < 1)
+        self.assertEqual(0, client.latencies.hedged)
+        self.assertEqual(None, client.get('missing_key'))
+
+    def testFastServerIsNotHedged(self):
+        client = bmemcached.Client([self.server, self.silent.server], socket_timeout=2, hedge_after='p95')
+        for _ in range(30):
+            self.assertEqual('value', client.get('test_key'))
+        self.assertEqual(0, client.latencies.hedged)
+        self.assertTrue(client.latencies.percentile(self.server, 95) < client.DEFAULT_HEDGE_DELAY)
+
+    def testDeadlineReachesHedgingThreads(self):
+        other = _SilentServer()
+        other.start()
+        self.addCleanup(other.close)
+        client = bmemcached.Client([self.silent.server, other.server], socket_timeout=2, hedge_after=0.01)
+        start = time.monotonic()
+        with client.deadline(0.1):
+            self.assertEqual(None, client.get('test_key'))
+        self.assertTrue(time.monotonic() - start < 0.5)
+
+    def testInvalidHedgeAfter(self):
+        for value in ('p', 'p100', 'fast', -1):
+            self.assertRaises(ValueError, bmemcached.Client, [self.server], hedge_after=value)
+
+
+class LatencyTrackerTests(unittest.TestCase):
+    def testPercentile(self):
+        tracker = LatencyTracker(window=100, min_samples=10)
+        for i in range(9):
+            tracker.record('server', i)
+        self.assertEqual(None, tracker.percentile('server', 95))
+        for i in range(9, 100):
+            tracker.record('server', i / 100.0 if i < 95 else 10)
+        self.assertEqual(10, tracker.percentile('server', 95))
+        self.assertEqual(None, tracker.percentile('other', 95))
+
+    def testWindow(self):
+        tracker = LatencyTracker(window=10, min_samples=1)
+        for _ in range(10):
+            tracker.record('server', 1)
+        for _ in range(10):
+            tracker.record('server', 2)
+        self.assertEqual(2, tracker.percentile('server', 50))
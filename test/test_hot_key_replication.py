@@ -0,0 +1,135 @@
+import os
+import unittest
+
+import six
+
+import bmemcached
+from bmemcached.client.hot_keys import HotKeyDetector
+
+if six.PY3:
+    from unittest import mock
+else:
+    import mock
+
+
+class HotKeyReplicationTests(unittest.TestCase):
+    def setUp(self):
+        self.servers = ['{}:11211'.format(os.environ['MEMCACHED_HOST']),
+                        '{}:5000'.format(os.environ['MEMCACHED_HOST'])]
+        self.client = bmemcached.DistributedClient(self.servers, hot_key_replicas=2)
+        self.client.add_hot_key('test_key')
+        self.primary, self.replica = self.client._get_replicas('test_key')
+        self.reset()
+
+    def tearDown(self):
+        self.reset()
+        self.client.disconnect_all()
+
+    def reset(self):
+        for server in self.client._servers:
+            server.delete_multi(['test_key', 'test_key2'])
+
+    def testReplicas(self):
+        self.assertEqual(self.client._get_server('test_key'), self.primary)
+        self.assertNotEqual(self.primary, self.replica)
+
+    def testWritesGoToReplicas(self):
+        self.assertTrue(self.client.set('test_key', 'value'))
+        self.assertEqual('value', self.primary.get('test_key')[0])
+        self.assertEqual('value', self.replica.get('test_key')[0])
+
+    def testSetMultiWritesReplicas(self):
+        self.assertEqual([], self.client.set_multi({'test_key': 'value', 'test_key2': 'value2'}))
+        self.assertEqual('value', self.replica.get('test_key')[0])
+        other = self.client._get_replicas('test_key2')[1]
+        self.assertEqual(None, other.get('test_key2')[0])
+
+    def testSetMultiSkipsReplicasOfRejectedKeys(self):
+        self.client.set('test_key', 'value')
+        value, cas = self.client.gets('test_key')
+        self.client.set('test_key', 'value2')
+        self.assertEqual(['test_key'], [
+            key[0] for key in self.client.set_multi({('test_key', cas): 'rejected'})])
+        self.assertEqual('value2', self.primary.get('test_key')[0])
+        self.assertEqual('value2', self.replica.get('test_key')[0])
+
+    def testReadsFromReplica(self):
+        self.client.set('test_key', 'value')
+        self.primary.delete('test_key')
+        with mock.patch('random.choice', return_value=self.replica):
+            self.assertEqual('value', self.client.get('test_key'))
+            self.assertEqual({'test_key': 'value'}, self.client.get_multi(['test_key']))
+
+    def testMissingReplicaFallsBackToPrimary(self):
+        self.primary.set('test_key', 'value', 0)
+        with mock.patch('random.choice', return_value=self.replica):
+            self.assertEqual('value', self.client.get('test_key'))
+            self.assertEqual({'test_key': 'value'}, self.client.get_multi(['test_key']))
+
+    def testCasReadsUsePrimary(self):
+        self.client.set('test_key', 'value')
+        with mock.patch('random.choice', return_value=self.replica):
+            value, cas = self.client.gets('test_key')
+        self.assertTrue(self.client.cas('test_key', 'new', cas))
+        self.assertEqual('new', self.replica.get('test_key')[0])
+
+    def testDeleteAndIncrDropReplicas(self):
+        self.client.set('test_key', 'value')
+        self.client.delete('test_key')
+        self.assertEqual(None, self.replica.get('test_key')[0])
+
+        self.client.set('test_key', 1)
+        self.client.incr('test_key', 1)
+        self.assertEqual(None, self.replica.get('test_key')[0])
+
+    def testRemoveHotKey(self):
+        self.client.set('test_key', 'value')
+        self.client.remove_hot_key('test_key')
+        self.assertEqual(None, self.replica.get('test_key')[0])
+        self.client.set('test_key', 'value')
+        self.assertEqual(None, self.replica.get('test_key')[0])
+
+    def testLeastLoaded(self):
+        client = bmemcached.DistributedClient(self.servers, hot_key_replicas=2, hot_key_read='least_loaded')
+        client._in_flight[self.primary] = 5
+        self.assertEqual(self.replica, client._pick_replica([self.primary, self.replica]))
+
+    def testAutoDetection(self):
+        detector = HotKeyDetector(sample_rate=1)
+        client = bmemcached.DistributedClient(self.servers, hot_keys=detector, hot_key_replicas=2,
+                                              hot_key_threshold=3)
+        client.HOT_KEY_REFRESH_INTERVAL = 0
+        client.set('test_key', 'value')
+        self.assertEqual(None, self.replica.get('test_key')[0])
+        client.get('test_key')
+        client.get('test_key')
+        client.set('test_key', 'value')
+        self.assertEqual('value', self.replica.get('test_key')[0])
+        client.disconnect_all()
+
+    def testCooledDownKeyStopsBeingReplicated(self):
+        detector = HotKeyDetector(sample_rate=1)
+        client = bmemcached.DistributedClient(self.servers, hot_keys=detector, hot_key_replicas=2,
+                                              hot_key_threshold=3)
+        client.HOT_KEY_REFRESH_INTERVAL = 0
+        for _ in range(3):
+            client.get('test_key')
+        client.set('test_key', 'value')
+        self.assertEqual('value', self.replica.get('test_key')[0])
+
+        detector.clear()
+        client.set('test_key', 'value2')
+        self.assertEqual(set(), client._detected_hot_keys)
+        self.assertEqual(None, self.replica.get('test_key')[0])
+        self.assertEqual('value2', client.get('test_key'))
+        client.disconnect_all()
+
+    def testDisabled(self):
+        client = bmemcached.DistributedClient(self.servers)
+        client.add_hot_key('test_key')
+        client.set('test_key', 'value')
+        self.assertEqual(None, self.replica.get('test_key')[0])
+        client.disconnect_all()
+
+    def testUnknownReadStrategy(self):
+        self.assertRaises(ValueError, bmemcached.DistributedClient, self.servers, hot_key_read='nearest')
@@ -0,0 +1,77 @@
+import os
+import unittest
+
+import bmemcached
+from bmemcached.client.hot_keys import HotKeyDetector
+
+
+class HotKeyDetectorTests(unittest.TestCase):
+    def testReportsHeaviestKeysFirst(self):
+        detector = HotKeyDetector(sample_rate=1, top_k=3)
+        for i in range(100):
+            detector.record(['hot'])
+            if i % 2:
+                detector.record(['warm'])
+            detector.record(['cold{}'.format(i)])
+        report = detector.report()
+        self.assertEqual([None], list(report))
+        keys = [key for key, count in report[None]]
+        self.assertEqual(['hot', 'warm'], keys[:2])
+        self.assertEqual(3, len(keys))
+        self.assertEqual(100, report[None][0][1])
+
+    def testCountsPerServer(self):
+        detector = HotKeyDetector(sample_rate=1)
+        detector.record(['a', 'b', 'a'], lambda key: 'server-' + key)
+        self.assertEqual({'server-a': [('a', 2)], 'server-b': [('b', 1)]}, detector.report())
+
+    def testCountsAreScaledBySampleRate(self):
+        detector = HotKeyDetector(sample_rate=0.5)
+        detector.record(['hot'] * 10000)
+        count = detector.report()[None][0][1]
+        self.assertAlmostEqual(10000, count, delta=1000)
+
+    def testHotKeys(self):
+        detector = HotKeyDetector(sample_rate=1)
+        detector.record(['hot'] * 10 + ['cold'])
+        self.assertEqual(set(['hot']), detector.hot_keys(5))
+
+    def testInvalidSampleRate(self):
+        self.assertRaises(ValueError, HotKeyDetector, sample_rate=0)
+
+
+class ClientHotKeysTests(unittest.TestCase):
+    def setUp(self):
+        self.server = '{}:11211'.format(os.environ['MEMCACHED_HOST'])
+        self.detector = HotKeyDetector(sample_rate=1)
+        self.client = bmemcached.Client(self.server, hot_keys=self.detector)
+
+    def tearDown(self):
+        self.client.delete('test_key')
+        self.client.disconnect_all()
+
+    def testOperationsAreRecorded(self):
+        self.client.set('test_key', 'value')
+        self.client.get('test_key')
+        self.client.get_multi(['test_key', 'test_key2'])
+        counts = dict(self.detector.report()[None])
+        self.assertEqual(3, counts['test_key'])
+        self.assertEqual(1, counts['test_key2'])
+
+
+class DistributedClientHotKeysTests(ClientHotKeysTests):
+    def setUp(self):
+        self.server = '{}:11211'.format(os.environ['MEMCACHED_HOST'])
+        self.detector = HotKeyDetector(sample_rate=1)
+        self.client = bmemcached.DistributedClient(
+            [self.server, '{}:5000'.format(os.environ['MEMCACHED_HOST'])], hot_keys=self.detector)
+
+    def testOperationsAreRecorded(self):
+        self.client.set('test_key', 'value')
+        self.client.get('test_key')
+        self.client.get_multi(['test_key', 'test_key2'])
+        report = self.detector.report()
+        server = self.client._get_server('test_key').server
+        self.assertEqual(3, dict(report[server])['test_key'])
+        server = self.client._get_server('test_key2').server
+        self.assertEqual(1, dict(report[server])['test_key2'])
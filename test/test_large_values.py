@@ -0,0 +1,186 @@
+import os
+import unittest
+
+import six
+
+import bmemcached
+from bmemcached.chunking import ChunkManifest
+
+if six.PY3:
+    from unittest import mock
+else:
+    import mock
+
+
+class LargeValuesTests(unittest.TestCase):
+    def setUp(self):
+        self.server = '{}:11211'.format(os.environ['MEMCACHED_HOST'])
+        self.client = bmemcached.Client(self.server, large_values=True, max_value_size=1024)
+        self.data = os.urandom(10 * 1024 + 7)
+        self.reset()
+
+    def tearDown(self):
+        self.reset()
+        self.client.disconnect_all()
+
+    def reset(self):
+        self.client.delete('test_key')
+        self.client.delete('test_key2')
+
+    def testSetGet(self):
+        self.assertTrue(self.client.set('test_key', self.data))
+        self.assertEqual(self.data, self.client.get('test_key'))
+
+    def testManifestIsStoredUnderKey(self):
+        self.client.set('test_key', self.data)
+        manifest, cas = list(self.client.servers)[0].get('test_key')
+        self.assertTrue(isinstance(manifest, ChunkManifest))
+        self.assertEqual(11, manifest.count)
+        self.assertEqual(len(self.data), manifest.length)
+
+    def testSmallValuesAreNotChunked(self):
+        self.client.set('test_key', 'small')
+        self.assertEqual('small', list(self.client.servers)[0].get('test_key')[0])
+        self.assertEqual('small', self.client.get('test_key'))
+
+    def testObjects(self):
+        value = {'rows': [os.urandom(100) for _ in range(50)]}
+        self.client.set('test_key', value, compress_level=0)
+        self.assertEqual(value, self.client.get('test_key'))
+
+    def testGetMulti(self):
+        self.assertEqual([], self.client.set_multi({'test_key': self.data, 'test_key2': 'small'}))
+        self.assertEqual({'test_key': self.data, 'test_key2': 'small'},
+                         self.client.get_multi(['test_key', 'test_key2']))
+
+    def testAddReplace(self):
+        self.assertTrue(self.client.add('test_key', self.data))
+        self.assertFalse(self.client.add('test_key', self.data))
+        self.assertTrue(self.client.replace('test_key', self.data[::-1]))
+        self.assertEqual(self.data[::-1], self.client.get('test_key'))
+
+    def manifest(self, key='test_key'):
+        return list(self.client.servers)[0].get(key)[0]
+
+    def stored_chunks(self, manifest, key='test_key'):
+        return self.client.get_multi(manifest.chunk_keys(key))
+
+    def testDeleteRemovesChunks(self):
+        self.client.set('test_key', self.data)
+        manifest = self.manifest()
+        self.assertEqual(11, len(self.stored_chunks(manifest)))
+        self.assertTrue(self.client.delete('test_key'))
+        self.assertEqual({}, self.stored_chunks(manifest))
+
+        self.client.set_multi({'test_key': self.data, 'test_key2': self.data})
+        manifests = [self.manifest(), self.manifest('test_key2')]
+        self.assertTrue(self.client.delete_multi(['test_key', 'test_key2']))
+        self.assertEqual({}, self.stored_chunks(manifests[0]))
+        self.assertEqual({}, self.stored_chunks(manifests[1], 'test_key2'))
+
+    def testOverwriteRemovesChunks(self):
+        self.client.set('test_key', self.data)
+        manifest = self.manifest()
+        self.client.set('test_key', self.data[::-1])
+        self.assertEqual({}, self.stored_chunks(manifest))
+        self.assertEqual(self.data[::-1], self.client.get('test_key'))
+
+        manifest = self.manifest()
+        self.assertEqual([], self.client.set_multi({'test_key': 'small'}))
+        self.assertEqual({}, self.stored_chunks(manifest))
+        self.assertEqual('small', self.client.get('test_key'))
+
+    def testFailedWriteRemovesChunks(self):
+        self.client.set('test_key', self.data)
+        manifest = self.manifest()
+        token = b'\x01' * 8
+        with mock.patch('bmemcached.chunking.os.urandom', return_value=token):
+            self.assertFalse(self.client.add('test_key', self.data[::-1]))
+            self.assertFalse(self.client.cas('test_key', self.data[::-1], 1))
+        rejected = ChunkManifest(0, len(self.data), 11, 0, token)
+        self.assertEqual({}, self.stored_chunks(rejected))
+        self.assertEqual(11, len(self.stored_chunks(manifest)))
+        self.assertEqual(self.data, self.client.get('test_key'))
+
+    def testLongKey(self):
+        key = 'k' * 240
+        self.assertTrue(self.client.set(key, self.data))
+        try:
+            self.assertEqual(self.data, self.client.get(key))
+            manifest = self.manifest(key)
+            self.assertTrue(all(len(k) <= 250 for k in manifest.chunk_keys(key)))
+            self.assertEqual(11, len(self.stored_chunks(manifest, key)))
+        finally:
+            self.client.delete(key)
+
+    def testMissingChunkIsAMiss(self):
+        self.client.set('test_key', self.data)
+        manifest, cas = list(self.client.servers)[0].get('test_key')
+        self.client.delete(manifest.chunk_keys('test_key')[3])
+        self.assertEqual(None, self.client.get('test_key'))
+        self.assertEqual({}, self.client.get_multi(['test_key']))
+
+    def testCorruptedChunkIsAMiss(self):
+        self.client.set('test_key', self.data)
+        manifest, cas = list(self.client.servers)[0].get('test_key')
+        self.client.set(manifest.chunk_keys('test_key')[0], b'x' * 1024)
+        self.assertEqual(None, self.client.get('test_key'))
+
+    def testAboveServerItemSize(self):
+        client = bmemcached.Client(self.server, large_values=True)
+        data = os.urandom(3 * 1024 * 1024)
+        try:
+            self.assertTrue(client.set('test_key', data))
+            self.assertEqual(data, client.get('test_key'))
+        finally:
+            client.disconnect_all()
+
+
+class DistributedLargeValuesTests(LargeValuesTests):
+    def setUp(self):
+        self.server = '{}:11211'.format(os.environ['MEMCACHED_HOST'])
+        self.servers = [self.server, '{}:5000'.format(os.environ['MEMCACHED_HOST'])]
+        self.client = bmemcached.DistributedClient(self.servers, large_values=True, max_value_size=1024)
+        self.data = os.urandom(10 * 1024 + 7)
+        self.reset()
+
+    def manifest(self, key='test_key'):
+        return self.client._get_server(key).get(key)[0]
+
+    def testManifestIsStoredUnderKey(self):
+        self.client.set('test_key', self.data)
+        manifest, cas = self.client._get_server('test_key').get('test_key')
+        self.assertTrue(isinstance(manifest, ChunkManifest))
+        self.assertEqual(11, manifest.count)
+
+    def testSmallValuesAreNotChunked(self):
+        self.client.set('test_key', 'small')
+        self.assertEqual('small', self.client._get_server('test_key').get('test_key')[0])
+
+    def testMissingChunkIsAMiss(self):
+        self.client.set('test_key', self.data)
+        manifest, cas = self.client._get_server('test_key').get('test_key')
+        self.client.delete(manifest.chunk_keys('test_key')[3])
+        self.assertEqual(None, self.client.get('test_key'))
+        self.assertEqual({}, self.client.get_multi(['test_key']))
+
+    def testCorruptedChunkIsAMiss(self):
+        self.client.set('test_key', self.data)
+        manifest, cas = self.client._get_server('test_key').get('test_key')
+        self.client.set(manifest.chunk_keys('test_key')[0], b'x' * 1024)
+        self.assertEqual(None, self.client.get('test_key'))
+
+    def testChunksAreSpreadOverServers(self):
+        self.client.set('test_key', os.urandom(32 * 1024))
+        manifest, cas = self.client._get_server('test_key').get('test_key')
+        servers = set(self.client._get_server(k) for k in manifest.chunk_keys('test_key'))
+        self.assertEqual(2, len(servers))
+
+    def testAboveServerItemSize(self):
+        client = bmemcached.DistributedClient(self.servers, large_values=True)
+        data = os.urandom(3 * 1024 * 1024)
+        try:
+            self.assertTrue(client.set('test_key', data))
+            self.assertEqual(data, client.get('test_key'))
+        finally:
+            client.disconnect_all()
@@ -0,0 +1,179 @@
+import os
+import unittest
+
+import six
+
+import bmemcached
+from bmemcached.client.near_cache import NearCache
+
+if six.PY3:
+    from unittest import mock
+else:
+    import mock
+
+
+class NearCacheTests(unittest.TestCase):
+    def testGetSet(self):
+        cache = NearCache()
+        self.assertEqual(None, cache.get('test_key'))
+        self.assertTrue(cache.set('test_key', 'value'))
+        self.assertEqual('value', cache.get(b'test_key'))
+        self.assertEqual({'hits': 1, 'misses': 1, 'hit_ratio': 0.5, 'evictions': 0, 'items': 1, 'bytes': 5},
+                         cache.stats())
+
+    def testDelete(self):
+        cache = NearCache()
+        cache.set('test_key', 'value')
+        cache.delete(b'test_key')
+        self.assertEqual(None, cache.get('test_key'))
+
+    def testExpire(self):
+        cache = NearCache(ttl=10)
+        with mock.patch('time.monotonic', return_value=100):
+            cache.set('test_key', 'value')
+        with mock.patch('time.monotonic', return_value=109):
+            self.assertEqual('value', cache.get('test_key'))
+        with mock.patch('time.monotonic', return_value=111):
+            self.assertEqual(None, cache.get('test_key'))
+        self.assertEqual(0, len(cache))
+
+    def testLRUEviction(self):
+        cache = NearCache(max_items=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual(1, cache.get('a'))
+        self.assertEqual(None, cache.get('b'))
+        self.assertEqual(3, cache.get('c'))
+        self.assertEqual(1, cache.stats()['evictions'])
+
+    def testBytesLimit(self):
+        cache = NearCache(max_bytes=10)
+        cache.set('a', b'12345')
+        cache.set('b', b'12345')
+        cache.set('c', b'123')
+        self.assertEqual(None, cache.get('a'))
+        self.assertEqual(8, cache.stats()['bytes'])
+        self.assertFalse(cache.set('d', b'x' * 11))
+
+    def testTinyLFUKeepsFrequentKeys(self):
+        cache = NearCache(max_items=2, policy='tinylfu')
+        for key in ('hot', 'warm'):
+            for _ in range(5):
+                cache.get(key)
+            cache.set(key, key)
+
+        # A key seen once is not admitted over keys requested more often.
+        cache.get('cold')
+        self.assertFalse(cache.set('cold', 'cold'))
+        self.assertEqual('hot', cache.get('hot'))
+        self.assertEqual('warm', cache.get('warm'))
+
+    def testUnknownPolicy(self):
+        self.assertRaises(ValueError, NearCache, policy='fifo')
+
+
+class ClientNearCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.server = '{}:11211'.format(os.environ['MEMCACHED_HOST'])
+        self.near_cache = NearCache()
+        self.client = bmemcached.Client(self.server, near_cache=self.near_cache)
+        self.other = bmemcached.Client(self.server)
+        self.reset()
+
+    def tearDown(self):
+        self.reset()
+        self.client.disconnect_all()
+        self.other.disconnect_all()
+
+    def reset(self):
+        self.client.delete_multi(['test_key', 'test_key2'])
+
+    def testHitsDoNotGoToServer(self):
+        self.client.set('test_key', 'value')
+        self.assertEqual('value', self.client.get('test_key'))
+        with mock.patch.object(bmemcached.protocol.Protocol, 'get') as mocked_get:
+            self.assertEqual('value', self.client.get('test_key'))
+            mocked_get.assert_not_called()
+        self.assertEqual(1, self.near_cache.stats()['hits'])
+
+    def testLocalWritesInvalidate(self):
+        self.client.set('test_key', 'value')
+        self.client.get('test_key')
+        self.client.set('test_key', 'value2')
+        self.assertEqual('value2', self.client.get('test_key'))
+        self.client.delete('test_key')
+        self.assertEqual(None, self.client.get('test_key'))
+
+    def testWriteDuringReadIsNotHidden(self):
+        self.client.set('test_key', 'old')
+        self.near_cache.clear()
+        get = self.client._get
+
+        def get_then_write(key, get_cas=False):
+            result = get(key, get_cas)
+            self.client.set('test_key', 'new')
+            return result
+
+        with mock.patch.object(self.client, '_get', side_effect=get_then_write):
+            self.assertEqual('old', self.client.get('test_key'))
+        self.assertEqual('new', self.client.get('test_key'))
+
+    def testWriteDuringGetMultiIsNotHidden(self):
+        self.client.set('test_key', 'old')
+        self.near_cache.clear()
+        get_multi = self.client._get_multi
+
+        def get_multi_then_write(keys, get_cas=False):
+            result = get_multi(keys, get_cas)
+            self.client.set('test_key', 'new')
+            return result
+
+        with mock.patch.object(self.client, '_get_multi', side_effect=get_multi_then_write):
+            self.assertEqual({'test_key': 'old'}, self.client.get_multi(['test_key']))
+        self.assertEqual({'test_key': 'new'}, self.client.get_multi(['test_key']))
+
+    def testWriteGenerationOnlyTakenForCaches(self):
+        self.client.set('test_key', 'value')
+        uncached = self.other
+        with mock.patch.object(uncached, '_write_generation') as mocked:
+            uncached.get('test_key')
+            uncached.get_multi(['test_key', 'test_key2'])
+            mocked.assert_not_called()
+        with mock.patch.object(self.client, '_write_generation') as mocked:
+            self.client.get('test_key', get_cas=True)
+            self.client.get_multi(['test_key', 'test_key2'], get_cas=True)
+            mocked.assert_not_called()
+
+    def testRemoteWritesAreServedUntilExpired(self):
+        self.client.set('test_key', 'value')
+        self.client.get('test_key')
+        self.other.set('test_key', 'value2')
+        self.assertEqual('value', self.client.get('test_key'))
+        self.assertEqual('value2', self.client.get('test_key', get_cas=True)[0])
+
+    def testGetMulti(self):
+        self.client.set_multi({'test_key': 'value', 'test_key2': 'value2'})
+        self.client.get('test_key')
+        with mock.patch.object(bmemcached.protocol.Protocol, 'get_multi',
+                               return_value={'test_key2': ('value2', 1)}) as mocked_get_multi:
+            self.assertEqual({'test_key': 'value', 'test_key2': 'value2'},
+                             self.client.get_multi(['test_key', 'test_key2']))
+            mocked_get_multi.assert_called_once_with(['test_key2'])
+        self.assertEqual('value2', self.near_cache.get('test_key2'))
+
+    def testFlushAllClears(self):
+        self.client.set('test_key', 'value')
+        self.client.get('test_key')
+        self.client.flush_all()
+        self.assertEqual(0, len(self.near_cache))
+
+
+class DistributedClientNearCacheTests(ClientNearCacheTests):
+    def setUp(self):
+        self.server = '{}:11211'.format(os.environ['MEMCACHED_HOST'])
+        self.near_cache = NearCache()
+        self.client = bmemcached.DistributedClient([self.server], near_cache=self.near_cache)
+        self.other = bmemcached.DistributedClient([self.server])
+        self.reset()
@@ -0,0 +1,128 @@
+import os
+import unittest
+
+import six
+
+import bmemcached
+from bmemcached.client.negative_cache import NegativeCache
+
+if six.PY3:
+    from unittest import mock
+else:
+    import mock
+
+
+class NegativeCacheTests(unittest.TestCase):
+    def testAddDelete(self):
+        cache = NegativeCache()
+        self.assertFalse('test_key' in cache)
+        cache.add('test_key')
+        self.assertTrue(b'test_key' in cache)
+        cache.delete(b'test_key')
+        self.assertFalse('test_key' in cache)
+        self.assertEqual({'hits': 1, 'misses': 2, 'hit_ratio': 1.0 / 3, 'items': 0}, cache.stats())
+
+    def testExpire(self):
+        cache = NegativeCache(ttl=1)
+        with mock.patch('time.monotonic', return_value=100):
+            cache.add('test_key')
+        with mock.patch('time.monotonic', return_value=100.5):
+            self.assertTrue('test_key' in cache)
+        with mock.patch('time.monotonic', return_value=101.5):
+            self.assertFalse('test_key' in cache)
+        self.assertEqual(0, len(cache))
+
+    def testBounded(self):
+        cache = NegativeCache(max_items=2)
+        cache.add('a')
+        cache.add('b')
+        cache.add('c')
+        self.assertEqual(2, len(cache))
+        self.assertFalse('a' in cache)
+        self.assertTrue('c' in cache)
+
+
+class ClientNegativeCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.server = '{}:11211'.format(os.environ['MEMCACHED_HOST'])
+        self.negative_cache = NegativeCache()
+        self.client = bmemcached.Client(self.server, negative_cache=self.negative_cache)
+        self.reset()
+
+    def tearDown(self):
+        self.reset()
+        self.client.disconnect_all()
+
+    def reset(self):
+        self.client.delete_multi(['test_key', 'test_key2'])
+
+    def testRepeatedMissesStayLocal(self):
+        self.assertEqual(None, self.client.get('test_key'))
+        with mock.patch.object(bmemcached.protocol.Protocol, 'get') as mocked_get:
+            self.assertEqual('default', self.client.get('test_key', 'default'))
+            mocked_get.assert_not_called()
+
+    def testLocalWritesInvalidate(self):
+        self.client.get('test_key')
+        self.client.set('test_key', 'value')
+        self.assertEqual('value', self.client.get('test_key'))
+
+    def testWriteDuringReadIsNotHidden(self):
+        get = self.client._get
+
+        def get_then_write(key, get_cas=False):
+            result = get(key, get_cas)
+            self.client.set('test_key', 'new')
+            return result
+
+        with mock.patch.object(self.client, '_get', side_effect=get_then_write):
+            self.assertEqual(None, self.client.get('test_key'))
+        self.assertEqual('new', self.client.get('test_key'))
+
+    def testWriteDuringGetMultiIsNotHidden(self):
+        get_multi = self.client._get_multi
+
+        def get_multi_then_write(keys, get_cas=False):
+            result = get_multi(keys, get_cas)
+            self.client.set('test_key', 'new')
+            return result
+
+        with mock.patch.object(self.client, '_get_multi', side_effect=get_multi_then_write):
+            self.assertEqual({}, self.client.get_multi(['test_key']))
+        self.assertEqual({'test_key': 'new'}, self.client.get_multi(['test_key']))
+
+    def testGetMulti(self):
+        self.client.set('test_key2', 'value2')
+        self.assertEqual({'test_key2': 'value2'}, self.client.get_multi(['test_key', 'test_key2']))
+        self.assertTrue('test_key' in self.negative_cache)
+        with mock.patch.object(bmemcached.protocol.Protocol, 'get_multi',
+                               return_value={'test_key2': ('value2', 1)}) as mocked_get_multi:
+            self.assertEqual({'test_key2': 'value2'}, self.client.get_multi(['test_key', 'test_key2']))
+            mocked_get_multi.assert_called_once_with(['test_key2'])
+
+    def testWriteGenerationOnlyTakenForFills(self):
+        self.client.get('test_key')
+        generation = self.client._write_generation
+        with mock.patch.object(self.client, '_write_generation', side_effect=generation) as mocked:
+            self.client.get_multi(['test_key', 'test_key2'], get_cas=True)
+            self.client.get('test_key2', get_cas=True)
+            mocked.assert_not_called()
+            # test_key is answered by the negative cache.
+            self.client.get_multi(['test_key', 'test_key2'])
+            self.assertTrue(mock.call('test_key2') in mocked.call_args_list)
+            self.assertFalse(mock.call('test_key') in mocked.call_args_list)
+        self.assertTrue('test_key2' in self.negative_cache)
+
+    def testGetCasGoesToServer(self):
+        self.client.get('test_key')
+        bmemcached.Client(self.server).set('test_key', 'value')
+        self.assertEqual(None, self.client.get('test_key'))
+        self.assertEqual('value', self.client.gets('test_key')[0])
+
+
+class DistributedClientNegativeCacheTests(ClientNegativeCacheTests):
+    def setUp(self):
+        self.server = '{}:11211'.format(os.environ['MEMCACHED_HOST'])
+        self.negative_cache = NegativeCache()
+        self.client = bmemcached.DistributedClient([self.server], negative_cache=self.negative_cache)
+        self.reset()
@@ -66,3 +66,64 @@ class PicklerTests(unittest.TestCase):
     def testJsonVsPickle(self):
         self.json_client.set('test_key', self.data)
         self.assertRaises(pickle.UnpicklingError, self.pickle_client.get, 'test_key')
+
+
+class BlobHolder(object):
+    def __init__(self, name, blob, scratch):
+        self.name = name
+        self.blob = blob
+        self.scratch = scratch
+
+
+class OutOfBandPicklerTests(unittest.TestCase):
+    def setUp(self):
+        self.server = '{}:11211'.format(os.environ['MEMCACHED_HOST'])
+        self.client = bmemcached.Client(self.server, 'user', 'password', pickle_protocol=5,
+                                        out_of_band_pickling=True)
+        self.protocol = list(self.client.servers)[0]
+
+    def tearDown(self):
+        self.client.delete('test_key')
+        self.client.disconnect_all()
+
+    def testLargeBuffersAreOutOfBand(self):
+        holder = BlobHolder('report', os.urandom(64 * 1024), bytearray(os.urandom(8192)))
+        flags, value = self.protocol.serialize(holder, compress_level=0)
+        self.assertTrue(flags & self.protocol.FLAGS['object'])
+        self.assertTrue(flags & self.protocol.FLAGS['out_of_band'])
+        self.assertTrue(value.endswith(holder.blob + bytes(holder.scratch)))
+
+        unpickled = self.protocol.deserialize(value, flags)
+        self.assertEqual(holder.name, unpickled.name)
+        self.assertEqual(bytes, type(unpickled.blob))
+        self.assertEqual(holder.blob, unpickled.blob)
+        self.assertEqual(bytearray, type(unpickled.scratch))
+        self.assertEqual(holder.scratch, unpickled.scratch)
+
+    def testSmallObjectsStayInBand(self):
+        flags, value = self.protocol.serialize({'a': b'b'})
+        self.assertFalse(flags & self.protocol.FLAGS['out_of_band'])
+        self.assertEqual({'a': b'b'}, pickle.loads(value))
+
+        rows = [{'id': i, 'name': 'row{}'.format(i)} for i in range(1000)]
+        self.assertEqual((self.protocol.FLAGS['object'], pickle.dumps(rows, 5)),
+                         self.protocol.serialize(rows, compress_level=0))
+
+    def testOffByDefault(self):
+        holder = BlobHolder('report', os.urandom(64 * 1024), bytearray(os.urandom(8192)))
+        for protocol in (-1, 5):
+            client = bmemcached.Client(self.server, pickle_protocol=protocol)
+            flags, value = list(client.servers)[0].serialize(holder, compress_level=0)
+            self.assertEqual(self.protocol.FLAGS['object'], flags)
+            self.assertEqual(pickle.dumps(holder, protocol), value)
+
+    def testNeedsProtocol5(self):
+        self.assertRaises(ValueError, bmemcached.Client, self.server, pickle_protocol=4, out_of_band_pickling=True)
+        self.assertRaises(ValueError, bmemcached.DistributedClient, [self.server], out_of_band_pickling=True)
+
+    def testRoundTrip(self):
+        holder = BlobHolder('report', b'x' * (256 * 1024), bytearray(b'y' * 8192))
+        self.assertTrue(self.client.set('test_key', holder))
+        unpickled = self.client.get('test_key')
+        self.assertEqual(holder.blob, unpickled.blob)
+        self.assertEqual(holder.scratch, unpickled.scratch)
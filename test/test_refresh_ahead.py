@@ -0,0 +1,104 @@
+import os
+import time
+import unittest
+
+import six
+
+import bmemcached
+from bmemcached.client.refresh_ahead import RefreshAhead
+
+if six.PY3:
+    from unittest import mock
+else:
+    import mock
+
+
+class RefreshAheadTests(unittest.TestCase):
+    def setUp(self):
+        self.server = '{}:11211'.format(os.environ['MEMCACHED_HOST'])
+        self.client = bmemcached.Client(self.server)
+        self.reset()
+
+    def tearDown(self):
+        self.reset()
+        self.client.disconnect_all()
+
+    def reset(self):
+        self.client.delete_multi(['test_key', 'test_key2'])
+
+    def testRefreshStoresRegisteredKeys(self):
+        refresher = RefreshAhead(self.client)
+        refresher.register('test_key', lambda: 'value', 60)
+        refresher.register('test_key2', lambda: 'value2', 60)
+        self.assertEqual(2, refresher.refresh())
+        self.assertEqual({'test_key': 'value', 'test_key2': 'value2'},
+                         self.client.get_multi(['test_key', 'test_key2']))
+        self.assertEqual(2, refresher.stats()['refreshes'])
+
+    def testKeysAreNotRefreshedBeforeDue(self):
+        refresher = RefreshAhead(self.client, refresh_ratio=0.5)
+        refresher.register('test_key', lambda: 'value', 60)
+        self.assertEqual(1, refresher.refresh())
+        self.assertEqual(0, refresher.refresh())
+
+    def testBatchesPerTTL(self):
+        refresher = RefreshAhead(self.client)
+        refresher.register('test_key', lambda: 'value', 60)
+        refresher.register('test_key2', lambda: 'value2', 120)
+        with mock.patch.object(self.client, 'set_multi', return_value=[]) as set_multi:
+            refresher.refresh()
+        self.assertEqual(2, set_multi.call_count)
+        self.assertEqual(set([60, 120]), set(call[0][1] for call in set_multi.call_args_list))
+
+    def testFailuresAreRetried(self):
+        calls = []
+
+        def loader():
+            calls.append(1)
+            if len(calls) == 1:
+                raise ValueError()
+            return 'value'
+
+        refresher = RefreshAhead(self.client, interval=0.05)
+        refresher.register('test_key', loader, 60)
+        self.assertEqual(0, refresher.refresh())
+        self.assertEqual(1, refresher.stats()['failures'])
+        self.assertEqual(0, refresher.refresh())
+        time.sleep(0.1)
+        self.assertEqual(1, refresher.refresh())
+        self.assertEqual('value', self.client.get('test_key'))
+        self.assertTrue(refresher.stats()['last_lag'] >= 0.1)
+
+    def testBackgroundThread(self):
+        refresher = RefreshAhead(self.client, interval=0.05)
+        refresher.start()
+        try:
+            refresher.register('test_key', lambda: 'value', 60)
+            for _ in range(100):
+                if self.client.get('test_key') is not None:
+                    break
+                time.sleep(0.01)
+        finally:
+            refresher.stop()
+        self.assertEqual('value', self.client.get('test_key'))
+
+    def testInvalidRatio(self):
+        self.assertRaises(ValueError, RefreshAhead, self.client, refresh_ratio=1)
+
+
+class DistributedRefreshAheadTests(RefreshAheadTests):
+    def setUp(self):
+        self.server = '{}:11211'.format(os.environ['MEMCACHED_HOST'])
+        self.client = bmemcached.DistributedClient(
+            [self.server, '{}:5000'.format(os.environ['MEMCACHED_HOST'])])
+        self.reset()
+
+    def testBatchesPerServer(self):
+        refresher = RefreshAhead(self.client)
+        keys = ['test_key', 'test_key2']
+        for key in keys:
+            refresher.register(key, lambda: 'value', 60)
+        servers = set(self.client._get_server(key) for key in keys)
+        with mock.patch.object(self.client, 'set_multi', return_value=[]) as set_multi:
+            refresher.refresh()
+        self.assertEqual(len(servers), set_multi.call_count)
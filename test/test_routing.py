@@ -0,0 +1,225 @@
+from collections import Counter
+from hashlib import md5
+import os
+import struct
+import unittest
+
+import bmemcached
+from bmemcached.client.routing import HashRing, JumpHash, KetamaRing, RendezvousHash
+
+SERVERS = ['10.0.0.{}:11211'.format(i) for i in range(1, 6)]
+
+
+class RoutingTableTests(object):
+    """
+    Tests shared by every hasher, mixed into a TestCase per hasher.
+    """
+    hasher = None
+    # HashRing hashes str(key) as uhashring does, the other hashers the key's bytes.
+    bytes_keys_match_text = True
+
+    def setUp(self):
+        self.keys = ['key{}'.format(i) for i in range(1000)]
+
+    def testBytesKeys(self):
+        table = self.hasher(SERVERS)
+        for key in self.keys:
+            expected = key if self.bytes_keys_match_text else str(key.encode())
+            self.assertEqual(table.get_node(expected), table.get_node(key.encode()))
+        bytes_keys = [key.encode() for key in self.keys]
+        for server, keys in table.get_nodes(bytes_keys).items():
+            for key in keys:
+                self.assertEqual(server, table.get_node(key))
+
+    def testSpreadsKeys(self):
+        table = self.hasher(SERVERS)
+        counts = Counter(table.get_node(key) for key in self.keys)
+        self.assertEqual(set(SERVERS), set(counts))
+        self.assertTrue(min(counts.values()) > len(self.keys) / len(SERVERS) / 2)
+
+    def testGetNodes(self):
+        table = self.hasher(SERVERS)
+        grouped = table.get_nodes(self.keys)
+        for server, keys in grouped.items():
+            for key in keys:
+                self.assertEqual(server, table.get_node(key))
+        self.assertEqual(sorted(self.keys), sorted(key for keys in grouped.values() for key in keys))
+
+    def testGetNodesWithKeyFunction(self):
+        table = self.hasher(SERVERS)
+        grouped = table.get_nodes([('key1', 10)], key=lambda item: item[0])
+        self.assertEqual({table.get_node('key1'): [('key1', 10)]}, dict(grouped))
+
+    def testMemoizedRoutes(self):
+        table = self.hasher(SERVERS)
+        memoized = self.hasher(SERVERS, cache_size=10)
+        for key in self.keys:
+            self.assertEqual(table.get_node(key), memoized.get_node(key))
+        self.assertEqual(10, len(memoized._cache))
+        self.assertEqual(dict(table.get_nodes(self.keys)), dict(memoized.get_nodes(self.keys)))
+
+    def testRange(self):
+        table = self.hasher(SERVERS)
+        for key in self.keys[:100]:
+            nodes = table.range(key, 3)
+            self.assertEqual(3, len(set(nodes)))
+            self.assertEqual(table.get_node(key), nodes[0])
+        self.assertEqual(len(SERVERS), len(table.range('key', 10)))
+
+    def testEmpty(self):
+        table = self.hasher([])
+        self.assertEqual(None, table.get_node('key'))
+        self.assertEqual({}, table.get_nodes(['key']))
+        self.assertEqual([], table.range('key', 2))
+
+
+class HashRingTests(RoutingTableTests, unittest.TestCase):
+    hasher = HashRing
+    bytes_keys_match_text = False
+
+    def testMatchesUHashRing(self):
+        try:
+            from uhashring import HashRing as UHashRing
+        except ImportError:
+            raise unittest.SkipTest('uhashring is not installed')
+        ring = UHashRing(SERVERS)
+        table = HashRing(SERVERS)
+        for key in self.keys + [key.encode() for key in self.keys]:
+            self.assertEqual(ring.get_node(key), table.get_node(key))
+
+
+class KetamaRingTests(RoutingTableTests, unittest.TestCase):
+    hasher = KetamaRing
+    # Servers of libmemcached's ketama distribution for these keys, the same in uhashring's
+    # ketama mode with the servers named as libmemcached names them.
+    VECTORS = {
+        11211: {'apple': 5, 'banana': 1, 'cherry': 3, 'date': 3,
+                'elderberry': 5, 'fig': 3, 'grape': 3, 'honeydew': 2},
+        11212: {'apple': 1, 'banana': 1, 'cherry': 1, 'date': 1,
+                'elderberry': 3, 'fig': 4, 'grape': 2, 'honeydew': 1},
+    }
+
+    def servers(self, port):
+        return ['10.0.0.{}:{}'.format(i, port) for i in range(1, 6)]
+
+    def testKnownVectors(self):
+        for port, vectors in self.VECTORS.items():
+            table = KetamaRing(self.servers(port))
+            for key, server in vectors.items():
+                self.assertEqual('10.0.0.{}:{}'.format(server, port), table.get_node(key))
+
+    def testContinuum(self):
+        # Each server gets 40 md5 digests of "host-i", or "host:port-i" off the default
+        # port, each read as four little-endian points.
+        for port, name in ((11211, '10.0.0.1'), (11212, '10.0.0.1:11212')):
+            table = KetamaRing(self.servers(port))
+            points = set()
+            for i in range(40):
+                digest = md5('{}-{}'.format(name, i).encode()).digest()
+                points.update(struct.unpack('<4L', digest))
+            owned = set(point for point, node in zip(table._keys, table._ring_nodes)
+                        if node == '10.0.0.1:{}'.format(port))
+            self.assertEqual(points, owned)
+            self.assertEqual(800, len(table._keys))
+
+    def testMatchesUHashRing(self):
+        try:
+            from uhashring import HashRing as UHashRing
+        except ImportError:
+            raise unittest.SkipTest('uhashring is not installed')
+        for port in (11211, 11212):
+            servers = self.servers(port)
+            # uhashring names ketama points after the whole node name, which libmemcached
+            # does for servers off the default port only.
+            names = [server.rsplit(':', 1)[0] if port == 11211 else server for server in servers]
+            ring = UHashRing(names, hash_fn='ketama')
+            table = KetamaRing(servers)
+            for key in self.keys:
+                self.assertEqual(servers[names.index(ring.get_node(key))], table.get_node(key))
+
+    def testDefaultPortIsOmitted(self):
+        table = KetamaRing([])
+        self.assertEqual('10.0.0.1', table._name('10.0.0.1:11211'))
+        self.assertEqual('10.0.0.1:11212', table._name('10.0.0.1:11212'))
+        self.assertEqual('/tmp/memcached.sock', table._name('/tmp/memcached.sock'))
+
+
+class JumpHashTests(RoutingTableTests, unittest.TestCase):
+    hasher = JumpHash
+
+    def testAppendingMovesFewKeys(self):
+        before = JumpHash(SERVERS)
+        after = JumpHash(SERVERS + ['10.0.0.6:11211'])
+        moved = [key for key in self.keys if before.get_node(key) != after.get_node(key)]
+        self.assertTrue(all(after.get_node(key) == '10.0.0.6:11211' for key in moved))
+
+
+class RendezvousHashTests(RoutingTableTests, unittest.TestCase):
+    hasher = RendezvousHash
+
+    def testRemovingMovesOnlyItsKeys(self):
+        before = RendezvousHash(SERVERS)
+        after = RendezvousHash(SERVERS[:2] + SERVERS[3:])
+        for key in self.keys:
+            if before.get_node(key) != SERVERS[2]:
+                self.assertEqual(before.get_node(key), after.get_node(key))
+            else:
+                self.assertEqual(before.range(key, 2)[1], after.get_node(key))
+
+
+class DistributedClientHasherTests(unittest.TestCase):
+    def testHasherByName(self):
+        servers = ['{}:11211'.format(os.environ['MEMCACHED_HOST']), '{}:5000'.format(os.environ['MEMCACHED_HOST'])]
+        for name in ('hashring', 'ketama', 'jump', 'rendezvous', KetamaRing):
+            client = bmemcached.DistributedClient(servers, hasher=name)
+            client.set_multi({'test_key': 'value', 'test_key2': 'value2'})
+            self.assertEqual({'test_key': 'value', 'test_key2': 'value2'},
+                             client.get_multi(['test_key', 'test_key2']))
+            client.delete_multi(['test_key', 'test_key2'])
+            client.disconnect_all()
+
+    def testUnknownHasher(self):
+        self.assertRaises(ValueError, bmemcached.DistributedClient, hasher='modulo')
+
+
+class Node(object):
+    def __init__(self, name, weight=1):
+        self.name = name
+        self.weight = weight
+
+    def __str__(self):
+        return self.name
+
+
+class WeightTests(unittest.TestCase):
+    def setUp(self):
+        self.keys = ['key{}'.format(i) for i in range(20000)]
+        self.nodes = [Node('10.0.0.1:11211', 3), Node('10.0.0.2:11211'), Node('10.0.0.3:11211')]
+
+    def testShareFollowsWeight(self):
+        for hasher in (HashRing, KetamaRing, JumpHash, RendezvousHash):
+            table = hasher(self.nodes)
+            counts = Counter(table.get_node(key) for key in self.keys)
+            share = counts[self.nodes[0]] / float(len(self.keys))
+            self.assertAlmostEqual(0.6, share, delta=0.06, msg=hasher.__name__)
+            self.assertEqual(3, len(table.range('key', 3)), msg=hasher.__name__)
+
+    def testEqualWeightsKeepPlacement(self):
+        unweighted = [Node(str(node)) for node in self.nodes]
+        for hasher in (HashRing, KetamaRing, JumpHash, RendezvousHash):
+            table = hasher(unweighted)
+            names = hasher([str(node) for node in unweighted])
+            self.assertEqual([str(names.get_node(key)) for key in self.keys[:1000]],
+                             [str(table.get_node(key)) for key in self.keys[:1000]])
+
+    def testClientWeights(self):
+        host = os.environ['MEMCACHED_HOST']
+        client = bmemcached.DistributedClient({'{}:11211'.format(host): 3, '{}:5000'.format(host): 1})
+        self.assertEqual([3, 1], [server.weight for server in client.servers])
+        client = bmemcached.DistributedClient([('{}:11211'.format(host), 2), '{}:5000'.format(host)])
+        self.assertEqual([2, 1], [server.weight for server in client.servers])
+        counts = Counter(client._get_server(key).server for key in self.keys[:2000])
+        self.assertTrue(counts['{}:11211'.format(host)] > counts['{}:5000'.format(host)])
+
+    def testInvalidWeight(self):
+        self.assertRaises(ValueError, bmemcached.DistributedClient, [('127.0.0.1:11211', 0)])
@@ -101,3 +101,61 @@ class TestServerParsing(unittest.TestCase):
         Raise assertion if the server list is empty.
         """
         self.assertRaises(AssertionError, bmemcached.Client, [])
+
+
+class ServerUpdateTests(unittest.TestCase):
+    def setUp(self):
+        self.first = '{}:11211'.format(os.environ['MEMCACHED_HOST'])
+        self.second = '{}:5000'.format(os.environ['MEMCACHED_HOST'])
+        self.client = bmemcached.DistributedClient([self.first])
+
+    def tearDown(self):
+        self.client.disconnect_all()
+
+    def protocols(self):
+        return dict((server.server, server) for server in self.client.servers)
+
+    def testAddServerKeepsConnections(self):
+        self.client.get('test_key')
+        first = self.protocols()[self.first]
+        self.assertTrue(first.connection is not None)
+
+        self.client.add_server(self.second)
+        self.assertTrue(self.protocols()[self.first] is first)
+        self.assertTrue(first.connection is not None)
+        self.assertEqual(set([self.first, self.second]),
+                         set(self.client._get_server('key{}'.format(i)).server for i in range(100)))
+
+    def testAddServerUpdatesWeightInPlace(self):
+        client = bmemcached.DistributedClient([self.first, self.second], hasher='jump')
+        try:
+            client.add_server(self.first, 2)
+            self.assertEqual([(self.first, 2), (self.second, 1)],
+                             [(server.server, server.weight) for server in client.servers])
+        finally:
+            client.disconnect_all()
+
+    def testRemoveServer(self):
+        self.client.add_server(self.second)
+        second = self.protocols()[self.second]
+        self.client.get_multi(['key{}'.format(i) for i in range(10)])
+        self.client.remove_server(self.second)
+        self.assertEqual([self.first], list(self.protocols()))
+        self.assertEqual(None, second.connection)
+        self.assertEqual(self.first, self.client._get_server('test_key').server)
+        self.assertRaises(ValueError, self.client.remove_server, self.second)
+
+    def testSetServersDiff(self):
+        first = self.protocols()[self.first]
+        self.client.set_servers([self.first, self.second])
+        self.assertTrue(self.protocols()[self.first] is first)
+        self.client.set_servers([(self.first, 2), self.second])
+        self.assertFalse(self.protocols()[self.first] is first)
+        self.assertEqual(2, self.protocols()[self.first].weight)
+
+    def testRingReusesPoints(self):
+        ring = self.client._ring
+        self.client.add_server(self.second)
+        first = self.protocols()[self.first]
+        self.assertTrue(self.client._ring._node_points[first] is ring._node_points[first])
+        self.assertEqual(set([first]), set(ring.nodes))
@@ -0,0 +1,117 @@
+import os
+import threading
+import time
+import unittest
+
+import six
+
+import bmemcached
+from bmemcached.client.single_flight import SingleFlight
+
+if six.PY3:
+    from unittest import mock
+else:
+    import mock
+
+
+def run_threads(target, count):
+    results = []
+    errors = []
+
+    def run():
+        try:
+            results.append(target())
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, errors
+
+
+class SingleFlightTests(unittest.TestCase):
+    def testConcurrentCallsShareOneRequest(self):
+        flight = SingleFlight()
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            time.sleep(0.2)
+            return 'value', 1
+
+        results, errors = run_threads(lambda: flight.do('test_key', fetch), 10)
+        self.assertEqual([], errors)
+        self.assertEqual([('value', 1)] * 10, results)
+        self.assertEqual(1, len(calls))
+        self.assertEqual(9, flight.shared)
+
+    def testErrorsArePropagated(self):
+        flight = SingleFlight()
+
+        def fetch():
+            time.sleep(0.2)
+            raise ValueError()
+
+        results, errors = run_threads(lambda: flight.do('test_key', fetch), 5)
+        self.assertEqual(5, len(errors))
+        self.assertTrue(all(isinstance(e, ValueError) for e in errors))
+
+    def testOverlappingMulti(self):
+        flight = SingleFlight()
+        requested = []
+
+        def fetch(keys):
+            requested.append(sorted(keys))
+            time.sleep(0.2)
+            return dict((key, (key.upper(), 1)) for key in keys if key != 'missing')
+
+        first = threading.Thread(target=flight.do_multi, args=(['a', 'b'], fetch))
+        first.start()
+        time.sleep(0.05)
+        result = flight.do_multi(['b', 'c', 'missing'], fetch)
+        first.join()
+
+        self.assertEqual({'b': ('B', 1), 'c': ('C', 1)}, result)
+        self.assertEqual([['a', 'b'], ['c', 'missing']], requested)
+
+    def testSequentialCallsAreNotShared(self):
+        flight = SingleFlight()
+        self.assertEqual(1, flight.do('test_key', lambda: 1))
+        self.assertEqual(2, flight.do('test_key', lambda: 2))
+
+
+class ClientSingleFlightTests(unittest.TestCase):
+    def setUp(self):
+        self.server = '{}:11211'.format(os.environ['MEMCACHED_HOST'])
+        self.client = bmemcached.Client(self.server, coalesce_reads=True)
+
+    def tearDown(self):
+        self.client.disconnect_all()
+
+    def testConcurrentGets(self):
+        def slow_get(key):
+            time.sleep(0.2)
+            return 'value', 1
+
+        with mock.patch.object(bmemcached.protocol.Protocol, 'get', side_effect=slow_get) as mocked_get:
+            results, errors = run_threads(lambda: self.client.get('test_key'), 10)
+        self.assertEqual(['value'] * 10, results)
+        self.assertEqual(1, mocked_get.call_count)
+
+    def testConcurrentGetMulti(self):
+        def slow_get_multi(keys):
+            time.sleep(0.2)
+            return dict((key, ('value', 1)) for key in keys)
+
+        with mock.patch.object(bmemcached.protocol.Protocol, 'get_multi', side_effect=slow_get_multi) as mocked:
+            results, errors = run_threads(lambda: self.client.get_multi(['test_key', 'test_key2']), 10)
+        self.assertEqual([{'test_key': 'value', 'test_key2': 'value'}] * 10, results)
+        self.assertEqual(1, mocked.call_count)
+
+    def testMiss(self):
+        self.client.delete('test_key')
+        self.assertEqual('default', self.client.get('test_key', 'default'))
+        self.assertEqual({}, self.client.get_multi(['test_key']))
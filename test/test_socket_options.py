@@ -0,0 +1,44 @@
+import os
+import socket
+import unittest
+
+import bmemcached
+
+
+class SocketOptionsTests(unittest.TestCase):
+    def setUp(self):
+        self.server = '{}:11211'.format(os.environ['MEMCACHED_HOST'])
+
+    def connection(self, **kwargs):
+        client = bmemcached.Client([self.server], **kwargs)
+        self.addCleanup(client.disconnect_all)
+        client.get('test_key')
+        return next(client.servers).connection
+
+    def testDefaults(self):
+        connection = self.connection()
+        self.assertTrue(connection.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY))
+        self.assertTrue(connection.getsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE))
+        if hasattr(socket, 'TCP_KEEPIDLE'):
+            self.assertEqual(60, connection.getsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE))
+            self.assertEqual(10, connection.getsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL))
+            self.assertEqual(3, connection.getsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT))
+
+    def testDisabled(self):
+        connection = self.connection(tcp_nodelay=False, tcp_keepalive=None)
+        self.assertFalse(connection.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY))
+        self.assertFalse(connection.getsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE))
+
+    def testBufferSizes(self):
+        default = self.connection().getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+        connection = self.connection(send_buffer_size=default * 2, recv_buffer_size=default * 2)
+        self.assertTrue(connection.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF) >= default * 2)
+        self.assertTrue(connection.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF) >= default * 2)
+
+    def testDistributedClient(self):
+        client = bmemcached.DistributedClient([self.server], tcp_keepalive=(30, 5, 2))
+        client.get('test_key')
+        connection = next(client.servers).connection
+        if hasattr(socket, 'TCP_KEEPIDLE'):
+            self.assertEqual(30, connection.getsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE))
+        client.disconnect_all()
@@ -0,0 +1,90 @@
+import os
+import threading
+import time
+import unittest
+
+import bmemcached
+from bmemcached.envelope import Envelope
+
+
+class StaleWhileRevalidateTests(unittest.TestCase):
+    def setUp(self):
+        self.server = '{}:11211'.format(os.environ['MEMCACHED_HOST'])
+        self.client = bmemcached.Client(self.server)
+        self.reset()
+
+    def tearDown(self):
+        self.reset()
+        self.client.disconnect_all()
+
+    def reset(self):
+        self.client.delete_multi(['test_key', 'test_key:lease'])
+
+    def wait_for_refresh(self):
+        if self.client._refresh_executor is not None:
+            self.client._refresh_executor.shutdown(wait=True)
+
+    def testComputesOnMiss(self):
+        self.assertEqual('value', self.client.get_swr('test_key', lambda: 'value', 10, 60))
+        envelope = self.client._fetch('test_key', envelopes=True)[0]
+        self.assertTrue(isinstance(envelope, Envelope))
+        self.assertAlmostEqual(time.time() + 10, envelope.expires_at, delta=5)
+        self.assertEqual(None, self.client._refresh_executor)
+
+    def testFreshValueIsReturned(self):
+        self.client.set('test_key', Envelope('cached', time.time() + 3600))
+        self.assertEqual('cached', self.client.get_swr('test_key', lambda: self.fail('computed'), 10, 60))
+        self.assertEqual(None, self.client._refresh_executor)
+
+    def testStaleValueIsReturnedAndRefreshed(self):
+        self.client.set('test_key', Envelope('stale', time.time() - 1))
+        self.assertEqual('stale', self.client.get_swr('test_key', lambda: 'fresh', 10, 60))
+        self.wait_for_refresh()
+        self.assertEqual('fresh', self.client.get('test_key'))
+        self.assertEqual(None, self.client.get('test_key:lease'))
+
+    def testSingleRefreshPerKey(self):
+        calls = []
+        started = threading.Event()
+        release = threading.Event()
+
+        def compute():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return 'fresh'
+
+        self.client.set('test_key', Envelope('stale', time.time() - 1))
+        self.assertEqual('stale', self.client.get_swr('test_key', compute, 10, 60))
+        started.wait(5)
+        for _ in range(5):
+            self.assertEqual('stale', self.client.get_swr('test_key', compute, 10, 60))
+        release.set()
+        self.wait_for_refresh()
+        self.assertEqual(1, len(calls))
+
+    def testLeaseHeldElsewhereSkipsRefresh(self):
+        self.client.add('test_key:lease', 1, 30)
+        self.client.set('test_key', Envelope('stale', time.time() - 1))
+        self.assertEqual('stale', self.client.get_swr('test_key', lambda: self.fail('computed'), 10, 60))
+        self.wait_for_refresh()
+        self.assertEqual('stale', self.client.get('test_key'))
+
+    def testRefreshErrorsKeepStaleValue(self):
+        def compute():
+            raise ValueError()
+
+        self.client.set('test_key', Envelope('stale', time.time() - 1))
+        self.assertEqual('stale', self.client.get_swr('test_key', compute, 10, 60))
+        self.wait_for_refresh()
+        self.assertEqual('stale', self.client.get('test_key'))
+        self.assertEqual(None, self.client.get('test_key:lease'))
+        self.assertEqual(set(), self.client._refreshing)
+
+
+class DistributedStaleWhileRevalidateTests(StaleWhileRevalidateTests):
+    def setUp(self):
+        self.server = '{}:11211'.format(os.environ['MEMCACHED_HOST'])
+        self.client = bmemcached.DistributedClient(
+            [self.server, '{}:5000'.format(os.environ['MEMCACHED_HOST'])])
+        self.reset()
@@ -0,0 +1,93 @@
+import socket
+import ssl
+import struct
+import threading
+import unittest
+
+try:
+    import trustme
+except ImportError:
+    trustme = None
+
+from bmemcached.circuit_breaker import CircuitBreaker
+from bmemcached.protocol import Protocol
+from bmemcached.tls import TLSSessionCache
+
+
+class _NoopServer(threading.Thread):
+    """
+    TLS server answering every request header with an empty success response.
+    """
+    def __init__(self, context):
+        super(_NoopServer, self).__init__()
+        self.daemon = True
+        self.context = context
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(5)
+        self.port = self.sock.getsockname()[1]
+
+    def run(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except socket.error:
+                return
+            try:
+                with self.context.wrap_socket(conn, server_side=True) as tls:
+                    while True:
+                        header = tls.recv(Protocol.HEADER_SIZE)
+                        if not header:
+                            break
+                        opcode = struct.unpack(Protocol.HEADER_STRUCT, header)[1]
+                        tls.sendall(struct.pack(Protocol.HEADER_STRUCT, Protocol.MAGIC['response'], opcode,
+                                                0, 0, 0, 0, 0, 0, 0))
+            except (socket.error, ssl.SSLError):
+                pass
+
+    def close(self):
+        self.sock.close()
+
+
+@unittest.skipIf(trustme is None, 'trustme is not installed')
+class TLSSessionTests(unittest.TestCase):
+    def setUp(self):
+        ca = trustme.CA()
+        server_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        ca.issue_cert(u'127.0.0.1').configure_cert(server_context)
+        self.server = _NoopServer(server_context)
+        self.server.start()
+
+        self.context = ssl.create_default_context()
+        ca.configure_trust(self.context)
+        self.sessions = TLSSessionCache()
+        self.protocol = Protocol('127.0.0.1:{}'.format(self.server.port), tls_context=self.context,
+                                 tls_sessions=self.sessions, breaker=CircuitBreaker())
+
+    def tearDown(self):
+        self.protocol.disconnect()
+        self.server.close()
+
+    def testSessionIsResumed(self):
+        self.assertEqual(Protocol.STATUS['success'], self.protocol.noop())
+        self.assertFalse(self.protocol.connection.session_reused)
+        self.protocol.disconnect()
+
+        self.assertEqual(Protocol.STATUS['success'], self.protocol.noop())
+        self.assertTrue(self.protocol.connection.session_reused)
+        self.assertEqual({'resumed': 1, 'full_handshakes': 1, 'resumption_rate': 0.5}, self.sessions.stats())
+
+    def testForget(self):
+        self.protocol.noop()
+        self.protocol.disconnect()
+        self.sessions.forget(self.protocol.server)
+        self.protocol.noop()
+        self.assertFalse(self.protocol.connection.session_reused)
+        self.assertEqual(2, self.sessions.full_handshakes)
+
+    def testWithoutCache(self):
+        protocol = Protocol(self.protocol.server, tls_context=self.context, breaker=CircuitBreaker())
+        for _ in range(2):
+            self.assertEqual(Protocol.STATUS['success'], protocol.noop())
+            self.assertFalse(protocol.connection.session_reused)
+            protocol.disconnect()
@@ -0,0 +1,80 @@
+import os
+import socket
+import threading
+import time
+import unittest
+
+import six
+
+import bmemcached
+
+if six.PY3:
+    from unittest import mock
+else:
+    import mock
+
+# Nothing listens on port 1, so connections are refused right away.
+DEAD_SERVER = '127.0.0.1:1'
+
+
+class WarmupTests(unittest.TestCase):
+    client_class = bmemcached.Client
+
+    def setUp(self):
+        self.server = '{}:11211'.format(os.environ['MEMCACHED_HOST'])
+        self.client = self.client_class([self.server, DEAD_SERVER])
+
+    def tearDown(self):
+        self.client.disconnect_all()
+
+    def protocol(self, server):
+        return [protocol for protocol in self.client.servers if protocol.server == server][0]
+
+    def testWarmup(self):
+        self.assertEqual([DEAD_SERVER], self.client.warmup())
+        live = self.protocol(self.server)
+        self.assertTrue(live.connection is not None)
+        self.assertTrue(self.protocol(DEAD_SERVER).connection is None)
+
+        connection = live.connection
+        self.assertTrue(self.client.set('test_key', 'value'))
+        self.assertEqual('value', self.client.get('test_key'))
+        self.assertTrue(live.connection is connection)
+
+    def testConnectionsArePerThread(self):
+        self.client.warmup()
+        connections = []
+        thread = threading.Thread(target=lambda: connections.append(self.protocol(self.server).connection))
+        thread.start()
+        thread.join()
+        self.assertEqual([None], connections)
+
+    def testOpenConnectionsAreKept(self):
+        self.client.get('test_key')
+        connection = self.protocol(self.server).connection
+        self.client.warmup()
+        self.assertTrue(self.protocol(self.server).connection is connection)
+
+    def testTimeout(self):
+        create_connection = socket.create_connection
+
+        def slow_connect(*args, **kwargs):
+            time.sleep(0.2)
+            return create_connection(*args, **kwargs)
+
+        client = self.client_class([self.server])
+        with mock.patch('socket.create_connection', side_effect=slow_connect):
+            start = time.monotonic()
+            self.assertEqual([self.server], client.warmup(timeout=0.05))
+            self.assertTrue(time.monotonic() - start < 0.2)
+            self.assertTrue(next(client.servers).connection is None)
+            time.sleep(0.3)
+
+    def testPreconnect(self):
+        client = self.client_class([self.server], preconnect=True)
+        self.assertTrue(next(client.servers).connection is not None)
+        client.disconnect_all()
+
+
+class DistributedWarmupTests(WarmupTests):
+    client_class = bmemcached.DistributedClient